@@ -1,9 +1,41 @@
 import customtkinter as ctk
+import tkinter
 from tkinter import messagebox
 import os
+import sys
+import struct
 import json
+import csv
+import gc
+import shutil
+import time
+import math
+import hmac
+import re
+import hashlib
+import secrets
+import bisect
+import zlib
+import heapq
+import asyncio
+import threading
+import argparse
+import functools
+import cProfile
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-import random
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
 
 # --- Configurações Visuais ---
 ctk.set_appearance_mode("Light")
@@ -20,7 +52,243 @@ class Cores:
     VERDE_SUCESSO = "#2ECC71"
     VERMELHO_ERRO = "#E74C3C"
 
+# --- Métricas e Perfilamento ---
+class Histograma:
+    # Latências em baldes fixos (segundos, cumulativos no formato Prometheus)
+    LIMITES = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+               0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    __slots__ = ("baldes", "soma", "total")
+
+    def __init__(self):
+        self.baldes = [0] * (len(self.LIMITES) + 1)  # último = acima do maior limite
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, segundos):
+        self.baldes[bisect.bisect_left(self.LIMITES, segundos)] += 1
+        self.soma += segundos
+        self.total += 1
+
+    def quantil(self, q):
+        # Aproximado: limite superior do balde onde o quantil cai; None se cair acima do
+        # maior limite (infinito não é JSON válido)
+        alvo, acumulado = q * self.total, 0
+        for limite, n in zip(self.LIMITES + (None,), self.baldes):
+            acumulado += n
+            if acumulado >= alvo and acumulado: return limite
+        return 0.0
+
+class Metricas:
+    # Instrumentação do processo: histogramas de latência por operação e contadores
+    # (bytes lidos/escritos por arquivo). Desligada por padrão; liga com
+    # BANKPY_METRICAS=1 ou Metricas.ligar(). Desligada, cada ponto instrumentado custa
+    # só a leitura de Metricas.ativo. Chaves: (nome, rótulos ordenados).
+    ativo = os.environ.get("BANKPY_METRICAS", "") not in ("", "0")
+    _trava = threading.Lock()
+    _histogramas = {}
+    _contadores = {}
+
+    @staticmethod
+    def ligar():
+        Metricas.ativo = True
+
+    @staticmethod
+    def desligar():
+        Metricas.ativo = False
+
+    @staticmethod
+    def zerar():
+        with Metricas._trava:
+            Metricas._histogramas, Metricas._contadores = {}, {}
+
+    @staticmethod
+    def observar(nome, segundos, **rotulos):
+        Metricas._observar((nome, tuple(sorted(rotulos.items()))), segundos)
+
+    @staticmethod
+    def _observar(chave, segundos):
+        with Metricas._trava:
+            h = Metricas._histogramas.get(chave)
+            if h is None: h = Metricas._histogramas[chave] = Histograma()
+            h.observar(segundos)
+
+    @staticmethod
+    def contar(nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with Metricas._trava:
+            Metricas._contadores[chave] = Metricas._contadores.get(chave, 0) + valor
+
+    @staticmethod
+    def instrumentar(nome, **rotulos):
+        # Decorador: latência de cada chamada vai para o histograma nome{rotulos}
+        chave = (nome, tuple(sorted(rotulos.items())))
+
+        def decorador(funcao):
+            @functools.wraps(funcao)
+            def medida(*args, **kwargs):
+                if not Metricas.ativo: return funcao(*args, **kwargs)
+                inicio = time.perf_counter()
+                try:
+                    return funcao(*args, **kwargs)
+                finally:
+                    Metricas._observar(chave, time.perf_counter() - inicio)
+            return medida
+        return decorador
+
+    @staticmethod
+    def como_json(medidores=()):
+        # medidores: [(nome, rótulos, valor)] lidos na hora (contas, tamanho de arquivos...)
+        with Metricas._trava:
+            histogramas = [(n, r, h.total, h.soma, h.quantil(0.5), h.quantil(0.99)) for (n, r), h in Metricas._histogramas.items()]
+            contadores = list(Metricas._contadores.items())
+        return {
+            "histogramas": [{"nome": n, "rotulos": dict(r), "total": t, "soma_s": s, "p50_s": p50, "p99_s": p99}
+                            for n, r, t, s, p50, p99 in histogramas],
+            "contadores": [{"nome": n, "rotulos": dict(r), "valor": v} for (n, r), v in contadores],
+            "medidores": [{"nome": n, "rotulos": r, "valor": v} for n, r, v in medidores]
+        }
+
+    @staticmethod
+    def como_prometheus(medidores=()):
+        # Formato texto 0.0.4 (scrape local do /metricas do modo servidor)
+        def rotulos(pares, extra=()):
+            pares = list(pares) + list(extra)
+            if not pares: return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}"
+        with Metricas._trava:
+            histogramas = [(n, r, list(h.baldes), h.soma, h.total) for (n, r), h in sorted(Metricas._histogramas.items())]
+            contadores = sorted(Metricas._contadores.items())
+        linhas, tipos = [], set()
+        for nome, r, baldes, soma, total in histogramas:
+            nome = f"bankpy_{nome}_segundos"
+            if nome not in tipos:
+                tipos.add(nome)
+                linhas.append(f"# TYPE {nome} histogram")
+            acumulado = 0
+            for limite, n in zip(Histograma.LIMITES + ("+Inf",), baldes):
+                acumulado += n
+                linhas.append(f"{nome}_bucket{rotulos(r, [('le', limite)])} {acumulado}")
+            linhas.append(f"{nome}_sum{rotulos(r)} {soma}")
+            linhas.append(f"{nome}_count{rotulos(r)} {total}")
+        for (nome, r), valor in contadores:
+            nome = f"bankpy_{nome}_total"
+            if nome not in tipos:
+                tipos.add(nome)
+                linhas.append(f"# TYPE {nome} counter")
+            linhas.append(f"{nome}{rotulos(r)} {valor}")
+        for nome, r, valor in medidores:
+            nome = f"bankpy_{nome}"
+            if nome not in tipos:
+                tipos.add(nome)
+                linhas.append(f"# TYPE {nome} gauge")
+            linhas.append(f"{nome}{rotulos(sorted(r.items()))} {valor}")
+        return "\n".join(linhas) + "\n"
+
+class Perfilador:
+    # Perfil opcional do processo, ligado por variável de ambiente:
+    #   BANKPY_PERFIL=cprofile   -> cProfile da thread principal (Tk ou laço do servidor),
+    #                               salvo em bankpy.prof (pstats, snakeviz)
+    #   BANKPY_PERFIL=amostragem -> amostra a pilha de todas as threads a cada
+    #                               BANKPY_PERFIL_INTERVALO s (padrão 0.005) e salva pilhas
+    #                               colapsadas em bankpy_amostras.txt (flamegraph, speedscope)
+    #   BANKPY_PERFIL_ARQUIVO troca o arquivo de saída
+    def __init__(self, modo, arquivo=None, intervalo=0.005):
+        if modo not in ("cprofile", "amostragem"): raise ValueError(f"Modo de perfil inválido: {modo}")
+        self.modo = modo
+        self.arquivo = arquivo or ("bankpy.prof" if modo == "cprofile" else "bankpy_amostras.txt")
+        self.intervalo = intervalo
+        self._perfil = None
+        self._amostras = {}
+        self._parar = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def do_ambiente():
+        modo = os.environ.get("BANKPY_PERFIL")
+        if not modo: return None
+        perfil = Perfilador(modo, os.environ.get("BANKPY_PERFIL_ARQUIVO"), float(os.environ.get("BANKPY_PERFIL_INTERVALO", 0.005)))
+        perfil.iniciar()
+        return perfil
+
+    def iniciar(self):
+        if self.modo == "cprofile":
+            self._perfil = cProfile.Profile()
+            self._perfil.enable()
+        else:
+            self._thread = threading.Thread(target=self._amostrar, daemon=True)
+            self._thread.start()
+
+    def _amostrar(self):
+        propria = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            for ident, quadro in sys._current_frames().items():
+                if ident == propria: continue
+                # Pilha colapsada, raiz primeiro
+                quadros = [q for q, _ in traceback.walk_stack(quadro)]
+                pilha = ";".join(f"{q.f_code.co_name} ({os.path.basename(q.f_code.co_filename)}:{q.f_code.co_firstlineno})"
+                                 for q in reversed(quadros))
+                self._amostras[pilha] = self._amostras.get(pilha, 0) + 1
+
+    def parar(self):
+        # Grava o resultado; devolve o caminho do arquivo
+        if self._perfil:
+            self._perfil.disable()
+            self._perfil.dump_stats(self.arquivo)
+        if self._thread:
+            self._parar.set()
+            self._thread.join()
+            with open(self.arquivo, "w", encoding='utf-8') as f:
+                for pilha, n in sorted(self._amostras.items(), key=lambda i: -i[1]): f.write(f"{pilha} {n}\n")
+        return self.arquivo
+
 # --- Simulação de API e Backend ---
+class MotorPrecos:
+    # Simulação vetorizada de preços: movimento browniano geométrico com estado
+    # persistente por ticker. Um tick avança todos os tickers de uma vez.
+    # drift e volatilidade são anuais (escalar ou um valor por ticker); dt em anos.
+    # correlacao: escalar (modelo de um fator, O(n)) ou matriz n x n (Cholesky).
+    def __init__(self, precos_iniciais, drift=0.05, volatilidade=0.20, correlacao=None, dt=1/252, seed=None):
+        self.tickers = list(precos_iniciais)
+        self.indice = {t: i for i, t in enumerate(self.tickers)}
+        self.abertura = np.array([precos_iniciais[t] for t in self.tickers], dtype=np.float64)
+        self.precos = self.abertura.copy()
+        self.ticks = 0
+        self._rng = np.random.default_rng(seed)
+
+        drift = np.broadcast_to(np.asarray(drift, dtype=np.float64), self.precos.shape)
+        vol = np.broadcast_to(np.asarray(volatilidade, dtype=np.float64), self.precos.shape)
+        self._mu_dt = (drift - 0.5 * vol ** 2) * dt
+        self._sigma_raiz_dt = vol * np.sqrt(dt)
+
+        self._rho = None
+        self._cholesky = None
+        if np.ndim(correlacao) == 2:
+            self._cholesky = np.linalg.cholesky(np.asarray(correlacao, dtype=np.float64))
+        elif correlacao:
+            self._rho = float(correlacao)
+            # Um fator comum só gera correlações em [0, 1] (fora disso a raiz dá NaN)
+            if not 0 <= self._rho <= 1: raise ValueError(f"Correlação fora de [0, 1]: {correlacao}")
+
+    def _choques(self, passos):
+        z = self._rng.standard_normal((passos, len(self.tickers)))
+        if self._cholesky is not None:
+            z = z @ self._cholesky.T
+        elif self._rho is not None:
+            fator = self._rng.standard_normal((passos, 1))
+            z = np.sqrt(self._rho) * fator + np.sqrt(1 - self._rho) * z
+        return z
+
+    def avancar(self, passos=1):
+        # Soma os log-retornos dos passos e aplica de uma vez no vetor de estado
+        retornos = self._mu_dt + self._sigma_raiz_dt * self._choques(passos)
+        self.precos *= np.exp(retornos.sum(axis=0))
+        self.ticks += passos
+        return self.precos
+
+    def variacoes(self):
+        # Variação em relação à abertura (preço inicial da sessão)
+        return self.precos / self.abertura - 1
+
 class MarketAPI:
     EMPRESAS = {
         "PETR4": {"nome": "Petrobras", "preco_base": 35.50},
@@ -36,20 +304,54 @@ class MarketAPI:
         "WEGE3": {"valor_acao": 0.20, "offset_dias": 30},
     }
 
+    motor = None
+
     @staticmethod
+    def configurar_motor(seed=None, **parametros):
+        # Recria o motor de preços (seed fixa = simulação reprodutível)
+        precos = {t: d["preco_base"] for t, d in MarketAPI.EMPRESAS.items()}
+        MarketAPI.motor = MotorPrecos(precos, seed=seed, **parametros)
+        return MarketAPI.motor
+
+    historico = None
+
+    @staticmethod
+    def configurar_historico(pasta="historico_precos"):
+        # Passa a gravar cada tick gerado no HistoricoPrecos
+        MarketAPI.historico = HistoricoPrecos(pasta)
+        return MarketAPI.historico
+
+    @staticmethod
+    @Metricas.instrumentar("mercado", op="cotacoes")
     def get_prices():
+        motor = MarketAPI.motor or MarketAPI.configurar_motor()
+        precos = motor.avancar()
+        if MarketAPI.historico: MarketAPI.historico.registrar(motor.tickers, precos)
+        variacoes = motor.variacoes()
         cotacoes = {}
-        for ticker, dados in MarketAPI.EMPRESAS.items():
-            variacao = random.uniform(-0.02, 0.02)
-            preco_atual = dados["preco_base"] * (1 + variacao)
+        for ticker, i in motor.indice.items():
             cotacoes[ticker] = {
-                "nome": dados["nome"],
-                "preco": round(preco_atual, 2),
-                "variacao": round(variacao * 100, 2)
+                "nome": MarketAPI.EMPRESAS[ticker]["nome"],
+                "preco": round(float(precos[i]), 2),
+                "variacao": round(float(variacoes[i]) * 100, 2)
             }
         return cotacoes
 
+    cache = None
+
     @staticmethod
+    def configurar_cache(ttl=5.0):
+        MarketAPI.cache = CacheCotacoes(ttl)
+        return MarketAPI.cache
+
+    @staticmethod
+    @Metricas.instrumentar("mercado", op="snapshot_cotacoes")
+    def get_snapshot():
+        # Cotações em cache (mesmo tick para todos os leitores até o TTL vencer)
+        return (MarketAPI.cache or MarketAPI.configurar_cache()).obter()
+
+    @staticmethod
+    @Metricas.instrumentar("mercado", op="info_dividendos")
     def get_info_dividendos():
         hoje = datetime.now()
         info = {}
@@ -63,167 +365,2828 @@ class MarketAPI:
             }
         return info
 
-class BancoBackend:
-    def __init__(self, arquivo="bank_data.json"):
+class CacheCotacoes:
+    # Um único snapshot de cotações compartilhado por painel, carteira e execução
+    # de ordens. Só gera um tick novo quando o snapshot passa do TTL; cada tick
+    # recebe uma versão para que as ordens registrem a cotação usada.
+    def __init__(self, ttl=5.0, fonte=None):
+        self.ttl = ttl
+        self._fonte = fonte or MarketAPI.get_prices
+        self._trava = threading.Lock()
+        self._versao = 0
+        self._snapshot = None
+
+    def obter(self):
+        with self._trava:
+            if self._snapshot is None or time.monotonic() - self._snapshot["criado_em"] >= self.ttl:
+                self._novo_snapshot(self._fonte())
+            return self._snapshot
+
+    def _novo_snapshot(self, cotacoes):
+        self._versao += 1
+        self._snapshot = {
+            "versao": self._versao,
+            "criado_em": time.monotonic(),
+            "data": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+            "cotacoes": cotacoes
+        }
+        return self._snapshot
+
+    def cotacao(self, ticker):
+        snap = self.obter()
+        return snap["cotacoes"][ticker]["preco"], snap["versao"]
+
+    def publicar(self, cotacoes):
+        # Tick empurrado de fora (PublicadorCotacoes): vira o snapshot atual
+        with self._trava: return self._novo_snapshot(cotacoes)
+
+    def invalidar(self):
+        with self._trava: self._snapshot = None
+
+class Assinatura:
+    # Caixa de um assinante do PublicadorCotacoes: guarda só o último snapshot
+    def __init__(self, callback, em_thread=False):
+        self.callback = callback
+        self.em_thread = em_thread
+        self.ultimo = None
+        self.entregues = 0
+        self.coalescidos = 0  # ticks substituídos antes de o assinante consumir
+        self.falhas = 0  # entregas em que o callback levantou exceção
+        self._evento = None
+        self._tarefa = None
+
+class PublicadorCotacoes:
+    # Mercado "ao vivo": um loop asyncio numa thread própria gera ticks na
+    # frequência configurada, publica no CacheCotacoes (mesma versão para
+    # ordens e telas) e distribui aos assinantes. Assinante lento não acumula
+    # fila: recebe o valor mais recente quando voltar a consumir.
+    # Callbacks rodam no loop (podem ser async); em_thread=True os manda para
+    # o executor padrão, para quem faz trabalho pesado.
+    def __init__(self, frequencia=1.0, cache=None, fonte=None):
+        self.intervalo = 1 / frequencia
+        self.cache = cache or MarketAPI.cache or MarketAPI.configurar_cache()
+        self._fonte = fonte or MarketAPI.get_prices
+        self._assinaturas = []
+        self._loop = None
+        self._thread = None
+        self.ticks = 0
+
+    def iniciar(self):
+        self._loop = asyncio.new_event_loop()
+        pronto = threading.Event()
+        def rodar():
+            asyncio.set_event_loop(self._loop)
+            for a in self._assinaturas: self._ativar(a)
+            self._produtor = self._loop.create_task(self._produzir())
+            self._loop.call_soon(pronto.set)
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._loop.shutdown_default_executor())
+            self._loop.close()
+        self._thread = threading.Thread(target=rodar, daemon=True)
+        self._thread.start()
+        pronto.wait()
+        return self
+
+    def parar(self):
+        if not self._thread: return
+        async def encerrar():
+            tarefas = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for tarefa in tarefas: tarefa.cancel()
+            await asyncio.gather(*tarefas, return_exceptions=True)
+            self._loop.stop()
+        asyncio.run_coroutine_threadsafe(encerrar(), self._loop)
+        self._thread.join()
+        self._thread = None
+
+    def assinar(self, callback, em_thread=False):
+        assinatura = Assinatura(callback, em_thread)
+        self._assinaturas.append(assinatura)
+        if self._thread: self._loop.call_soon_threadsafe(self._ativar, assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        if assinatura in self._assinaturas: self._assinaturas.remove(assinatura)
+        if self._thread and assinatura._tarefa: self._loop.call_soon_threadsafe(assinatura._tarefa.cancel)
+
+    def _ativar(self, assinatura):
+        assinatura._evento = asyncio.Event()
+        assinatura._tarefa = self._loop.create_task(self._consumir(assinatura))
+
+    async def _produzir(self):
+        proximo = self._loop.time()
+        while True:
+            try:
+                snap = self.cache.publicar(self._fonte())
+            except Exception:
+                # Fonte com erro perde este tick, não o publicador
+                traceback.print_exc()
+                if Metricas.ativo: Metricas.contar("erros", job="cotacoes")
+            else:
+                self.ticks += 1
+                for a in self._assinaturas:
+                    if a._evento is None: continue
+                    if a.ultimo is not None: a.coalescidos += 1
+                    a.ultimo = snap
+                    a._evento.set()
+            # Agenda pelo relógio absoluto para não acumular atraso entre ticks
+            proximo += self.intervalo
+            await asyncio.sleep(max(0, proximo - self._loop.time()))
+
+    async def _consumir(self, a):
+        while True:
+            await a._evento.wait()
+            a._evento.clear()
+            snap, a.ultimo = a.ultimo, None
+            try:
+                if a.em_thread:
+                    await self._loop.run_in_executor(None, a.callback, snap)
+                else:
+                    resultado = a.callback(snap)
+                    if asyncio.iscoroutine(resultado): await resultado
+            except Exception:
+                # Callback com erro perde esta entrega, não a assinatura
+                traceback.print_exc()
+                a.falhas += 1
+                if Metricas.ativo: Metricas.contar("erros", job="assinante")
+                continue
+            a.entregues += 1
+
+class HistoricoPrecos:
+    # Série histórica por ticker em arquivos colunares append-only de float64:
+    # <pasta>/<TICKER>.ts (epoch em segundos) e <TICKER>.preco, lidos via memmap.
+    # Consultas por intervalo devolvem fatias do mapa (sem cópia, sem parse).
+    def __init__(self, pasta="historico_precos", ticks_por_descarga=256):
+        self.pasta = pasta
+        self.ticks_por_descarga = ticks_por_descarga
+        os.makedirs(pasta, exist_ok=True)
+        self._trava = threading.Lock()
+        self._tickers = None
+        self._buffer_ts = []
+        self._buffer_precos = []
+        self._mapas = {}  # ticker -> (tamanho em bytes, ts, precos)
+        self._reparar()
+
+    def _reparar(self):
+        # Queda entre o append do .preco e o do .ts deixa um preço sem timestamp; as
+        # próximas descargas desalinhariam as colunas para sempre. Corta as duas no
+        # mesmo número de registros inteiros antes de qualquer append.
+        tickers = {os.path.splitext(nome)[0] for nome in os.listdir(self.pasta) if nome.endswith((".ts", ".preco"))}
+        for ticker in tickers:
+            caminhos = self._caminhos(ticker)
+            tamanhos = [os.path.getsize(c) if os.path.exists(c) else 0 for c in caminhos]
+            n = min(tamanhos) // 8 * 8
+            for caminho, tamanho in zip(caminhos, tamanhos):
+                if tamanho != n:
+                    with open(caminho, "ab") as f: f.truncate(n)
+
+    def _caminhos(self, ticker):
+        base = os.path.join(self.pasta, ticker)
+        return base + ".ts", base + ".preco"
+
+    def registrar(self, tickers, precos, timestamp=None):
+        # Acumula o tick em memória e grava em bloco (uma abertura de arquivo por ticker)
+        with self._trava:
+            tickers = tuple(tickers)
+            if self._tickers != tickers:
+                self._descarregar()
+                self._tickers = tickers
+            self._buffer_ts.append(time.time() if timestamp is None else timestamp)
+            self._buffer_precos.append(np.array(precos, dtype=np.float64))
+            if len(self._buffer_ts) >= self.ticks_por_descarga: self._descarregar()
+
+    def descarregar(self):
+        with self._trava: self._descarregar()
+
+    def _descarregar(self):
+        if not self._buffer_ts: return
+        ts = np.array(self._buffer_ts, dtype=np.float64).tobytes()
+        matriz = np.vstack(self._buffer_precos)  # ticks x tickers
+        for j, ticker in enumerate(self._tickers):
+            arq_ts, arq_preco = self._caminhos(ticker)
+            # Preço primeiro: um .ts nunca aponta para um preço que não foi gravado
+            with open(arq_preco, "ab") as f: f.write(np.ascontiguousarray(matriz[:, j]).tobytes())
+            with open(arq_ts, "ab") as f: f.write(ts)
+        self._buffer_ts, self._buffer_precos = [], []
+
+    def _mapa(self, ticker):
+        arq_ts, arq_preco = self._caminhos(ticker)
+        if not os.path.exists(arq_ts): return np.empty(0), np.empty(0)
+        n = min(os.path.getsize(arq_ts), os.path.getsize(arq_preco)) // 8
+        cache = self._mapas.get(ticker)
+        if cache and cache[0] == n: return cache[1], cache[2]
+        if n == 0: return np.empty(0), np.empty(0)
+        ts = np.memmap(arq_ts, dtype=np.float64, mode="r", shape=(n,))
+        precos = np.memmap(arq_preco, dtype=np.float64, mode="r", shape=(n,))
+        self._mapas[ticker] = (n, ts, precos)
+        return ts, precos
+
+    def serie(self, ticker, inicio=None, fim=None):
+        # (timestamps, preços) no intervalo [inicio, fim): views do memmap
+        with self._trava:
+            self._descarregar()
+            ts, precos = self._mapa(ticker)
+        a = 0 if inicio is None else int(np.searchsorted(ts, inicio, side="left"))
+        b = len(ts) if fim is None else int(np.searchsorted(ts, fim, side="left"))
+        return ts[a:b], precos[a:b]
+
+    def ohlc(self, ticker, resolucao, inicio=None, fim=None):
+        # Agrega em candles de `resolucao` segundos (ex.: 60 = 1 minuto)
+        ts, precos = self.serie(ticker, inicio, fim)
+        if not len(ts):
+            vazio = np.empty(0)
+            return {"inicio": vazio, "abertura": vazio, "maxima": vazio, "minima": vazio, "fechamento": vazio, "ticks": vazio.astype(np.int64)}
+        baldes = (np.asarray(ts) // resolucao).astype(np.int64)
+        inicios = np.flatnonzero(np.r_[True, baldes[1:] != baldes[:-1]])
+        fins = np.r_[inicios[1:], len(ts)]
+        return {
+            "inicio": baldes[inicios] * resolucao,
+            "abertura": np.asarray(precos[inicios]),
+            "maxima": np.maximum.reduceat(precos, inicios),
+            "minima": np.minimum.reduceat(precos, inicios),
+            "fechamento": np.asarray(precos[fins - 1]),
+            "ticks": fins - inicios
+        }
+
+    def reduzir(self, ticker, max_pontos, inicio=None, fim=None):
+        # Downsampling por passo fixo para gráficos (continua sendo view)
+        ts, precos = self.serie(ticker, inicio, fim)
+        passo = max(1, -(-len(ts) // max_pontos))
+        return ts[::passo], precos[::passo]
+
+# --- Modelos compactos (contas em memória e snapshot binário) ---
+class Dinheiro:
+    # Valores monetários em centavos inteiros; os eventos e o JSON continuam em reais
+    @staticmethod
+    def centavos(valor):
+        return int(round(valor * 100))
+
+    @staticmethod
+    def reais(centavos):
+        return centavos / 100
+
+class Tickers:
+    # Tickers internados: cada nome vira um id inteiro (u16 no snapshot)
+    _ids = {}
+    _nomes = []
+    _trava = threading.Lock()
+
+    @staticmethod
+    def id_de(nome):
+        t = Tickers._ids.get(nome)
+        if t is None:
+            with Tickers._trava:
+                t = Tickers._ids.get(nome)
+                if t is None:
+                    t = Tickers._ids[nome] = len(Tickers._nomes)
+                    Tickers._nomes.append(sys.intern(nome))
+        return t
+
+    @staticmethod
+    def nome_de(t):
+        return Tickers._nomes[t]
+
+class Posicao:
+    __slots__ = ("qtd", "custo")  # custo total em centavos
+
+    def __init__(self, qtd=0, custo=0):
+        self.qtd = qtd
+        self.custo = custo
+
+    @property
+    def preco_medio(self):
+        return self.custo / self.qtd / 100 if self.qtd else 0.0
+
+class Conta:
+    # saldo em centavos; investimentos: id do ticker -> Posicao; dividendos: tupla com as
+    # chaves inteiras (id do ticker << 24 | dia ordinal) dos pagamentos já recebidos
+    # (imutável: poucas por conta, e o ponto de restauração dos lotes não precisa copiar)
+    __slots__ = ("cpf", "nome", "senha", "saldo", "investimentos", "dividendos")
+    _chaves = {}
+
+    def __init__(self, cpf, nome, senha, saldo=0, investimentos=None, dividendos=()):
+        self.cpf = cpf
+        self.nome = nome
+        self.senha = senha
+        self.saldo = saldo
+        self.investimentos = investimentos if investimentos is not None else {}
+        self.dividendos = dividendos
+
+    def posicao(self, ticker):
+        return self.investimentos.get(Tickers.id_de(ticker))
+
+    @staticmethod
+    def chave_dividendo(texto):
+        # "PETR4_18/10/2026" -> inteiro (memorizado: são poucas datas de pagamento)
+        chave = Conta._chaves.get(texto)
+        if chave is None:
+            ticker, data = texto.rsplit("_", 1)
+            chave = Conta._chaves[texto] = Tickers.id_de(ticker) << 24 | datetime.strptime(data, "%d/%m/%Y").toordinal()
+        return chave
+
+    @staticmethod
+    def texto_dividendo(chave):
+        return f"{Tickers.nome_de(chave >> 24)}_{datetime.fromordinal(chave & 0xFFFFFF).strftime('%d/%m/%Y')}"
+
+    # --- Conversores para o formato JSON (bank_data.json, API, telas) ---
+    def para_dict(self):
+        return {
+            "nome": self.nome,
+            "cpf": self.cpf,
+            "senha": self.senha,
+            "saldo": Dinheiro.reais(self.saldo),
+            "investimentos": {Tickers.nome_de(t): {"qtd": p.qtd, "preco_medio": p.preco_medio} for t, p in self.investimentos.items()},
+            "dividendos_recebidos": {Conta.texto_dividendo(k): True for k in self.dividendos}
+        }
+
+    @staticmethod
+    def de_dict(u):
+        investimentos = {Tickers.id_de(t): Posicao(p["qtd"], Dinheiro.centavos(p["qtd"] * p["preco_medio"]))
+                         for t, p in u.get("investimentos", {}).items() if p["qtd"]}
+        dividendos = tuple(Conta.chave_dividendo(k) for k in u.get("dividendos_recebidos", {}))
+        return Conta(u["cpf"], u["nome"], u["senha"], Dinheiro.centavos(u.get("saldo", 0)), investimentos, dividendos)
+
+class Transacao:
+    __slots__ = ("seq", "cpf", "epoch", "data", "tipo", "valor", "detalhe")  # valor em centavos
+
+    def __init__(self, seq, cpf, epoch, data, tipo, valor, detalhe):
+        self.seq, self.cpf, self.epoch, self.data = seq, cpf, epoch, data
+        self.tipo, self.valor, self.detalhe = tipo, valor, detalhe
+
+    def para_dict(self):
+        return {"data": self.data, "tipo": self.tipo, "valor": Dinheiro.reais(self.valor), "detalhe": self.detalhe}
+
+class CodecContas:
+    # Snapshot binário colunar: cabeçalho, tabela de tickers, colunas de tamanho fixo
+    # (lidas com np.frombuffer, sem parse) e blobs de nomes/senhas.
+    # Contas: cpf u64, saldo i64, fim do nome u64, fim da senha u64 (em caracteres),
+    # nº posições u32, nº dividendos u32 | blobs UTF-8 | posições: ticker u16, qtd i64,
+    # custo i64 | dividendos u64 | (versão 2) extras: tamanho u64 + JSON (estado que não
+    # é de conta, como as transferências entre fragmentos ainda pendentes)
+    MAGICO = b"BKPY"
+    VERSAO = 2
+
+    @staticmethod
+    def serializar(seq, contas, extras=None):
+        n = len(contas)
+        tabela = [t.encode() for t in Tickers._nomes]
+        nomes = [c.nome for c in contas]
+        senhas = [c.senha for c in contas]
+        posicoes = [(t, p.qtd, p.custo) for c in contas for t, p in c.investimentos.items()]
+        blobs = ["".join(nomes).encode(), "".join(senhas).encode()]
+        partes = [CodecContas.MAGICO, struct.pack("<HQI", CodecContas.VERSAO, seq, len(tabela))]
+        partes += [bytes([len(t)]) + t for t in tabela]
+        partes += [
+            struct.pack("<Q", n),
+            np.fromiter((int(c.cpf) for c in contas), "<u8", n).tobytes(),
+            np.fromiter((c.saldo for c in contas), "<i8", n).tobytes(),
+            np.cumsum(np.fromiter(map(len, nomes), "<u8", n), dtype="<u8").tobytes(),
+            np.cumsum(np.fromiter(map(len, senhas), "<u8", n), dtype="<u8").tobytes(),
+            np.fromiter((len(c.investimentos) for c in contas), "<u4", n).tobytes(),
+            np.fromiter((len(c.dividendos) for c in contas), "<u4", n).tobytes(),
+            struct.pack("<QQ", *(len(b) for b in blobs)), *blobs,
+            np.array([p[0] for p in posicoes], "<u2").tobytes(),
+            np.array([p[1] for p in posicoes], "<i8").tobytes(),
+            np.array([p[2] for p in posicoes], "<i8").tobytes(),
+            np.fromiter((k for c in contas for k in c.dividendos), "<u8").tobytes()
+        ]
+        extras = json.dumps(extras or {}, ensure_ascii=False).encode()
+        partes += [struct.pack("<Q", len(extras)), extras]
+        return b"".join(partes)
+
+    @staticmethod
+    def desserializar(dados):
+        # Milhões de objetos sem ciclos: o coletor só gastaria tempo varrendo
+        gc_ativo = gc.isenabled()
+        gc.disable()
+        try:
+            return CodecContas._desserializar(dados)
+        finally:
+            if gc_ativo: gc.enable()
+
+    @staticmethod
+    def _desserializar(dados):
+        if dados[:4] != CodecContas.MAGICO: raise RuntimeError("Snapshot binário inválido.")
+        versao, seq, n_tickers = struct.unpack_from("<HQI", dados, 4)
+        if versao not in (1, CodecContas.VERSAO): raise RuntimeError(f"Versão de snapshot não suportada: {versao}")
+        pos = 4 + struct.calcsize("<HQI")
+        tabela = []
+        for _ in range(n_tickers):
+            tamanho = dados[pos]
+            tabela.append(dados[pos + 1:pos + 1 + tamanho].decode())
+            pos += 1 + tamanho
+        (n,) = struct.unpack_from("<Q", dados, pos)
+        pos += 8
+
+        def coluna(tipo, qtd):
+            nonlocal pos
+            valores = np.frombuffer(dados, tipo, qtd, pos)
+            pos += valores.nbytes
+            return valores
+
+        cpfs, saldos = coluna("<u8", n), coluna("<i8", n)
+        fim_nomes, fim_senhas = coluna("<u8", n), coluna("<u8", n)
+        n_posicoes, n_dividendos = coluna("<u4", n), coluna("<u4", n)
+        tamanho_nomes, tamanho_senhas = struct.unpack_from("<QQ", dados, pos)
+        pos += 16
+        nomes = dados[pos:pos + tamanho_nomes].decode()
+        senhas = dados[pos + tamanho_nomes:pos + tamanho_nomes + tamanho_senhas].decode()
+        pos += tamanho_nomes + tamanho_senhas
+        total_posicoes = int(n_posicoes.sum())
+        tickers_pos, qtds, custos = coluna("<u2", total_posicoes), coluna("<i8", total_posicoes), coluna("<i8", total_posicoes)
+        chaves = coluna("<u8", int(n_dividendos.sum()))
+        extras = {}
+        if versao >= 2:
+            (tamanho,) = struct.unpack_from("<Q", dados, pos)
+            extras = json.loads(dados[pos + 8:pos + 8 + tamanho])
+
+        # Ids do arquivo -> ids internados neste processo
+        mapa = np.array([Tickers.id_de(t) for t in tabela], dtype=np.int64)
+        tickers_pos = mapa[tickers_pos].tolist() if total_posicoes else []
+        chaves = ((mapa[(chaves >> 24).astype(np.int64)] << 24) | (chaves & 0xFFFFFF).astype(np.int64)).tolist() if len(chaves) else []
+
+        # Monta os objetos a partir das colunas (fatias e map, sem laço por campo)
+        def fatias(fins):
+            fins = fins.tolist()
+            return zip([0] + fins[:-1], fins)
+        posicoes = list(map(Posicao, qtds.tolist(), custos.tolist()))
+        contas = list(map(
+            Conta,
+            [f"{cpf:011d}" for cpf in cpfs.tolist()],
+            [nomes[i:j] for i, j in fatias(fim_nomes)],
+            [senhas[i:j] for i, j in fatias(fim_senhas)],
+            saldos.tolist(),
+            [dict(zip(tickers_pos[i:j], posicoes[i:j])) if i != j else {} for i, j in fatias(np.cumsum(n_posicoes, dtype=np.int64))],
+            [tuple(chaves[i:j]) for i, j in fatias(np.cumsum(n_dividendos, dtype=np.int64))]
+        ))
+        return seq, contas, extras
+
+class MotorArmazenamento:
+    # Persistência em snapshot + log append-only (write-ahead).
+    # Cada operação vira uma linha no log; o snapshot é refeito em segundo plano.
+    def __init__(self, base, fsync=True):
+        self.arquivo_snapshot = base + ".snapshot.bin"
+        self.arquivo_snapshot_json = base + ".snapshot.json"  # formato antigo, só leitura
+        self.arquivo_log = base + ".wal"
+        self.arquivo_log_compactando = base + ".wal.1"
+        self.arquivo_trava = base + ".lock"
+        self.fsync = fsync
+        self.eventos_no_log = 0
+        self._log = None
+        self._trava_processo = None
+        # Group commit: um fsync cobre todas as linhas escritas até ele
+        self._trava_fsync = threading.Lock()
+        self._escritos = 0
+        self._sincronizados = 0
+
+    def travar_processo(self):
+        # Um único processo é dono dos arquivos do banco por vez
+        self._trava_processo = open(self.arquivo_trava, "a")
+        if fcntl:
+            try:
+                fcntl.flock(self._trava_processo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._trava_processo.close()
+                self._trava_processo = None
+                raise RuntimeError("Banco em uso por outro processo.")
+
+    def existe(self):
+        return any(os.path.exists(a) for a in (self.arquivo_snapshot, self.arquivo_snapshot_json,
+                                                self.arquivo_log, self.arquivo_log_compactando))
+
+    def ler_snapshot(self):
+        if os.path.exists(self.arquivo_snapshot):
+            with open(self.arquivo_snapshot, "rb") as f: dados = f.read()
+            if Metricas.ativo: Metricas.contar("bytes_lidos", len(dados), arquivo="snapshot")
+            return CodecContas.desserializar(dados)
+        if os.path.exists(self.arquivo_snapshot_json):
+            # Migração: snapshot JSON de versões anteriores vira binário na próxima compactação
+            with open(self.arquivo_snapshot_json, "r", encoding='utf-8') as f: snap = json.load(f)
+            if Metricas.ativo: Metricas.contar("bytes_lidos", os.path.getsize(self.arquivo_snapshot_json), arquivo="snapshot")
+            return snap["seq"], snap["usuarios"], {}
+        return 0, [], {}
+
+    def ler_eventos(self, seq_minima):
+        # Segmento em compactação primeiro, depois o log atual (ordem de escrita)
+        for caminho in (self.arquivo_log_compactando, self.arquivo_log):
+            if not os.path.exists(caminho): continue
+            with open(caminho, "r", encoding='utf-8') as f:
+                num = 0
+                linha = f.readline()
+                while linha:
+                    num += 1
+                    proxima = f.readline()
+                    try:
+                        evento = json.loads(linha)
+                    except ValueError:
+                        # Só a última linha pode estar incompleta (queda no meio da escrita)
+                        if not proxima: break
+                        raise RuntimeError(f"Log corrompido: {caminho}, linha {num}.")
+                    if Metricas.ativo: Metricas.contar("bytes_lidos", len(linha), arquivo="wal")
+                    if evento["seq"] > seq_minima: yield evento
+                    linha = proxima
+
+    def abrir(self):
+        self._log = open(self.arquivo_log, "a", encoding='utf-8')
+
+    def fechar(self):
+        if self._log:
+            self._log.close()
+            self._log = None
+        if self._trava_processo:
+            self._trava_processo.close()  # libera o flock
+            self._trava_processo = None
+
+    def anexar(self, evento):
+        # Chamar serializado (trava do log); devolve a posição para sincronizar()
+        linha = json.dumps(evento, ensure_ascii=False, separators=(",", ":")) + "\n"
+        self._log.write(linha)
+        self._log.flush()
+        if Metricas.ativo: Metricas.contar("bytes_escritos", len(linha), arquivo="wal")
+        self.eventos_no_log += 1
+        self._escritos += 1
+        return self._escritos
+
+    @Metricas.instrumentar("operacao", op="fsync_wal")
+    def sincronizar(self, posicao):
+        if not self.fsync: return
+        with self._trava_fsync:
+            # Outra thread já sincronizou esta linha junto com as dela
+            if self._sincronizados >= posicao: return
+            alvo = self._escritos
+            os.fsync(self._log.fileno())
+            self._sincronizados = alvo
+
+    def rotacionar(self):
+        # Chamado com o estado travado: o log atual vira o segmento a compactar
+        self._log.close()
+        if os.path.exists(self.arquivo_log_compactando):
+            # Sobrou de uma compactação interrompida: concatena em vez de sobrescrever
+            with open(self.arquivo_log_compactando, "a", encoding='utf-8') as destino, \
+                 open(self.arquivo_log, "r", encoding='utf-8') as origem:
+                shutil.copyfileobj(origem, destino)
+                destino.flush()
+                if self.fsync: os.fsync(destino.fileno())
+            os.remove(self.arquivo_log)
+        elif os.path.exists(self.arquivo_log):
+            os.replace(self.arquivo_log, self.arquivo_log_compactando)
+        self.abrir()
+        self.eventos_no_log = 0
+
+    def gravar_snapshot(self, conteudo):
+        tmp = self.arquivo_snapshot + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(conteudo)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.arquivo_snapshot)
+        if Metricas.ativo: Metricas.contar("bytes_escritos", len(conteudo), arquivo="snapshot")
+        if os.path.exists(self.arquivo_snapshot_json): os.remove(self.arquivo_snapshot_json)
+        # O snapshot já cobre tudo que estava no segmento antigo
+        if os.path.exists(self.arquivo_log_compactando): os.remove(self.arquivo_log_compactando)
+
+class HistoricoTransacoes:
+    # Extrato fora das contas: arquivo append-only (uma linha JSON por lançamento)
+    # + índice em memória por CPF (offset, timestamp e tipo em arrays compactos),
+    # ordenado por data. Consultas paginadas por cursor leem só as linhas da página.
+    # Linha: [seq, cpf, epoch, data, tipo, valor, detalhe, fim_do_grupo]
+    def __init__(self, arquivo):
         self.arquivo = arquivo
-        if not os.path.exists(self.arquivo):
-            self._salvar([])
+        self._trava = threading.Lock()
+        self._indice = {}  # cpf -> (offsets, epochs, tipos)
+        self._tipos = {}
+        self._nomes_tipos = []
+        self.seqs_recentes = set()
+        self._epochs = {}
+        self._escrita = None
+        self._leitura = None
+
+    def carregar(self, seq_snapshot):
+        # Monta o índice; guarda as seqs posteriores ao snapshot (o replay do log
+        # não deve duplicá-las). Grupo final incompleto ou linha corrompida é
+        # descartado: tudo depois do último snapshot pode ser refeito pelo log.
+        self._indice, self.seqs_recentes = {}, set()
+        valido = 0
+        if os.path.exists(self.arquivo):
+            with open(self.arquivo, "rb") as f:
+                offset = 0
+                grupo = []
+                for linha in f:
+                    try:
+                        seq, cpf, epoch, _, tipo, _, _, fim = json.loads(linha)
+                    except ValueError:
+                        break
+                    grupo.append((cpf, offset, epoch, tipo))
+                    offset += len(linha)
+                    if fim:
+                        for item in grupo: self._indexar(*item)
+                        if seq > seq_snapshot: self.seqs_recentes.add(seq)
+                        grupo = []
+                        valido = offset
+            if valido < os.path.getsize(self.arquivo):
+                with open(self.arquivo, "r+b") as f: f.truncate(valido)
+        self._escrita = open(self.arquivo, "ab")
+        self._leitura = open(self.arquivo, "rb")
+
+    def _indexar(self, cpf, offset, epoch, tipo):
+        entrada = self._indice.get(cpf)
+        if entrada is None: entrada = self._indice[cpf] = (array("q"), array("d"), array("H"))
+        offsets, epochs, tipos = entrada
+        # Mantém a ordem por data mesmo com commits concorrentes no mesmo minuto
+        if epochs and epoch < epochs[-1]: epoch = epochs[-1]
+        if tipo not in self._tipos:
+            self._tipos[tipo] = len(self._nomes_tipos)
+            self._nomes_tipos.append(tipo)
+        offsets.append(offset)
+        epochs.append(epoch)
+        tipos.append(self._tipos[tipo])
+
+    def anexar(self, seq, lancamentos):
+        # Todos os lançamentos de um commit num único write (grupo com marcador de fim)
+        if not lancamentos: return
+        linhas = []
+        for i, (cpf, data, tipo, valor, detalhe) in enumerate(lancamentos):
+            epoch = self._epoch(data)
+            linha = json.dumps([seq, cpf, epoch, data, tipo, valor, detalhe, int(i == len(lancamentos) - 1)], ensure_ascii=False, separators=(",", ":"))
+            linhas.append((cpf, epoch, tipo, (linha + "\n").encode("utf-8")))
+        with self._trava:
+            offset = self._escrita.tell()
+            dados = b"".join(l[3] for l in linhas)
+            self._escrita.write(dados)
+            self._escrita.flush()
+            if Metricas.ativo: Metricas.contar("bytes_escritos", len(dados), arquivo="extrato")
+            for cpf, epoch, tipo, dados in linhas:
+                self._indexar(cpf, offset, epoch, tipo)
+                offset += len(dados)
+
+    def _epoch(self, data):
+        # strptime é caro e as datas têm resolução de minuto: memoriza
+        epoch = self._epochs.get(data)
+        if epoch is None:
+            if len(self._epochs) > 10_000: self._epochs.clear()
+            epoch = self._epochs[data] = datetime.strptime(data, "%d/%m/%Y %H:%M").timestamp()
+        return epoch
+
+    def sincronizar(self):
+        # fsync antes de cada snapshot: tudo até a seq do snapshot fica durável
+        with self._trava:
+            self._escrita.flush()
+            os.fsync(self._escrita.fileno())
+
+    def limpar(self):
+        with self._trava:
+            self._escrita.truncate(0)
+            self._escrita.seek(0)
+            self._indice, self.seqs_recentes = {}, set()
+
+    def fechar(self):
+        for f in (self._escrita, self._leitura):
+            if f: f.close()
+        self._escrita = self._leitura = None
+
+    def _ler(self, offset):
+        self._leitura.seek(offset)
+        linha = self._leitura.readline()
+        if Metricas.ativo: Metricas.contar("bytes_lidos", len(linha), arquivo="extrato")
+        seq, cpf, epoch, data, tipo, valor, detalhe, _ = json.loads(linha)
+        return Transacao(seq, cpf, epoch, data, tipo, Dinheiro.centavos(valor), detalhe)
+
+    def total(self, cpf):
+        entrada = self._indice.get(cpf)
+        return len(entrada[0]) if entrada else 0
+
+    def consultar(self, cpf, cursor=None, limite=50, desde=None, ate=None, tipos=None):
+        # Mais recentes primeiro. cursor: devolvido pela página anterior (None = início).
+        # desde/ate: datetime; tipos: nomes de tipo aceitos. Retorna (itens, proximo_cursor).
+        with self._trava:
+            entrada = self._indice.get(cpf)
+            if not entrada: return [], None
+            offsets, epochs, ids_tipo = entrada
+            inicio = bisect.bisect_left(epochs, desde.timestamp()) if desde else 0
+            fim = bisect.bisect_right(epochs, ate.timestamp()) if ate else len(epochs)
+            if cursor is not None: fim = min(fim, cursor)
+            aceitos = None if tipos is None else {self._tipos[t] for t in tipos if t in self._tipos}
+            itens, i = [], fim
+            while i > inicio and len(itens) < limite:
+                i -= 1
+                if aceitos is None or ids_tipo[i] in aceitos: itens.append(self._ler(offsets[i]).para_dict())
+            return itens, (i if i > inicio else None)
+
+    def todos(self, cpf):
+        return self.consultar(cpf, limite=max(1, self.total(cpf)))[0]
+
+class Razao:
+    # Razão em partidas dobradas: cada evento financeiro commitado vira lançamentos
+    # imutáveis (origem -> destino, em centavos ou quantidade de ações) num arquivo
+    # append-only de registros de tamanho fixo. Saldo de uma conta num ativo = o que
+    # entrou - o que saiu; a soma de todas as contas é sempre zero. Os epochs do
+    # arquivo nunca decrescem (busca binária por data) e a cada intervalo_checkpoint
+    # lançamentos um checkpoint guarda o saldo de todas as contas até ali: a consulta
+    # "saldo em uma data" soma só do checkpoint anterior em diante.
+    REGISTRO = np.dtype([("seq", "<u8"), ("epoch", "<i8"), ("origem", "<u8"), ("destino", "<u8"),
+                         ("valor", "<i8"), ("ativo", "<u2"), ("fim", "u1")])  # fim = último do evento
+    # Contas internas (fora da faixa dos CPFs de 11 dígitos)
+    CAIXA = 10**11 + 1  # depósitos e saques
+    MERCADO = 10**11 + 2  # contraparte das compras e vendas
+    DIVIDENDOS = 10**11 + 3  # emissores pagando proventos
+    ABERTURA = 10**11 + 4  # saldos que já existiam quando o razão começou
+    TRANSITO = 10**11 + 5  # Pix entre fragmentos preparado, aguardando a decisão
+    ENTRE_FRAGMENTOS = 10**11 + 6  # Pix entre fragmentos concluído (soma zero no banco todo)
+    ATIVOS = 1 << 16  # chave agregada: conta * ATIVOS + ativo (0 = reais, n = n-ésimo ticker)
+    BLOCO = 1 << 20  # registros por leitura nas varreduras
+
+    def __init__(self, base, intervalo_checkpoint=100_000):
+        self.arquivo = base + ".razao"
+        self.arquivo_tickers = base + ".razao.tickers"
+        self.intervalo_checkpoint = intervalo_checkpoint
+        self._trava = threading.Lock()
+        self._escrita = None
+        self._tickers = []  # ativo n -> self._tickers[n - 1]
+        self._ids_tickers = {}
+        self._checkpoints = []  # nº de registros cobertos, crescente
+        self._cache_checkpoint = None
+        self._epochs = {}
+        self.total = 0
+        self.seqs_recentes = set()
+        self._ultimo_epoch = 0
+
+    # --- Arquivo ---
+    def carregar(self, seq_snapshot):
+        # Descarta registro/evento incompleto no fim (queda no meio da escrita) e guarda
+        # as seqs posteriores ao snapshot (o replay do log não deve duplicá-las)
+        if os.path.exists(self.arquivo_tickers):
+            with open(self.arquivo_tickers, "r", encoding='utf-8') as f: self._tickers = json.load(f)
+        self._ids_tickers = {t: i + 1 for i, t in enumerate(self._tickers)}
+        tamanho = os.path.getsize(self.arquivo) if os.path.exists(self.arquivo) else 0
+        self.total = tamanho // self.REGISTRO.itemsize
+        self.seqs_recentes = set()
+        if self.total:
+            registros = np.memmap(self.arquivo, dtype=self.REGISTRO, mode="r", shape=(self.total,))
+            fim = self.total
+            while fim:
+                inicio = max(0, fim - self.BLOCO)
+                fins = np.flatnonzero(registros["fim"][inicio:fim])
+                if len(fins): break
+                fim = inicio
+            self.total = inicio + int(fins[-1]) + 1 if fim else 0
+            # Tudo depois do último snapshot está no fim do arquivo (a compactação é uma barreira)
+            fim = self.total
+            while fim:
+                seqs = registros["seq"][max(0, fim - self.BLOCO):fim]
+                novos = seqs[seqs > seq_snapshot]
+                self.seqs_recentes.update(novos.tolist())
+                if len(novos) < len(seqs): break
+                fim = max(0, fim - self.BLOCO)
+            self._ultimo_epoch = int(registros["epoch"][self.total - 1]) if self.total else 0
+            del registros
+        if self.total * self.REGISTRO.itemsize < tamanho:
+            with open(self.arquivo, "r+b") as f: f.truncate(self.total * self.REGISTRO.itemsize)
+        self._checkpoints = []
+        for nome in os.listdir(os.path.dirname(os.path.abspath(self.arquivo))):
+            n = self._numero_checkpoint(nome)
+            if n is None: continue
+            # Checkpoint além do que sobrou do arquivo (queda) não vale mais
+            if n > self.total: os.remove(self._arquivo_checkpoint(n))
+            else: self._checkpoints.append(n)
+        self._checkpoints.sort()
+        self._escrita = open(self.arquivo, "ab")
+
+    def _arquivo_checkpoint(self, n):
+        return f"{self.arquivo}.{n:012d}.npz"
+
+    def _numero_checkpoint(self, nome):
+        prefixo = os.path.basename(self.arquivo) + "."
+        if not (nome.startswith(prefixo) and nome.endswith(".npz")): return None
+        meio = nome[len(prefixo):-4]
+        return int(meio) if meio.isdigit() else None
+
+    def vazio(self):
+        return not self.total
+
+    def sincronizar(self):
+        with self._trava:
+            self._escrita.flush()
+            os.fsync(self._escrita.fileno())
+
+    def limpar(self):
+        # Importação: o razão recomeça (com a abertura dos novos saldos)
+        with self._trava:
+            self._escrita.truncate(0)
+            self._escrita.seek(0)
+            for n in self._checkpoints: os.remove(self._arquivo_checkpoint(n))
+            self._checkpoints, self._cache_checkpoint = [], None
+            self.total, self.seqs_recentes, self._ultimo_epoch = 0, set(), 0
+
+    def fechar(self):
+        if self._escrita: self._escrita.close()
+        self._escrita = None
+
+    def ativo(self, ticker):
+        # None = reais; tickers ganham ids na ordem em que aparecem (tabela persistida)
+        if ticker is None: return 0
+        ativo = self._ids_tickers.get(ticker)
+        if ativo is None:
+            self._tickers.append(ticker)
+            ativo = self._ids_tickers[ticker] = len(self._tickers)
+            tmp = self.arquivo_tickers + ".tmp"
+            with open(tmp, "w", encoding='utf-8') as f:
+                json.dump(self._tickers, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.arquivo_tickers)
+        return ativo
+
+    def nome_ativo(self, ativo):
+        return self._tickers[ativo - 1] if ativo else None
+
+    def _epoch(self, data):
+        epoch = self._epochs.get(data)
+        if epoch is None:
+            if len(self._epochs) > 10_000: self._epochs.clear()
+            epoch = self._epochs[data] = int(datetime.strptime(data, "%d/%m/%Y %H:%M").timestamp())
+        return epoch
+
+    def anexar(self, seq, partidas):
+        # partidas: [(data, ticker ou None, origem, destino, valor)], todas do mesmo evento
+        if not partidas: return
+        with self._trava:
+            registros = np.zeros(len(partidas), dtype=self.REGISTRO)
+            datas, tickers, registros["origem"], registros["destino"], registros["valor"] = zip(*partidas)
+            registros["seq"] = seq
+            # Commits concorrentes podem chegar fora da ordem do relógio: nunca volta no tempo
+            epochs = np.maximum.accumulate([self._ultimo_epoch] + [self._epoch(d) for d in datas])[1:]
+            registros["epoch"] = epochs
+            self._ultimo_epoch = int(epochs[-1])
+            registros["ativo"] = [self.ativo(t) for t in tickers]
+            registros["fim"][-1] = 1
+            self._escrita.write(registros.tobytes())
+            self._escrita.flush()
+            self.total += len(registros)
+        if Metricas.ativo: Metricas.contar("bytes_escritos", registros.nbytes, arquivo="razao")
+
+    def _registros(self, total):
+        if not total: return np.zeros(0, dtype=self.REGISTRO)
+        return np.memmap(self.arquivo, dtype=self.REGISTRO, mode="r", shape=(total,))
+
+    # --- Agregação (saldos de todas as contas, vetorizado) ---
+    def _agregar(self, registros):
+        # -> (chaves ordenadas, saldos) com chave = conta * ATIVOS + ativo
+        ativo = registros["ativo"].astype(np.int64)
+        chaves = np.concatenate((registros["destino"].astype(np.int64) * self.ATIVOS + ativo,
+                                 registros["origem"].astype(np.int64) * self.ATIVOS + ativo))
+        valores = np.concatenate((registros["valor"], -registros["valor"]))
+        return self._reduzir(chaves, valores)
+
+    @staticmethod
+    def _reduzir(chaves, valores):
+        unicas, posicao = np.unique(chaves, return_inverse=True)
+        somas = np.zeros(len(unicas), dtype=np.int64)
+        np.add.at(somas, posicao, valores)
+        return unicas, somas
+
+    def _somar(self, a, b):
+        return self._reduzir(np.concatenate((a[0], b[0])), np.concatenate((a[1], b[1])))
+
+    def _ler_checkpoint(self, n):
+        if not n: return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        if self._cache_checkpoint and self._cache_checkpoint[0] == n: return self._cache_checkpoint[1]
+        with np.load(self._arquivo_checkpoint(n)) as dados: saldos = (dados["chaves"], dados["saldos"])
+        self._cache_checkpoint = (n, saldos)
+        return saldos
+
+    def _checkpoint_ate(self, fim):
+        # Último checkpoint que cobre no máximo fim registros (0 = começo do arquivo)
+        i = bisect.bisect_right(self._checkpoints, fim)
+        return self._checkpoints[i - 1] if i else 0
+
+    def checkpoint_pendente(self):
+        return self.total - (self._checkpoints[-1] if self._checkpoints else 0) >= self.intervalo_checkpoint
+
+    def fazer_checkpoint(self):
+        # Saldos até o fim atual = checkpoint anterior + lançamentos desde ele
+        with self._trava:
+            self._escrita.flush()
+            os.fsync(self._escrita.fileno())
+            total = self.total
+        inicio = self._checkpoint_ate(total)
+        if inicio == total: return
+        saldos = self._ler_checkpoint(inicio)
+        registros = self._registros(total)
+        for i in range(inicio, total, self.BLOCO):
+            saldos = self._somar(saldos, self._agregar(registros[i:i + self.BLOCO]))
+        destino = self._arquivo_checkpoint(total)
+        with open(destino + ".tmp", "wb") as f:
+            np.savez(f, chaves=saldos[0], saldos=saldos[1])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(destino + ".tmp", destino)
+        with self._trava:
+            if self.total >= total: self._checkpoints.append(total)
+        self._cache_checkpoint = (total, saldos)
+
+    # --- Consultas ---
+    def saldos_em(self, conta, epoch):
+        # {ativo: saldo} da conta com tudo lançado até epoch (inclusive)
+        with self._trava:
+            self._escrita.flush()
+            total = self.total
+        registros = self._registros(total)
+        # bisect lê ~log2(n) registros; np.searchsorted copiaria a coluna inteira do memmap
+        fim = bisect.bisect_right(registros["epoch"], epoch)
+        inicio = self._checkpoint_ate(fim)
+        chaves, valores = self._ler_checkpoint(inicio)
+        a, b = np.searchsorted(chaves, [conta * self.ATIVOS, (conta + 1) * self.ATIVOS])
+        saldos = dict(zip((chaves[a:b] - conta * self.ATIVOS).tolist(), valores[a:b].tolist()))
+        trecho = registros[inicio:fim]
+        for campo, sinal in (("destino", 1), ("origem", -1)):
+            movimentos = trecho[trecho[campo] == conta]
+            for ativo, valor in zip(*self._reduzir(movimentos["ativo"].astype(np.int64), movimentos["valor"])):
+                saldos[int(ativo)] = saldos.get(int(ativo), 0) + sinal * int(valor)
+        return saldos
+
+    def saldos_todos(self, total):
+        # Uma passada sobre os total primeiros registros; em cada checkpoint do caminho,
+        # confere o acumulado com o arquivo. -> (chaves, saldos, checkpoints divergentes)
+        saldos = self._ler_checkpoint(0)
+        registros = self._registros(total)
+        divergentes, inicio = [], 0
+        for fim in [n for n in self._checkpoints if n <= total] + [total]:
+            for i in range(inicio, fim, self.BLOCO):
+                saldos = self._somar(saldos, self._agregar(registros[i:min(fim, i + self.BLOCO)]))
+            if fim in self._checkpoints:
+                chaves, valores = self._ler_checkpoint(fim)
+                if not (np.array_equal(chaves, saldos[0]) and np.array_equal(valores, saldos[1])): divergentes.append(fim)
+            inicio = fim
+        return saldos[0], saldos[1], divergentes
+
+class TravaCompartilhada:
+    # Leitores/escritor: operações entram em modo compartilhado (em paralelo),
+    # a compactação em modo exclusivo para ver um estado consistente.
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._compartilhados = 0
+        self._exclusivo = False
+        self._exclusivos_esperando = 0
+
+    @contextmanager
+    def compartilhada(self):
+        with self._cond:
+            # Prioridade para o exclusivo, senão a compactação nunca entra sob carga
+            while self._exclusivo or self._exclusivos_esperando:
+                self._cond.wait()
+            self._compartilhados += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._compartilhados -= 1
+                if not self._compartilhados: self._cond.notify_all()
+
+    @contextmanager
+    def exclusiva(self):
+        with self._cond:
+            self._exclusivos_esperando += 1
+            while self._exclusivo or self._compartilhados:
+                self._cond.wait()
+            self._exclusivos_esperando -= 1
+            self._exclusivo = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusivo = False
+                self._cond.notify_all()
+
+class Senhas:
+    # Senhas guardadas como "scrypt$n$r$p$sal$chave" (hex). Registros antigos em
+    # texto puro continuam aceitos e são convertidos no primeiro login.
+    N, R, P = 2 ** 14, 8, 1
+    _FORMATO = re.compile(r"scrypt\$(\d{1,7})\$(\d{1,2})\$(\d{1,2})\$([0-9a-f]{32})\$([0-9a-f]{64})")
 
-    def _ler(self):
+    @staticmethod
+    def gerar(senha):
+        sal = os.urandom(16)
+        chave = hashlib.scrypt(senha.encode(), salt=sal, n=Senhas.N, r=Senhas.R, p=Senhas.P, dklen=32)
+        return f"scrypt${Senhas.N}${Senhas.R}${Senhas.P}${sal.hex()}${chave.hex()}"
+
+    @staticmethod
+    def eh_hash(valor):
+        # Só o formato exato do gerar(); uma senha em texto que comece com "scrypt$" não é hash
+        m = Senhas._FORMATO.fullmatch(valor)
+        if not m: return False
+        n, r, p = int(m[1]), int(m[2]), int(m[3])
+        return n > 1 and n & (n - 1) == 0 and r > 0 and p > 0
+
+    @staticmethod
+    def verificar(senha, armazenado):
+        if not Senhas.eh_hash(armazenado): return hmac.compare_digest(senha.encode(), armazenado.encode())
+        _, n, r, p, sal, chave = armazenado.split("$")
         try:
-            with open(self.arquivo, "r", encoding='utf-8') as f: return json.load(f)
-        except: return []
+            calculada = hashlib.scrypt(senha.encode(), salt=bytes.fromhex(sal), n=int(n), r=int(r), p=int(p), dklen=len(chave) // 2)
+        except ValueError:
+            return False  # parâmetros além do limite de memória do scrypt
+        return hmac.compare_digest(calculada.hex(), chave)
 
-    def _salvar(self, dados):
-        with open(self.arquivo, "w", encoding='utf-8') as f: json.dump(dados, f, indent=4, ensure_ascii=False)
+class BancoBackend:
+    TRAVAS = 4096
+    def __init__(self, arquivo="bank_data.json", fsync=True, limite_compactacao=5000, ttl_sessao=900, limite_cache_senhas=10_000,
+                 intervalo_checkpoint=100_000):
+        self.arquivo = arquivo
+        self.limite_compactacao = limite_compactacao
+        self.ttl_sessao = ttl_sessao
+        self.limite_cache_senhas = limite_cache_senhas
+        self._armazenamento = MotorArmazenamento(os.path.splitext(arquivo)[0], fsync)
+        self._armazenamento.travar_processo()
+        self._historico = HistoricoTransacoes(os.path.splitext(arquivo)[0] + ".extrato")
+        self._razao = Razao(os.path.splitext(arquivo)[0], intervalo_checkpoint)  # partidas dobradas
+        self._local = threading.local()  # lançamentos do extrato ainda não commitados
+
+        # Concorrência: travas por conta (tabela fixa indexada pelo hash do CPF, não
+        # cresce com chaves inexistentes) + barreira para a compactação + trava do log
+        self._barreira = TravaCompartilhada()
+        self._travas = [threading.Lock() for _ in range(self.TRAVAS)]
+        self._trava_log = threading.Lock()
+        self._trava_compactacao = threading.Lock()
+
+        self._contas = {}  # índice residente: cpf -> conta
+        self._detentores = {}  # ticker -> cpfs com posição (job de dividendos)
+        self._observadores = []  # recebem cada evento commitado (valorização, métricas...)
+        self._pendentes = {}  # id -> pix entre fragmentos preparado aqui, aguardando decisão
+
+        # Autenticação: o KDF custa dezenas de ms, então logins repetidos dentro do ttl
+        # batem num cache (cpf + HMAC da senha com chave do processo) e operações
+        # autenticadas usam um token de sessão
+        self._trava_sessoes = threading.Lock()
+        self._chave_cache = os.urandom(32)
+        self._verificados = {}  # (cpf, hmac) -> (hash armazenado, expira em)
+        self._sessoes = {}  # token -> (cpf, expira em)
+        self._executor = None
+        self._seq = 0
+        self._carregar()
+
+        # Compactação (snapshot + descarte do log) roda em segundo plano
+        self._encerrando = False
+        self._pedido_compactacao = threading.Event()
+        self._compactador = threading.Thread(target=self._loop_compactacao, daemon=True)
+        self._compactador.start()
+        self._agendador = None
+        self._parar_agendador = threading.Event()
+
+    # --- Persistência ---
+    def _carregar(self):
+        usuarios = []
+        if self._armazenamento.existe():
+            self._seq, usuarios, extras = self._armazenamento.ler_snapshot()
+            self._pendentes = {ev["id"]: ev for ev in extras.get("pendentes", [])}
+        elif os.path.exists(self.arquivo):
+            # Primeira execução sobre um bank_data.json antigo: importa
+            usuarios = self._ler()
+        self._historico.carregar(self._seq)
+        self._razao.carregar(self._seq)
+        self._indexar(usuarios)
+        # Razão novo sobre contas que já existem: os saldos atuais entram como abertura
+        if self._razao.vazio(): self._razao.anexar(self._seq, self._partidas_abertura())
+        for evento in self._armazenamento.ler_eventos(self._seq):
+            self._aplicar(evento)
+            self._seq = evento["seq"]
+            lancamentos = self._coletar_lancamentos()
+            # O extrato e as partidas deste evento podem já ter sido gravados antes da queda
+            if evento["seq"] not in self._historico.seqs_recentes: self._historico.anexar(evento["seq"], lancamentos)
+            if evento["seq"] not in self._razao.seqs_recentes: self._razao.anexar(evento["seq"], self._partidas(evento))
+        self._armazenamento.abrir()
+        # Começa sempre com snapshot atualizado e log vazio
+        self.compactar()
+
+    @Metricas.instrumentar("operacao", op="ler_json")
+    def _ler(self, caminho=None):
+        # Arquivo inexistente é banco vazio; JSON inválido é erro (nunca zera o banco)
+        caminho = caminho or self.arquivo
+        try:
+            with open(caminho, "r", encoding='utf-8') as f: dados = json.load(f)
+        except FileNotFoundError: return []
+        if Metricas.ativo: Metricas.contar("bytes_lidos", os.path.getsize(caminho), arquivo="json")
+        return dados
+
+    @Metricas.instrumentar("operacao", op="salvar_json")
+    def _salvar(self, dados, caminho=None):
+        # Escrita atômica: arquivo temporário + rename
+        caminho = caminho or self.arquivo
+        tmp = caminho + ".tmp"
+        with open(tmp, "w", encoding='utf-8') as f:
+            json.dump(dados, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, caminho)
+        if Metricas.ativo: Metricas.contar("bytes_escritos", os.path.getsize(caminho), arquivo="json")
+
+    def _indexar(self, usuarios):
+        self._contas = {}
+        self._detentores = {}
+        migrados = []
+        for u in usuarios:
+            if isinstance(u, dict):
+                # Formato JSON: extrato embutido na conta vai para o HistoricoTransacoes
+                extrato = u.pop("extrato", None)
+                if extrato and not self._historico.total(u["cpf"]):
+                    migrados.extend((u["cpf"], t["data"], t["tipo"], t["valor"], t.get("detalhe", "")) for t in reversed(extrato))
+                u = Conta.de_dict(u)
+            self._contas[u.cpf] = u
+            for t in u.investimentos: self._detentores.setdefault(Tickers.nome_de(t), set()).add(u.cpf)
+        self._historico.anexar(0, migrados)
+
+    def exportar_json(self, caminho=None):
+        # Mantém o formato antigo (lista de usuários) para backup/inspeção
+        with self._barreira.exclusiva():
+            dados = [c.para_dict() for c in self._contas.values()]
+            for u in dados: u["extrato"] = self._historico.todos(u["cpf"])
+        self._salvar(dados, caminho)
+
+    def importar_json(self, caminho=None):
+        self.compactar(self._ler(caminho))
+
+    @Metricas.instrumentar("operacao", op="compactar")
+    def compactar(self, usuarios=None):
+        # usuarios: substitui o estado inteiro antes do snapshot (importação)
+        with self._trava_compactacao:
+            with self._barreira.exclusiva():
+                if usuarios is not None:
+                    self._historico.limpar()
+                    self._indexar(usuarios)
+                    self._pendentes = {}
+                    self._razao.limpar()
+                    self._razao.anexar(self._seq, self._partidas_abertura())
+                    self._notificar([{"op": "recarga"}])
+                # Extrato e razão duráveis até esta seq antes de o snapshot descartar o log
+                self._historico.sincronizar()
+                self._razao.sincronizar()
+                conteudo = CodecContas.serializar(self._seq, list(self._contas.values()), {"pendentes": list(self._pendentes.values())})
+                self._armazenamento.rotacionar()
+                if usuarios is not None:
+                    # O log antigo não vale para o novo estado: snapshot antes de liberar
+                    self._armazenamento.gravar_snapshot(conteudo)
+                    return
+            self._armazenamento.gravar_snapshot(conteudo)
+            if self._razao.checkpoint_pendente(): self._razao.fazer_checkpoint()
+
+    def observar(self, callback):
+        # callback(evento) é chamado após cada commit, ainda com as contas do evento
+        # travadas (precisa ser rápido e não pode chamar o backend). Recebe primeiro um
+        # {"op": "recarga"}, sem commits em andamento, para montar o estado inicial
+        # a partir de _contas; o mesmo acontece depois de uma importação.
+        with self._barreira.exclusiva():
+            callback({"op": "recarga"})
+            self._observadores.append(callback)
+
+    def _notificar(self, eventos):
+        for callback in self._observadores:
+            for ev in eventos: callback(ev)
+
+    def medidores(self):
+        # Valores instantâneos para o dump de métricas: [(nome, rótulos, valor)]
+        arquivos = {"snapshot": self._armazenamento.arquivo_snapshot, "wal": self._armazenamento.arquivo_log,
+                    "extrato": self._historico.arquivo, "json": self.arquivo}
+        with self._trava_sessoes: sessoes = len(self._sessoes)
+        return [("contas", {}, len(self._contas)), ("seq", {}, self._seq),
+                ("eventos_no_log", {}, self._armazenamento.eventos_no_log), ("sessoes_abertas", {}, sessoes)] + \
+               [("arquivo_bytes", {"arquivo": nome}, os.path.getsize(c)) for nome, c in arquivos.items() if os.path.exists(c)]
+
+    def metricas(self, formato="prometheus"):
+        # Dump das métricas do processo + medidores deste banco ("prometheus" ou "json")
+        if formato == "json": return Metricas.como_json(self.medidores())
+        return Metricas.como_prometheus(self.medidores())
+
+    def _loop_compactacao(self):
+        while True:
+            self._pedido_compactacao.wait()
+            self._pedido_compactacao.clear()
+            if self._encerrando: return
+            self.compactar()
+
+    def fechar(self):
+        if self._agendador:
+            self._parar_agendador.set()
+            self._agendador.join()
+        self._encerrando = True
+        self._pedido_compactacao.set()
+        self._compactador.join()
+        if self._armazenamento.eventos_no_log: self.compactar()
+        self._armazenamento.fechar()
+        self._historico.fechar()
+        self._razao.fechar()
+        if self._executor: self._executor.shutdown()
+
+    def em_segundo_plano(self, funcao, *args):
+        # Pool de trabalhadores para o que não pode rodar na thread do Tk (KDF de senha...)
+        return self._pool().submit(funcao, *args)
+
+    def _pool(self):
+        with self._trava_sessoes:
+            if self._executor is None: self._executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1) + 1)
+            return self._executor
+
+    def _trava_conta(self, cpf):
+        return hash(cpf) % self.TRAVAS
+
+    @contextmanager
+    def _transacao(self, *cpfs):
+        # Trava as contas envolvidas sempre na mesma ordem (Pix cruzados não dão deadlock).
+        # Contas que caem na mesma trava a pegam uma vez só.
+        travas = [self._travas[i] for i in sorted({self._trava_conta(c) for c in cpfs})]
+        with self._barreira.compartilhada():
+            for t in travas: t.acquire()
+            try:
+                yield
+            finally:
+                for t in reversed(travas): t.release()
+
+    def _commit(self, evento):
+        # Write-ahead: o evento fica durável no log antes de alterar a memória.
+        # Chamar dentro de _transacao com as contas do evento travadas.
+        with self._trava_log:
+            self._seq += 1
+            evento = {"seq": self._seq, **evento}
+            posicao = self._armazenamento.anexar(evento)
+        self._armazenamento.sincronizar(posicao)
+        self._aplicar(evento)
+        self._historico.anexar(evento["seq"], self._coletar_lancamentos())
+        self._razao.anexar(evento["seq"], self._partidas(evento))
+        self._notificar([evento])
+        if self._armazenamento.eventos_no_log >= self.limite_compactacao:
+            self._pedido_compactacao.set()
+
+    def _aplicar(self, evento):
+        getattr(self, "_aplicar_" + evento["op"])(evento)
 
     def _get_timestamp(self):
         return datetime.now().strftime("%d/%m/%Y %H:%M")
 
+    def _buscar(self, cpf):
+        return self._contas.get(cpf)
+
+    _PONTUACAO_CPF = str.maketrans("", "", ".-/ ")
+
+    @staticmethod
+    def _limpar_cpf(cpf):
+        # Caminho rápido para o formato usual (000.000.000-00); o resto cai no filtro
+        limpo = cpf.translate(BancoBackend._PONTUACAO_CPF)
+        if limpo.isdigit() and limpo.isascii(): return limpo
+        return ''.join(c for c in cpf if "0" <= c <= "9")
+
     # --- NOVA FUNÇÃO DE VALIDAÇÃO DE CPF ---
     def _validar_cpf_real(self, cpf):
         # Remove caracteres não numéricos
-        cpf = ''.join(filter(str.isdigit, cpf))
+        cpf = self._limpar_cpf(cpf)
 
         # Verifica tamanho e se todos os números são iguais
         if len(cpf) != 11 or cpf == cpf[0] * 11:
             return False
 
-        # Cálculo do primeiro dígito verificador
-        soma = sum(int(cpf[i]) * (10 - i) for i in range(9))
-        resto = soma % 11
-        dv1 = 0 if resto < 2 else 11 - resto
-        if dv1 != int(cpf[9]):
+        # Dígitos verificadores (pesos 10..2 e 11..2)
+        d = [ord(c) - 48 for c in cpf]
+        resto = (d[0] * 10 + d[1] * 9 + d[2] * 8 + d[3] * 7 + d[4] * 6 + d[5] * 5 + d[6] * 4 + d[7] * 3 + d[8] * 2) % 11
+        if d[9] != (0 if resto < 2 else 11 - resto):
             return False
+        resto = (d[0] * 11 + d[1] * 10 + d[2] * 9 + d[3] * 8 + d[4] * 7 + d[5] * 6 + d[6] * 5 + d[7] * 4 + d[8] * 3 + d[9] * 2) % 11
+        return d[10] == (0 if resto < 2 else 11 - resto)
 
-        # Cálculo do segundo dígito verificador
-        soma = sum(int(cpf[i]) * (11 - i) for i in range(10))
-        resto = soma % 11
-        dv2 = 0 if resto < 2 else 11 - resto
-        if dv2 != int(cpf[10]):
-            return False
-
-        return True
-
+    @staticmethod
+    def _validar_cpfs(cpfs):
+        # Versão vetorizada para lotes de CPFs já limpos: devolve um array de bool
+        validos = np.zeros(len(cpfs), dtype=bool)
+        tamanho_ok = np.fromiter((len(c) == 11 for c in cpfs), dtype=bool, count=len(cpfs))
+        indices = np.flatnonzero(tamanho_ok)
+        if not len(indices): return validos
+        d = (np.frombuffer("".join([cpfs[i] for i in indices]).encode("ascii"), dtype=np.uint8)
+             .reshape(-1, 11).astype(np.int64) - 48)
+        dv1 = d[:, :9] @ np.arange(10, 1, -1) % 11
+        dv1 = np.where(dv1 < 2, 0, 11 - dv1)
+        dv2 = d[:, :10] @ np.arange(11, 1, -1) % 11
+        dv2 = np.where(dv2 < 2, 0, 11 - dv2)
+        repetidos = (d == d[:, :1]).all(axis=1)
+        validos[indices] = (dv1 == d[:, 9]) & (dv2 == d[:, 10]) & ~repetidos
+        return validos
+
+    @Metricas.instrumentar("operacao", op="login")
     def login(self, cpf, senha):
         # Limpa o CPF para login também
-        cpf_limpo = ''.join(filter(str.isdigit, cpf))
-        users = self._ler()
-        for u in users:
-            # Compara com o CPF limpo do banco
-            if u["cpf"] == cpf_limpo and u["senha"] == senha:
-                if "extrato" not in u: u["extrato"] = []
-                if "investimentos" not in u: u["investimentos"] = {}
-                if "dividendos_recebidos" not in u: u["dividendos_recebidos"] = {}
-                return True, u
-        return False, "Credenciais inválidas."
+        cpf_limpo = self._limpar_cpf(cpf)
+        u = self._buscar(cpf_limpo)
+        # O KDF roda fora da trava da conta (não segura Pix/ordens por dezenas de ms)
+        if not u or not self._conferir_senha(u, senha): return False, "Credenciais inválidas."
+        with self._transacao(cpf_limpo):
+            return True, u.para_dict()
+
+    @Metricas.instrumentar("operacao", op="verificar_senha")
+    def _conferir_senha(self, u, senha):
+        armazenado = u.senha
+        chave = (u.cpf, hmac.new(self._chave_cache, senha.encode(), "sha256").digest())
+        agora = time.monotonic()
+        with self._trava_sessoes:
+            entrada = self._verificados.get(chave)
+            # Vale só enquanto a senha guardada for a mesma que foi conferida
+            if entrada and entrada[0] == armazenado and entrada[1] > agora: return True
+        if not Senhas.verificar(senha, armazenado): return False
+        if not Senhas.eh_hash(armazenado):
+            # Registro antigo em texto puro: passa a guardar o hash
+            armazenado = Senhas.gerar(senha)
+            evento = {"op": "senha", "cpf": u.cpf, "senha": armazenado}
+            with self._transacao(u.cpf):
+                if not self._validar(evento): self._commit(evento)
+        with self._trava_sessoes:
+            if len(self._verificados) >= self.limite_cache_senhas: del self._verificados[next(iter(self._verificados))]
+            self._verificados[chave] = (armazenado, agora + self.ttl_sessao)
+        return True
 
+    def abrir_sessao(self, cpf, senha):
+        # Devolve (True, token) para operações autenticadas sem refazer o KDF
+        ok, resposta = self.login(cpf, senha)
+        if not ok: return ok, resposta
+        token = secrets.token_urlsafe(32)
+        agora = time.monotonic()
+        with self._trava_sessoes:
+            if len(self._sessoes) >= self.limite_cache_senhas:
+                self._sessoes = {t: s for t, s in self._sessoes.items() if s[1] > agora}
+                # Todas ainda válidas: derruba a mais antiga (ordem de inserção)
+                while len(self._sessoes) >= self.limite_cache_senhas: del self._sessoes[next(iter(self._sessoes))]
+            self._sessoes[token] = (resposta["cpf"], agora + self.ttl_sessao)
+        return True, token
+
+    def sessao(self, token):
+        # CPF dono do token, ou None se não existe/expirou
+        with self._trava_sessoes:
+            entrada = self._sessoes.get(token)
+            if not entrada: return None
+            if entrada[1] <= time.monotonic():
+                del self._sessoes[token]
+                return None
+            return entrada[0]
+
+    def encerrar_sessao(self, token):
+        with self._trava_sessoes: self._sessoes.pop(token, None)
+
+    @Metricas.instrumentar("operacao", op="cadastro")
     def cadastrar(self, nome, cpf, senha):
-        # Limpa o CPF recebido (remove pontos e traços)
-        cpf_limpo = ''.join(filter(str.isdigit, cpf))
+        # Limpa o CPF recebido (remove pontos e traços) e salva apenas os números no banco
+        evento = {"op": "cadastro", "nome": nome, "cpf": self._limpar_cpf(cpf), "senha": Senhas.gerar(senha)}
+        with self._transacao(evento["cpf"]):
+            erro = self._validar(evento)
+            if erro: return False, erro
+            self._commit(evento)
+        return True, "Conta criada com sucesso."
+
+    @Metricas.instrumentar("operacao", op="importar_csv")
+    def importar_csv(self, caminho, tamanho_lote=50_000, progresso=None, hash_senhas=True):
+        # Onboarding em massa: lê o CSV (colunas nome, cpf, senha) em blocos, valida os
+        # CPFs de cada bloco de uma vez, descarta duplicados (no arquivo e no banco) e
+        # grava cada bloco como um único registro no log. progresso(relatorio) é chamado
+        # a cada bloco. Devolve o relatório com as linhas rejeitadas e a vazão.
+        # Senhas em texto passam pelo KDF no pool de trabalhadores; com hash_senhas=False
+        # ficam como vieram e são convertidas no primeiro login de cada cliente.
+        relatorio = {"lidas": 0, "importadas": 0, "invalidas": [], "duplicadas": [], "segundos": 0.0, "contas_por_segundo": 0.0}
+        # A carga cria milhões de objetos sem ciclos: o coletor só gastaria tempo varrendo
+        gc_ativo = gc.isenabled()
+        gc.disable()
+        try:
+            self._importar_csv(caminho, tamanho_lote, progresso, hash_senhas, relatorio)
+        finally:
+            if gc_ativo: gc.enable()
+        return relatorio
+
+    def _importar_csv(self, caminho, tamanho_lote, progresso, hash_senhas, relatorio):
+        inicio = time.perf_counter()
+        vistos = set()
+        with open(caminho, newline="", encoding="utf-8") as f:
+            leitor = csv.reader(f)
+            cabecalho = [c.strip().lower() for c in next(leitor, [])]
+            if not {"nome", "cpf", "senha"} <= set(cabecalho): raise ValueError("CSV precisa das colunas nome, cpf e senha.")
+            i_nome, i_cpf, i_senha = cabecalho.index("nome"), cabecalho.index("cpf"), cabecalho.index("senha")
+            bloco = []
+            for numero, linha in enumerate(leitor, start=2):
+                bloco.append((numero, linha))
+                if len(bloco) >= tamanho_lote:
+                    self._importar_bloco(bloco, i_nome, i_cpf, i_senha, vistos, hash_senhas, relatorio)
+                    bloco = []
+                    self._medir_importacao(relatorio, inicio, progresso)
+            if bloco: self._importar_bloco(bloco, i_nome, i_cpf, i_senha, vistos, hash_senhas, relatorio)
+        self._medir_importacao(relatorio, inicio, progresso)
+
+    def _medir_importacao(self, relatorio, inicio, progresso):
+        relatorio["segundos"] = time.perf_counter() - inicio
+        relatorio["contas_por_segundo"] = relatorio["lidas"] / relatorio["segundos"] if relatorio["segundos"] else 0.0
+        if progresso: progresso(relatorio)
+
+    def _importar_bloco(self, bloco, i_nome, i_cpf, i_senha, vistos, hash_senhas, relatorio):
+        relatorio["lidas"] += len(bloco)
+        largura = max(i_nome, i_cpf, i_senha)
+        candidatos = []
+        for numero, linha in bloco:
+            if len(linha) <= largura:
+                relatorio["invalidas"].append((numero, "Linha malformada."))
+            elif not linha[i_nome].strip():
+                relatorio["invalidas"].append((numero, "Nome vazio."))
+            else:
+                candidatos.append((numero, linha[i_nome].strip(), self._limpar_cpf(linha[i_cpf]), linha[i_senha]))
+        validos = self._validar_cpfs([c[2] for c in candidatos])
+        novos = []
+        for (numero, nome, cpf, senha), ok in zip(candidatos, validos.tolist()):
+            if not ok: relatorio["invalidas"].append((numero, "CPF inválido."))
+            elif cpf in vistos: relatorio["duplicadas"].append((numero, cpf))
+            else:
+                vistos.add(cpf)
+                novos.append((numero, {"op": "cadastro", "nome": nome, "cpf": cpf, "senha": senha}))
+        if not novos: return
+        if hash_senhas:
+            textos = [ev for _, ev in novos if not Senhas.eh_hash(ev["senha"])]
+            for ev, senha in zip(textos, self._pool().map(Senhas.gerar, [ev["senha"] for ev in textos])): ev["senha"] = senha
+        # Contas novas não têm trava própria ainda: o bloco entra com a barreira
+        # exclusiva (uma pausa curta no resto do banco) e confere o índice de novo
+        with self._barreira.exclusiva():
+            eventos = []
+            for numero, ev in novos:
+                if ev["cpf"] in self._contas: relatorio["duplicadas"].append((numero, ev["cpf"]))
+                else: eventos.append(ev)
+            for ev in eventos: self._aplicar(ev)
+            try:
+                if eventos: self._commit_lote(eventos)
+            except Exception:
+                for ev in eventos: self._contas.pop(ev["cpf"], None)
+                raise
+        relatorio["importadas"] += len(eventos)
+
+    def registrar_transacao(self, usuario, tipo, valor, detalhe="", data=None):
+        # Fica pendente na thread até o commit, que grava com a seq do evento
+        self._lancamentos().append((usuario.cpf, data or self._get_timestamp(), tipo, valor, detalhe))
+
+    def _lancamentos(self):
+        if not hasattr(self._local, "lancamentos"): self._local.lancamentos = []
+        return self._local.lancamentos
+
+    def _coletar_lancamentos(self):
+        lancamentos = self._lancamentos()
+        self._local.lancamentos = []
+        return lancamentos
+
+    def total_extrato(self, cpf):
+        return self._historico.total(cpf)
+
+    @Metricas.instrumentar("operacao", op="extrato")
+    def consultar_extrato(self, cpf, cursor=None, limite=50, desde=None, ate=None, tipos=None):
+        # Página do extrato (mais recentes primeiro) -> (itens, proximo_cursor)
+        return self._historico.consultar(cpf, cursor, limite, desde, ate, tipos)
+
+    @Metricas.instrumentar("operacao", op="deposito_saque")
+    def deposito_saque(self, cpf, valor, tipo):
+        # -> (saldo, página do extrato) ou (None, mensagem de erro)
+        evento = {"op": "movimento", "cpf": cpf, "valor": valor, "tipo": tipo, "data": self._get_timestamp()}
+        with self._transacao(cpf):
+            erro = self._validar(evento)
+            if erro: return None, erro
+            self._commit(evento)
+            return Dinheiro.reais(self._contas[cpf].saldo), self.consultar_extrato(cpf)[0]
+
+    @Metricas.instrumentar("operacao", op="pix")
+    def realizar_pix(self, cpf_remetente, cpf_destinatario, valor):
+        # Limpa o CPF de destino caso o usuário digite com pontos
+        evento = {"op": "pix", "de": cpf_remetente, "para": self._limpar_cpf(cpf_destinatario), "valor": valor, "data": self._get_timestamp()}
+        with self._transacao(evento["de"], evento["para"]):
+            erro = self._validar(evento)
+            if erro: return False, erro
+            self._commit(evento)
+            return True, Dinheiro.reais(self._contas[cpf_remetente].saldo)
+
+    @Metricas.instrumentar("operacao", op="investir")
+    def investir(self, cpf, ticker, qtd, preco_unitario, tipo="compra", versao_cotacao=None):
+        # versao_cotacao: versão do snapshot do CacheCotacoes usado para precificar
+        evento = {"op": "investimento", "cpf": cpf, "ticker": ticker, "qtd": qtd, "preco": preco_unitario, "tipo": tipo, "data": self._get_timestamp()}
+        if versao_cotacao is not None: evento["versao_cotacao"] = versao_cotacao
+        with self._transacao(cpf):
+            erro = self._validar(evento)
+            if erro: return False, erro
+            self._commit(evento)
+            return True, self._contas[cpf].para_dict()
+
+    @Metricas.instrumentar("operacao", op="liquidar_negocio")
+    def liquidar_negocio(self, comprador, vendedor, ticker, qtd, preco):
+        # Negócio fechado no livro de ofertas: a compra e a venda vão juntas num único
+        # registro do log. Devolve (True, None) ou (False, cpf da parte sem saldo/ações).
+        data = self._get_timestamp()
+        eventos = [
+            {"op": "investimento", "cpf": comprador, "ticker": ticker, "qtd": qtd, "preco": preco, "tipo": "compra", "data": data},
+            {"op": "investimento", "cpf": vendedor, "ticker": ticker, "qtd": qtd, "preco": preco, "tipo": "venda", "data": data}
+        ]
+        with self._transacao(comprador, vendedor):
+            for ev in eventos:
+                if self._validar(ev): return False, ev["cpf"]
+            pontos = {cpf: self._ponto_restauracao(cpf) for cpf in (comprador, vendedor)}
+            for ev in eventos: self._aplicar(ev)
+            try:
+                self._commit_lote(eventos)
+            except Exception:
+                self._restaurar(pontos)
+                self._coletar_lancamentos()
+                raise
+        return True, None
+
+    def _dividendos_devidos(self, user, info_div, hoje, tickers=None):
+        pagamentos = []
+        for ticker, d_mercado in info_div.items():
+            if tickers is not None and ticker not in tickers: continue
+            posicao = user.posicao(ticker)
+            if posicao and posicao.qtd > 0:
+                chave = f"{ticker}_{d_mercado['data']}"
+                if d_mercado["data_obj"] <= hoje and Conta.chave_dividendo(chave) not in user.dividendos:
+                    val = d_mercado["valor"] * posicao.qtd
+                    pagamentos.append({"ticker": ticker, "valor": val, "chave": chave})
+        return pagamentos
 
+    @Metricas.instrumentar("operacao", op="dividendos_conta")
+    def processar_pagamentos_dividendos(self, cpf):
+        info_div = MarketAPI.get_info_dividendos()
+        hoje = datetime.now().date()
+        with self._transacao(cpf):
+            user = self._buscar(cpf)
+            if not user: return False, 0, [], None
+            pagamentos = self._dividendos_devidos(user, info_div, hoje)
+            if pagamentos:
+                self._commit({"op": "dividendos", "cpf": cpf, "pagamentos": pagamentos, "data": self._get_timestamp()})
+                total_pago = sum(p["valor"] for p in pagamentos)
+                lista = [f"{p['ticker']}: R$ {p['valor']:.2f}" for p in pagamentos]
+                return True, total_pago, lista, user.para_dict()
+            return False, 0, [], user.para_dict()
+
+    @Metricas.instrumentar("operacao", op="dividendos_job")
+    def pagar_dividendos(self, hoje=None):
+        # Job do banco inteiro: para cada ticker com pagamento vencido, credita todos os
+        # detentores (índice ticker -> cpfs) num único commit. Idempotente: quem já tem
+        # a chave em dividendos_recebidos é ignorado. Devolve (contas pagas, total).
+        info_div = MarketAPI.get_info_dividendos()
+        hoje = hoje or datetime.now().date()
+        vencidos = {t for t, d in info_div.items() if d["data_obj"] <= hoje}
+        cpfs = set()
+        for ticker in vencidos: cpfs.update(self._detentores.get(ticker, ()))
+        if not cpfs: return 0, 0
+
+        data = self._get_timestamp()
+        with self._transacao(*cpfs):
+            # Recalcula com as contas travadas (posições podem ter mudado)
+            eventos = []
+            for cpf in cpfs:
+                user = self._buscar(cpf)
+                pagamentos = self._dividendos_devidos(user, info_div, hoje, vencidos) if user else []
+                if pagamentos: eventos.append({"op": "dividendos", "cpf": cpf, "pagamentos": pagamentos, "data": data})
+            pontos = {ev["cpf"]: self._ponto_restauracao(ev["cpf"]) for ev in eventos}
+            try:
+                for ev in eventos: self._aplicar(ev)
+                if eventos: self._commit_lote(eventos)
+            except Exception:
+                # Créditos fora do log não podem ficar na memória
+                self._restaurar(pontos)
+                self._coletar_lancamentos()
+                raise
+        return len(eventos), sum(p["valor"] for ev in eventos for p in ev["pagamentos"])
+
+    def agendar_dividendos(self, intervalo=3600):
+        # Roda pagar_dividendos periodicamente até fechar()
+        def loop():
+            while not self._parar_agendador.is_set():
+                try:
+                    self.pagar_dividendos()
+                except Exception:
+                    # Uma rodada com erro não pode parar os pagamentos seguintes
+                    traceback.print_exc()
+                    if Metricas.ativo: Metricas.contar("erros", job="dividendos")
+                self._parar_agendador.wait(intervalo)
+        self._agendador = threading.Thread(target=loop, daemon=True)
+        self._agendador.start()
+
+    # --- Lotes (folha de pagamento, Pix em massa, ordens em bloco) ---
+    @Metricas.instrumentar("operacao", op="lote")
+    def executar_lote(self, operacoes, modo="tudo_ou_nada"):
+        # operacoes: dicts {"op": "deposito"|"saque"|"pix"|"compra"|"venda"|"cadastro", ...}
+        # modo "tudo_ou_nada": qualquer erro desfaz o lote inteiro
+        # modo "melhor_esforco": aplica o que for válido e reporta o resto
+        # Tudo que for aplicado vai para o log num único registro (um commit durável).
+        if modo not in ("tudo_ou_nada", "melhor_esforco"): raise ValueError(f"Modo de lote inválido: {modo}")
+        data = self._get_timestamp()
+        eventos, resultados = [], []
+        for op in operacoes:
+            try:
+                eventos.append(self._montar_evento(op, data))
+                resultados.append((True, None))
+            except (KeyError, TypeError, ValueError) as e:
+                eventos.append(None)
+                resultados.append((False, str(e) if isinstance(e, ValueError) else "Operação inválida."))
+
+        cpfs = [c for ev in eventos if ev for c in self._cpfs_evento(ev)]
+        with self._transacao(*cpfs):
+            pontos, aplicados = {}, []
+            try:
+                for i, ev in enumerate(eventos):
+                    if ev is None: continue
+                    erro = self._validar(ev)
+                    if erro:
+                        resultados[i] = (False, erro)
+                        continue
+                    for cpf in self._cpfs_evento(ev):
+                        if cpf not in pontos: pontos[cpf] = self._ponto_restauracao(cpf)
+                    self._aplicar(ev)
+                    aplicados.append(ev)
+            except Exception:
+                # Nada foi para o log: desfaz o que já estava aplicado em memória
+                self._restaurar(pontos)
+                self._coletar_lancamentos()
+                raise
+
+            falhou = any(not ok for ok, _ in resultados)
+            if falhou and modo == "tudo_ou_nada":
+                self._restaurar(pontos)
+                self._coletar_lancamentos()
+                resultados = [r if not r[0] else (False, "Não aplicado (lote cancelado).") for r in resultados]
+                return False, resultados
+            if aplicados:
+                try:
+                    self._commit_lote(aplicados)
+                except Exception:
+                    self._restaurar(pontos)
+                    self._coletar_lancamentos()
+                    raise
+        return not falhou, resultados
+
+    def _montar_evento(self, op, data):
+        tipo = op["op"]
+        if tipo in ("deposito", "saque"):
+            valor = float(op["valor"])
+            if not math.isfinite(valor) or Dinheiro.centavos(valor) <= 0: raise ValueError("Valor inválido.")
+            if tipo == "saque": return {"op": "movimento", "cpf": op["cpf"], "valor": -valor, "tipo": "Saque", "data": data}
+            return {"op": "movimento", "cpf": op["cpf"], "valor": valor, "tipo": "Deposito", "data": data}
+        if tipo == "pix":
+            valor = float(op["valor"])
+            if not math.isfinite(valor) or Dinheiro.centavos(valor) <= 0: raise ValueError("Valor inválido.")
+            return {"op": "pix", "de": op["de"], "para": self._limpar_cpf(op["para"]), "valor": valor, "data": data}
+        if tipo in ("compra", "venda"):
+            preco = float(op["preco"])
+            if not math.isfinite(preco) or preco <= 0: raise ValueError("Preço inválido.")
+            if op["ticker"] not in MarketAPI.EMPRESAS: raise ValueError("Ticker não encontrado.")
+            evento = {"op": "investimento", "cpf": op["cpf"], "ticker": op["ticker"], "qtd": int(op["qtd"]), "preco": preco, "tipo": tipo, "data": data}
+            if op.get("versao_cotacao") is not None: evento["versao_cotacao"] = op["versao_cotacao"]
+            return evento
+        if tipo == "cadastro":
+            # Senha vinda da API é sempre texto: hash pronto só entra por importação
+            return {"op": "cadastro", "nome": op["nome"], "cpf": self._limpar_cpf(op["cpf"]), "senha": Senhas.gerar(op["senha"])}
+        raise ValueError(f"Operação desconhecida: {tipo}")
+
+    def _cpfs_evento(self, ev):
+        if ev["op"] == "pix": return (ev["de"], ev["para"])
+        return (ev["cpf"],)
+
+    def _ponto_restauracao(self, cpf):
+        # Cópia rasa do que um evento pode alterar; None = conta criada dentro do lote
+        u = self._contas.get(cpf)
+        if u is None: return None
+        return u.saldo, {t: Posicao(p.qtd, p.custo) for t, p in u.investimentos.items()}, u.dividendos
+
+    def _restaurar(self, pontos):
+        for cpf, p in pontos.items():
+            if p is None:
+                self._contas.pop(cpf, None)
+                continue
+            u = self._contas[cpf]
+            for t in u.investimentos: self._detentores[Tickers.nome_de(t)].discard(cpf)
+            u.saldo, u.investimentos, u.dividendos = p
+            for t in u.investimentos: self._detentores.setdefault(Tickers.nome_de(t), set()).add(cpf)
+
+    def _commit_lote(self, eventos):
+        # Os eventos já foram aplicados sob as travas das contas; como nada fica visível
+        # antes de liberá-las, gravar o lote agora equivale ao write-ahead.
+        with self._trava_log:
+            self._seq += 1
+            registro = {"seq": self._seq, "op": "lote", "eventos": eventos}
+            posicao = self._armazenamento.anexar(registro)
+        self._armazenamento.sincronizar(posicao)
+        self._historico.anexar(registro["seq"], self._coletar_lancamentos())
+        self._razao.anexar(registro["seq"], self._partidas(registro))
+        self._notificar(eventos)
+        if self._armazenamento.eventos_no_log >= self.limite_compactacao:
+            self._pedido_compactacao.set()
+
+    # --- Validação (estado atual, contas já travadas) ---
+    def _validar(self, evento):
+        return getattr(self, "_validar_" + evento["op"])(evento)
+
+    def _validar_cadastro(self, ev):
         # 1. Validação do Algoritmo de CPF
-        if not self._validar_cpf_real(cpf_limpo):
-            return False, "CPF inválido! Verifique os números."
+        if not self._validar_cpf_real(ev["cpf"]): return "CPF inválido! Verifique os números."
+        # 2. Verifica duplicidade usando CPF limpo
+        if ev["cpf"] in self._contas: return "CPF já cadastrado."
+
+    def _validar_senha(self, ev):
+        if not self._buscar(ev["cpf"]): return "Conta não encontrada."
+
+    def _validar_movimento(self, ev):
+        u = self._buscar(ev["cpf"])
+        if not u: return "Conta não encontrada."
+        # Menos de meio centavo arredonda para zero: viraria um lançamento de R$ 0,00
+        if not math.isfinite(ev["valor"]) or not Dinheiro.centavos(ev["valor"]): return "Valor inválido."
+        if u.saldo + Dinheiro.centavos(ev["valor"]) < 0: return "Saldo insuficiente."
+
+    def _validar_pix(self, ev):
+        remetente, destinatario = self._buscar(ev["de"]), self._buscar(ev["para"])
+        if not remetente: return "Conta não encontrada."
+        if not destinatario: return "Chave Pix (CPF) não encontrada."
+        if remetente is destinatario: return "Pix para mesma conta."
+        if not math.isfinite(ev["valor"]) or Dinheiro.centavos(ev["valor"]) <= 0: return "Valor inválido."
+        if remetente.saldo < Dinheiro.centavos(ev["valor"]): return "Saldo insuficiente."
+
+    def _validar_investimento(self, ev):
+        user = self._buscar(ev["cpf"])
+        if not user: return "Conta não encontrada."
+        if ev["qtd"] <= 0: return "Qtd inválida."
+        # Preço negativo faria a compra creditar o saldo
+        if not math.isfinite(ev["preco"]) or ev["preco"] <= 0: return "Preço inválido."
+        if ev["ticker"] not in MarketAPI.EMPRESAS: return "Ticker não encontrado."
+        if ev["tipo"] == "compra":
+            if user.saldo < Dinheiro.centavos(ev["qtd"] * ev["preco"]): return "Saldo insuficiente."
+        elif ev["tipo"] == "venda":
+            posicao = user.posicao(ev["ticker"])
+            if not posicao or posicao.qtd < ev["qtd"]: return "Qtd insuficiente."
+        else:
+            return "Tipo de ordem inválido."
+
+    # --- Aplicação dos eventos (usada no commit e no replay do log) ---
+    def _aplicar_lote(self, ev):
+        for evento in ev["eventos"]: self._aplicar(evento)
+
+    def _aplicar_cadastro(self, ev):
+        self._contas[ev["cpf"]] = Conta(ev["cpf"], ev["nome"], ev["senha"])
+
+    def _aplicar_senha(self, ev):
+        self._buscar(ev["cpf"]).senha = ev["senha"]
+
+    def _aplicar_movimento(self, ev):
+        u = self._buscar(ev["cpf"])
+        u.saldo += Dinheiro.centavos(ev["valor"])
+        self.registrar_transacao(u, ev["tipo"], ev["valor"], data=ev["data"])
+
+    def _aplicar_pix(self, ev):
+        remetente, destinatario = self._buscar(ev["de"]), self._buscar(ev["para"])
+        valor = ev["valor"]
+        centavos = Dinheiro.centavos(valor)
+        remetente.saldo -= centavos
+        destinatario.saldo += centavos
+        self.registrar_transacao(remetente, "Pix Enviado", -valor, f"Para: {destinatario.nome}", ev["data"])
+        self.registrar_transacao(destinatario, "Pix Recebido", valor, f"De: {remetente.nome}", ev["data"])
+
+    def _aplicar_investimento(self, ev):
+        user = self._buscar(ev["cpf"])
+        ticker, qtd = ev["ticker"], ev["qtd"]
+        valor_total = qtd * ev["preco"]
+        centavos = Dinheiro.centavos(valor_total)
+        t = Tickers.id_de(ticker)
+        if ev["tipo"] == "compra":
+            user.saldo -= centavos
+            cart = user.investimentos.get(t)
+            if cart is None: cart = user.investimentos[t] = Posicao()
+            cart.qtd += qtd
+            cart.custo += centavos
+            self._detentores.setdefault(ticker, set()).add(user.cpf)
+            self.registrar_transacao(user, "Investimento", -valor_total, f"Compra {qtd}x {ticker}", ev["data"])
+        elif ev["tipo"] == "venda":
+            user.saldo += centavos
+            cart = user.investimentos[t]
+            restante = cart.qtd - qtd
+            if restante == 0:
+                del user.investimentos[t]
+                self._detentores[ticker].discard(user.cpf)
+            else:
+                # Venda não muda o preço médio: o custo sai na proporção das ações vendidas
+                cart.custo = (cart.custo * restante + cart.qtd // 2) // cart.qtd
+                cart.qtd = restante
+            self.registrar_transacao(user, "Resgate Inv.", valor_total, f"Venda {qtd}x {ticker}", ev["data"])
+
+    def _aplicar_dividendos(self, ev):
+        user = self._buscar(ev["cpf"])
+        for p in ev["pagamentos"]:
+            user.saldo += Dinheiro.centavos(p["valor"])
+            user.dividendos += (Conta.chave_dividendo(p["chave"]),)
+            self.registrar_transacao(user, "Dividendos", p["valor"], p["ticker"], ev["data"])
+
+    # --- Pix entre fragmentos: participante do commit em duas fases ---
+    # O coordenador (BancoFragmentado) prepara o recebedor e o pagador, grava a decisão
+    # e conclui os dois. Preparar o envio já debita o valor (fica em trânsito, sem
+    # risco de saldo negativo); o crédito só entra na conclusão. Preparados sobrevivem
+    # à compactação (vão no snapshot) e concluir é idempotente.
+    def preparar_pix(self, id, cpf, valor, papel, contraparte, nome_contraparte):
+        evento = {"op": "pix_preparar", "id": id, "cpf": cpf, "valor": valor, "papel": papel,
+                  "contraparte": contraparte, "nome_contraparte": nome_contraparte, "data": self._get_timestamp()}
+        with self._transacao(cpf):
+            erro = self._validar(evento)
+            if erro: return False, erro
+            self._commit(evento)
+        return True, None
+
+    def concluir_pix(self, id, confirmar):
+        # confirmar=False estorna. Devolve False se o id já foi concluído (ou nunca preparado)
+        pendente = self._pendentes.get(id)
+        if pendente is None: return False
+        with self._transacao(pendente["cpf"]):
+            if id not in self._pendentes: return False
+            evento = {"op": "pix_concluir", "id": id, "confirmar": confirmar, **{k: pendente[k] for k in ("cpf", "valor", "papel")},
+                      "data": self._get_timestamp()}
+            self._commit(evento)
+        return True
 
-        dados = self._ler()
-        # Verifica duplicidade usando CPF limpo
-        if any(u['cpf'] == cpf_limpo for u in dados): 
-            return False, "CPF já cadastrado."
-        
-        # Salva apenas os números no banco
-        novo_usuario = {
-            "nome": nome, 
-            "cpf": cpf_limpo, 
-            "senha": senha, 
-            "saldo": 0.0, 
-            "extrato": [], 
-            "investimentos": {}, 
-            "dividendos_recebidos": {}
-        }
-        dados.append(novo_usuario)
-        self._salvar(dados)
-        return True, "Conta criada com sucesso."
+    def pendentes(self):
+        return list(self._pendentes)
+
+    def _validar_pix_preparar(self, ev):
+        u = self._buscar(ev["cpf"])
+        if not u: return "Conta não encontrada." if ev["papel"] == "envio" else "Chave Pix (CPF) não encontrada."
+        if ev["id"] in self._pendentes: return "Transferência já preparada."
+        if not math.isfinite(ev["valor"]) or Dinheiro.centavos(ev["valor"]) <= 0: return "Valor inválido."
+        if ev["papel"] == "envio" and u.saldo < Dinheiro.centavos(ev["valor"]): return "Saldo insuficiente."
+
+    def _validar_pix_concluir(self, ev):
+        if ev["id"] not in self._pendentes: return "Transferência desconhecida."
+
+    def _aplicar_pix_preparar(self, ev):
+        if ev["papel"] == "envio": self._buscar(ev["cpf"]).saldo -= Dinheiro.centavos(ev["valor"])
+        self._pendentes[ev["id"]] = ev
+
+    def _aplicar_pix_concluir(self, ev):
+        pendente = self._pendentes.pop(ev["id"])
+        u, valor = self._buscar(ev["cpf"]), ev["valor"]
+        if ev["papel"] == "envio":
+            if ev["confirmar"]: self.registrar_transacao(u, "Pix Enviado", -valor, f"Para: {pendente['nome_contraparte']}", ev["data"])
+            else: u.saldo += Dinheiro.centavos(valor)  # estorno
+        elif ev["confirmar"]:
+            u.saldo += Dinheiro.centavos(valor)
+            self.registrar_transacao(u, "Pix Recebido", valor, f"De: {pendente['nome_contraparte']}", ev["data"])
+
+    def executar_operacao(self, op):
+        # Uma operação no formato do executar_lote, com commit próprio -> (ok, erro)
+        try:
+            evento = self._montar_evento(op, self._get_timestamp())
+        except (KeyError, TypeError, ValueError) as e:
+            return False, str(e) if isinstance(e, ValueError) else "Operação inválida."
+        with self._transacao(*self._cpfs_evento(evento)):
+            erro = self._validar(evento)
+            if erro: return False, erro
+            self._commit(evento)
+        return True, None
+
+    # --- Razão (partidas dobradas derivadas de cada evento) ---
+    def _partidas(self, ev):
+        # [(data, ticker ou None, origem, destino, valor)]; cadastro/senha não movem valores
+        op = ev["op"]
+        if op == "lote": return [p for evento in ev["eventos"] for p in self._partidas(evento)]
+        if op == "movimento":
+            valor = Dinheiro.centavos(ev["valor"])
+            if valor >= 0: return [(ev["data"], None, Razao.CAIXA, int(ev["cpf"]), valor)]
+            return [(ev["data"], None, int(ev["cpf"]), Razao.CAIXA, -valor)]
+        if op == "pix": return [(ev["data"], None, int(ev["de"]), int(ev["para"]), Dinheiro.centavos(ev["valor"]))]
+        if op == "investimento":
+            cpf, total = int(ev["cpf"]), Dinheiro.centavos(ev["qtd"] * ev["preco"])
+            if ev["tipo"] == "compra":
+                return [(ev["data"], None, cpf, Razao.MERCADO, total), (ev["data"], ev["ticker"], Razao.MERCADO, cpf, ev["qtd"])]
+            return [(ev["data"], ev["ticker"], cpf, Razao.MERCADO, ev["qtd"]), (ev["data"], None, Razao.MERCADO, cpf, total)]
+        if op == "dividendos":
+            return [(ev["data"], None, Razao.DIVIDENDOS, int(ev["cpf"]), Dinheiro.centavos(p["valor"])) for p in ev["pagamentos"]]
+        if op == "pix_preparar" and ev["papel"] == "envio":
+            return [(ev["data"], None, int(ev["cpf"]), Razao.TRANSITO, Dinheiro.centavos(ev["valor"]))]
+        if op == "pix_concluir":
+            valor = Dinheiro.centavos(ev["valor"])
+            if ev["papel"] == "envio":
+                destino = Razao.ENTRE_FRAGMENTOS if ev["confirmar"] else int(ev["cpf"])
+                return [(ev["data"], None, Razao.TRANSITO, destino, valor)]
+            if ev["confirmar"]: return [(ev["data"], None, Razao.ENTRE_FRAGMENTOS, int(ev["cpf"]), valor)]
+        return []
+
+    def _partidas_abertura(self):
+        # Saldos e posições do estado atual (chamar sem commits em andamento)
+        data = self._get_timestamp()
+        partidas = []
+        for c in self._contas.values():
+            cpf = int(c.cpf)
+            if c.saldo: partidas.append((data, None, Razao.ABERTURA, cpf, c.saldo))
+            partidas.extend((data, Tickers.nome_de(t), Razao.ABERTURA, cpf, p.qtd) for t, p in c.investimentos.items())
+        return partidas
+
+    @Metricas.instrumentar("operacao", op="saldo_em")
+    def saldo_em(self, cpf, quando):
+        # Saldo e posições da conta ao fim de quando (datetime), refeitos pelo razão a
+        # partir do checkpoint mais próximo
+        cpf = self._limpar_cpf(cpf)
+        if not self._buscar(cpf): return False, "Conta não encontrada."
+        saldos = self._razao.saldos_em(int(cpf), int(quando.timestamp()))
+        investimentos = {self._razao.nome_ativo(a): q for a, q in saldos.items() if a and q}
+        return True, {"cpf": cpf, "data": quando.strftime("%d/%m/%Y %H:%M"), "saldo": Dinheiro.reais(saldos.get(0, 0)),
+                      "investimentos": investimentos}
+
+    @Metricas.instrumentar("operacao", op="conciliar")
+    def conciliar(self, limite_divergencias=100):
+        # Confere o banco inteiro numa passada pelo razão: saldo e posições de cada conta
+        # (as visões materializadas em _contas) contra a soma dos lançamentos, e cada
+        # checkpoint contra o acumulado. Só a cópia das visões pausa o banco (como a
+        # compactação); a varredura roda com o banco liberado.
+        inicio = time.perf_counter()
+        with self._barreira.exclusiva():
+            self._razao.sincronizar()
+            total = self._razao.total
+            chaves, valores, ativos = [], [], {}
+            for c in self._contas.values():
+                base = int(c.cpf) * Razao.ATIVOS
+                chaves.append(base)
+                valores.append(c.saldo)
+                for t, p in c.investimentos.items():
+                    ativo = ativos.get(t)
+                    if ativo is None: ativo = ativos[t] = self._razao.ativo(Tickers.nome_de(t))
+                    chaves.append(base + ativo)
+                    valores.append(p.qtd)
+            contas = len(self._contas)
+        visao = Razao._reduzir(np.array(chaves, dtype=np.int64), np.array(valores, dtype=np.int64))
+        razao_chaves, razao_saldos, checkpoints_divergentes = self._razao.saldos_todos(total)
+
+        # Contas de cliente: o que falta de um lado vale zero
+        clientes = razao_chaves < Razao.CAIXA * Razao.ATIVOS
+        todas = np.union1d(visao[0], razao_chaves[clientes])
+        no_razao, na_visao = np.zeros(len(todas), dtype=np.int64), np.zeros(len(todas), dtype=np.int64)
+        no_razao[np.searchsorted(todas, razao_chaves[clientes])] = razao_saldos[clientes]
+        na_visao[np.searchsorted(todas, visao[0])] = visao[1]
+        diferentes = np.flatnonzero(no_razao != na_visao)
+        divergencias = []
+        for i in diferentes[:limite_divergencias].tolist():
+            cpf, ativo = divmod(int(todas[i]), Razao.ATIVOS)
+            nome = self._razao.nome_ativo(ativo)
+            divergencias.append({"cpf": f"{cpf:011d}", "ativo": nome or "BRL",
+                                 "razao": int(no_razao[i]) if nome else Dinheiro.reais(int(no_razao[i])),
+                                 "conta": int(na_visao[i]) if nome else Dinheiro.reais(int(na_visao[i]))})
+        internas = {}
+        for nome, conta in (("caixa", Razao.CAIXA), ("mercado", Razao.MERCADO), ("dividendos", Razao.DIVIDENDOS), ("abertura", Razao.ABERTURA),
+                            ("transito", Razao.TRANSITO), ("entre_fragmentos", Razao.ENTRE_FRAGMENTOS)):
+            i = np.searchsorted(razao_chaves, conta * Razao.ATIVOS)
+            internas[nome] = Dinheiro.reais(int(razao_saldos[i])) if i < len(razao_chaves) and razao_chaves[i] == conta * Razao.ATIVOS else 0.0
+        return {"ok": not len(diferentes) and not checkpoints_divergentes, "lancamentos": total, "contas": contas,
+                "divergencias": divergencias, "total_divergencias": len(diferentes),
+                "checkpoints_divergentes": checkpoints_divergentes, "internas": internas,
+                "segundos": time.perf_counter() - inicio}
+
+# --- Fragmentos (contas particionadas por CPF) ---
+def _executar_fragmento(arquivo, operacoes, fsync):
+    # Trabalhador do executar_em_processos: abre o fragmento (pega a trava do
+    # processo), aplica cada operação com commit próprio e fecha
+    inicio = time.perf_counter()
+    banco = BancoBackend(arquivo, fsync=fsync)
+    try:
+        resultados = [banco.executar_operacao(op) for op in operacoes]
+    finally:
+        banco.fechar()
+    erros = [erro for ok, erro in resultados if not ok]
+    return {"arquivo": arquivo, "operacoes": len(operacoes), "aplicadas": len(operacoes) - len(erros),
+            "erros": erros[:20], "segundos": time.perf_counter() - inicio}
+
+class BancoFragmentado:
+    # Contas particionadas em N fragmentos pelo hash do CPF. Cada fragmento é um
+    # BancoBackend completo (snapshot, log, extrato, razão e trava de processo
+    # próprios), então operações de fragmentos diferentes não disputam nada.
+    # Pix entre fragmentos é um commit em duas fases coordenado aqui: prepara o
+    # recebedor e o pagador, grava a decisão em coordenador.wal e conclui os dois.
+    # Na abertura, preparados sem decisão gravada são estornados (aborto presumido)
+    # e os com decisão são confirmados.
+    def __init__(self, pasta="bank_data.fragmentos", fragmentos=4, fsync=True, limite_decisoes=10_000, **opcoes):
+        os.makedirs(pasta, exist_ok=True)
+        meta = os.path.join(pasta, "fragmentos.json")
+        if os.path.exists(meta):
+            gravado = self.quantidade(pasta)
+            if gravado != fragmentos: raise RuntimeError(f"Banco com {gravado} fragmentos (pedido: {fragmentos}).")
+        else:
+            with open(meta, "w", encoding='utf-8') as f: json.dump({"fragmentos": fragmentos}, f)
+        self.pasta = pasta
+        self.fsync = fsync
+        self.limite_decisoes = limite_decisoes
+        self.fragmentos = [BancoBackend(self.arquivo_fragmento(pasta, i), fsync=fsync, **opcoes) for i in range(fragmentos)]
+        self.arquivo_decisoes = os.path.join(pasta, "coordenador.wal")
+        # Pix entre fragmentos em andamento seguram a compartilhada; conciliar pega a exclusiva
+        self._barreira = TravaCompartilhada()
+        self._trava_decisoes = threading.Lock()
+        self._em_andamento = {}  # id -> decisão gravada com participantes ainda não concluídos
+        self._recuperar()
+        self._decisoes = open(self.arquivo_decisoes, "a", encoding='utf-8')
+        self._linhas_decisoes = 0
 
-    def registrar_transacao(self, usuario, tipo, valor, detalhe=""):
-        transacao = {"data": self._get_timestamp(), "tipo": tipo, "valor": valor, "detalhe": detalhe}
-        usuario["extrato"].insert(0, transacao)
+    @staticmethod
+    def quantidade(pasta):
+        with open(os.path.join(pasta, "fragmentos.json"), "r", encoding='utf-8') as f: return json.load(f)["fragmentos"]
 
-    def deposito_saque(self, cpf, valor, tipo):
-        dados = self._ler()
-        for u in dados:
-            if u["cpf"] == cpf:
-                u["saldo"] += valor
-                self.registrar_transacao(u, tipo, valor)
-                self._salvar(dados)
-                return u["saldo"], u["extrato"]
-        return None, None
+    @staticmethod
+    def arquivo_fragmento(pasta, i):
+        return os.path.join(pasta, f"fragmento_{i:02d}.json")
 
+    @staticmethod
+    def indice_fragmento(cpf, n):
+        return zlib.crc32(BancoBackend._limpar_cpf(cpf).encode()) % n
+
+    def fragmento(self, cpf):
+        return self.fragmentos[self.indice_fragmento(cpf, len(self.fragmentos))]
+
+    # --- Coordenador (commit em duas fases) ---
+    def _recuperar(self):
+        decisoes = {}
+        if os.path.exists(self.arquivo_decisoes):
+            with open(self.arquivo_decisoes, "r", encoding='utf-8') as f:
+                for linha in f:
+                    try:
+                        decisao = json.loads(linha)
+                    except ValueError:
+                        break  # última linha incompleta: a decisão não chegou ao disco
+                    decisoes[decisao["id"]] = decisao["confirmar"]
+        for banco in self.fragmentos:
+            for id in banco.pendentes(): banco.concluir_pix(id, decisoes.get(id, False))
+        # Tudo resolvido: as decisões antigas não servem mais
+        self._reescrever_decisoes({})
+
+    def _reescrever_decisoes(self, decisoes):
+        tmp = self.arquivo_decisoes + ".tmp"
+        with open(tmp, "w", encoding='utf-8') as f:
+            for id, confirmar in decisoes.items(): f.write(json.dumps({"id": id, "confirmar": confirmar}) + "\n")
+            f.flush()
+            if self.fsync: os.fsync(f.fileno())
+        os.replace(tmp, self.arquivo_decisoes)
+
+    def _decidir(self, id, confirmar):
+        # A partir daqui a decisão vale, mesmo que o processo caia antes de concluir
+        linha = json.dumps({"id": id, "confirmar": confirmar}) + "\n"
+        with self._trava_decisoes:
+            if self._linhas_decisoes >= self.limite_decisoes:
+                # Mantém só as decisões de Pix ainda em andamento
+                self._decisoes.close()
+                self._reescrever_decisoes(self._em_andamento)
+                self._decisoes = open(self.arquivo_decisoes, "a", encoding='utf-8')
+                self._linhas_decisoes = len(self._em_andamento)
+            self._decisoes.write(linha)
+            self._decisoes.flush()
+            if self.fsync: os.fsync(self._decisoes.fileno())
+            self._linhas_decisoes += 1
+            self._em_andamento[id] = confirmar
+
+    def _concluir(self, id, confirmar, participantes):
+        # concluir_pix é idempotente: pode ser chamado em quem nem chegou a preparar
+        self._decidir(id, confirmar)
+        for banco in participantes: banco.concluir_pix(id, confirmar)
+        with self._trava_decisoes: self._em_andamento.pop(id, None)
+
+    @Metricas.instrumentar("operacao", op="pix_fragmentos")
     def realizar_pix(self, cpf_remetente, cpf_destinatario, valor):
-        # Limpa o CPF de destino caso o usuário digite com pontos
-        cpf_dest_limpo = ''.join(filter(str.isdigit, cpf_destinatario))
-        
-        dados = self._ler()
-        remetente = next((u for u in dados if u["cpf"] == cpf_remetente), None)
-        destinatario = next((u for u in dados if u["cpf"] == cpf_dest_limpo), None)
-        
+        para = BancoBackend._limpar_cpf(cpf_destinatario)
+        origem, destino = self.fragmento(cpf_remetente), self.fragmento(para)
+        if origem is destino: return origem.realizar_pix(cpf_remetente, para, valor)
+        remetente, destinatario = origem._buscar(cpf_remetente), destino._buscar(para)
+        if not remetente: return False, "Conta não encontrada."
         if not destinatario: return False, "Chave Pix (CPF) não encontrada."
-        if remetente["cpf"] == destinatario["cpf"]: return False, "Pix para mesma conta."
-        if remetente["saldo"] < valor: return False, "Saldo insuficiente."
-        
-        remetente["saldo"] -= valor
-        destinatario["saldo"] += valor
-        self.registrar_transacao(remetente, "Pix Enviado", -valor, f"Para: {destinatario['nome']}")
-        self.registrar_transacao(destinatario, "Pix Recebido", valor, f"De: {remetente['nome']}")
-        self._salvar(dados)
-        return True, remetente["saldo"]
-
-    def investir(self, cpf, ticker, qtd, preco_unitario, tipo="compra"):
-        dados = self._ler()
-        user = next((u for u in dados if u["cpf"] == cpf), None)
-        valor_total = qtd * preco_unitario
-        if tipo == "compra":
-            if user["saldo"] < valor_total: return False, "Saldo insuficiente."
-            user["saldo"] -= valor_total
-            if ticker not in user["investimentos"]: user["investimentos"][ticker] = {"qtd": 0, "preco_medio": 0}
-            cart = user["investimentos"][ticker]
-            cart["preco_medio"] = ((cart["qtd"] * cart["preco_medio"]) + valor_total) / (cart["qtd"] + qtd)
-            cart["qtd"] += qtd
-            self.registrar_transacao(user, "Investimento", -valor_total, f"Compra {qtd}x {ticker}")
-        elif tipo == "venda":
-            if ticker not in user["investimentos"] or user["investimentos"][ticker]["qtd"] < qtd: return False, "Qtd insuficiente."
-            user["saldo"] += valor_total
-            user["investimentos"][ticker]["qtd"] -= qtd
-            if user["investimentos"][ticker]["qtd"] == 0: del user["investimentos"][ticker]
-            self.registrar_transacao(user, "Resgate Inv.", valor_total, f"Venda {qtd}x {ticker}")
-        self._salvar(dados)
-        return True, user
+        id = secrets.token_hex(16)
+        with self._barreira.compartilhada():
+            # Recebedor primeiro: se o pagador falhar só há um preparado sem débito a desfazer
+            try:
+                ok, erro = destino.preparar_pix(id, para, valor, "recebimento", cpf_remetente, remetente.nome)
+                if not ok: return False, erro
+                ok, erro = origem.preparar_pix(id, cpf_remetente, valor, "envio", para, destinatario.nome)
+            except Exception:
+                self._concluir(id, False, (destino, origem))
+                raise
+            if not ok:
+                self._concluir(id, False, (destino,))
+                return False, erro
+            self._concluir(id, True, (origem, destino))
+        return True, Dinheiro.reais(remetente.saldo)
+
+    # --- Operações de uma conta (vão direto ao fragmento) ---
+    def cadastrar(self, nome, cpf, senha):
+        return self.fragmento(cpf).cadastrar(nome, cpf, senha)
+
+    def login(self, cpf, senha):
+        return self.fragmento(cpf).login(cpf, senha)
+
+    def deposito_saque(self, cpf, valor, tipo):
+        return self.fragmento(cpf).deposito_saque(cpf, valor, tipo)
+
+    def investir(self, cpf, ticker, qtd, preco_unitario, tipo="compra", versao_cotacao=None):
+        return self.fragmento(cpf).investir(cpf, ticker, qtd, preco_unitario, tipo, versao_cotacao)
+
+    def total_extrato(self, cpf):
+        return self.fragmento(cpf).total_extrato(cpf)
+
+    def consultar_extrato(self, cpf, cursor=None, limite=50, desde=None, ate=None, tipos=None):
+        return self.fragmento(cpf).consultar_extrato(cpf, cursor, limite, desde, ate, tipos)
+
+    def saldo_em(self, cpf, quando):
+        return self.fragmento(cpf).saldo_em(cpf, quando)
 
     def processar_pagamentos_dividendos(self, cpf):
-        dados = self._ler()
-        user = next((u for u in dados if u["cpf"] == cpf), None)
-        info_div = MarketAPI.get_info_dividendos()
-        hoje = datetime.now().date()
-        total_pago = 0
-        lista = []
-        for ticker, d_mercado in info_div.items():
-            if ticker in user["investimentos"] and user["investimentos"][ticker]["qtd"] > 0:
-                chave = f"{ticker}_{d_mercado['data']}"
-                if d_mercado["data_obj"] <= hoje and chave not in user.get("dividendos_recebidos", {}):
-                    val = d_mercado["valor"] * user["investimentos"][ticker]["qtd"]
-                    user["saldo"] += val
-                    total_pago += val
-                    if "dividendos_recebidos" not in user: user["dividendos_recebidos"] = {}
-                    user["dividendos_recebidos"][chave] = True
-                    self.registrar_transacao(user, "Dividendos", val, ticker)
-                    lista.append(f"{ticker}: R$ {val:.2f}")
-        if total_pago > 0:
-            self._salvar(dados)
-            return True, total_pago, lista, user
-        return False, 0, [], user
+        return self.fragmento(cpf).processar_pagamentos_dividendos(cpf)
+
+    # --- Banco inteiro ---
+    def pagar_dividendos(self, hoje=None):
+        with ThreadPoolExecutor(max_workers=len(self.fragmentos)) as executor:
+            resultados = list(executor.map(lambda banco: banco.pagar_dividendos(hoje), self.fragmentos))
+        return sum(r[0] for r in resultados), sum(r[1] for r in resultados)
+
+    def conciliar(self, limite_divergencias=100):
+        # Cada fragmento contra o próprio razão e, sem Pix entre fragmentos em
+        # andamento, o que saiu de um fragmento tem que ter entrado em outro
+        inicio = time.perf_counter()
+        with self._barreira.exclusiva():
+            resultados = [banco.conciliar(limite_divergencias) for banco in self.fragmentos]
+        entre = round(sum(r["internas"]["entre_fragmentos"] for r in resultados), 2)
+        transito = round(sum(r["internas"]["transito"] for r in resultados), 2)
+        return {"ok": all(r["ok"] for r in resultados) and not entre and not transito,
+                "lancamentos": sum(r["lancamentos"] for r in resultados), "contas": sum(r["contas"] for r in resultados),
+                "entre_fragmentos": entre, "transito": transito, "fragmentos": resultados,
+                "segundos": time.perf_counter() - inicio}
+
+    def importar_json(self, caminho):
+        partes = [[] for _ in self.fragmentos]
+        for u in self.fragmentos[0]._ler(caminho): partes[self.indice_fragmento(u["cpf"], len(partes))].append(u)
+        for banco, parte in zip(self.fragmentos, partes): banco.compactar(parte)
+
+    def fechar(self):
+        for banco in self.fragmentos: banco.fechar()
+        with self._trava_decisoes:
+            self._decisoes.close()
+            # Decisões com participantes ainda não concluídos ficam para a recuperação
+            self._reescrever_decisoes(self._em_andamento)
+
+    @staticmethod
+    def executar_em_processos(pasta, operacoes, processos=None, fsync=True):
+        # Lote grande com um processo por fragmento (o banco não pode estar aberto:
+        # cada trabalhador pega a trava do seu fragmento). Operações no formato do
+        # executar_lote; Pix entre fragmentos não entram e voltam em
+        # "entre_fragmentos" para o coordenador executar depois.
+        n = BancoFragmentado.quantidade(pasta)
+        partes, entre = [[] for _ in range(n)], []
+        for op in operacoes:
+            cpfs = (op["de"], op["para"]) if op["op"] == "pix" else (op["cpf"],)
+            indices = {BancoFragmentado.indice_fragmento(c, n) for c in cpfs}
+            if len(indices) > 1: entre.append(op)
+            else: partes[indices.pop()].append(op)
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=processos or n) as executor:
+            futuros = [executor.submit(_executar_fragmento, BancoFragmentado.arquivo_fragmento(pasta, i), parte, fsync)
+                       for i, parte in enumerate(partes) if parte]
+            fragmentos = [f.result() for f in futuros]
+        segundos = time.perf_counter() - inicio
+        executadas = sum(r["operacoes"] for r in fragmentos)
+        return {"operacoes": executadas, "aplicadas": sum(r["aplicadas"] for r in fragmentos), "segundos": segundos,
+                "operacoes_por_segundo": executadas / segundos if segundos else 0.0,
+                "fragmentos": fragmentos, "entre_fragmentos": entre}
+
+# --- Livro de Ofertas ---
+class Ordem:
+    def __init__(self, id, cpf, ticker, lado, qtd, preco=None):
+        self.id = id
+        self.cpf = cpf
+        self.ticker = ticker
+        self.lado = lado  # "compra" | "venda"
+        self.preco = preco  # None = ordem a mercado
+        self.qtd = qtd  # quantidade ainda em aberto
+        self.executada = 0
+        self.status = "aberta"  # aberta | parcial | executada | cancelada
+
+class LivroOfertas:
+    # Livro de um ticker com prioridade preço-tempo: cada preço é um nível (fila FIFO)
+    # e os preços de cada lado ficam num heap (compra com sinal trocado). Cancelamento
+    # é preguiçoso: a ordem fica com qtd 0 e sai da fila quando chega na frente.
+    def __init__(self, ticker):
+        self.ticker = ticker
+        self._niveis = {"compra": {}, "venda": {}}  # preço -> deque de ordens
+        self._precos = {"compra": [], "venda": []}
+        self._ordens = {}  # id -> ordem em repouso
+
+    def _melhor(self, lado):
+        heap, niveis = self._precos[lado], self._niveis[lado]
+        while heap:
+            preco = -heap[0] if lado == "compra" else heap[0]
+            fila = niveis[preco]
+            while fila and not fila[0].qtd: fila.popleft()
+            if fila: return preco, fila
+            heapq.heappop(heap)
+            del niveis[preco]
+        return None, None
+
+    def _repousar(self, ordem):
+        niveis = self._niveis[ordem.lado]
+        fila = niveis.get(ordem.preco)
+        if fila is None:
+            fila = niveis[ordem.preco] = deque()
+            heapq.heappush(self._precos[ordem.lado], -ordem.preco if ordem.lado == "compra" else ordem.preco)
+        fila.append(ordem)
+        self._ordens[ordem.id] = ordem
+
+    def submeter(self, ordem, liquidar=None):
+        # Casa a ordem contra o lado oposto; o que sobrar de uma ordem limitada fica no
+        # livro, o que sobrar de uma ordem a mercado é cancelado. Cada negócio sai pelo
+        # preço da ordem em repouso. liquidar(compra, venda, qtd, preco) devolve None ou
+        # a ordem cuja parte não conseguiu liquidar (que é cancelada).
+        contra = "venda" if ordem.lado == "compra" else "compra"
+        negocios = []
+        while ordem.qtd:
+            preco, fila = self._melhor(contra)
+            if preco is None: break
+            if ordem.preco is not None and (preco > ordem.preco if ordem.lado == "compra" else preco < ordem.preco): break
+            oferta = fila[0]
+            if oferta.cpf == ordem.cpf:
+                # Auto-negociação: cancela a ordem mais antiga
+                self.cancelar(oferta.id)
+                continue
+            qtd = min(ordem.qtd, oferta.qtd)
+            compra, venda = (ordem, oferta) if ordem.lado == "compra" else (oferta, ordem)
+            if liquidar:
+                falha = liquidar(compra, venda, qtd, preco)
+                if falha is not None:
+                    if falha is ordem:
+                        ordem.qtd, ordem.status = 0, "cancelada"
+                        return negocios
+                    self.cancelar(oferta.id)
+                    continue
+            for o in (ordem, oferta):
+                o.qtd -= qtd
+                o.executada += qtd
+                o.status = "parcial" if o.qtd else "executada"
+            if not oferta.qtd:
+                fila.popleft()
+                del self._ordens[oferta.id]
+            negocios.append({"comprador": compra.cpf, "vendedor": venda.cpf, "qtd": qtd, "preco": preco,
+                             "ordem_compra": compra.id, "ordem_venda": venda.id})
+        if ordem.qtd:
+            if ordem.preco is None: ordem.status = "cancelada"
+            else: self._repousar(ordem)
+        return negocios
+
+    def cancelar(self, ordem_id):
+        ordem = self._ordens.pop(ordem_id, None)
+        if ordem is None: return False
+        ordem.qtd, ordem.status = 0, "cancelada"
+        return True
+
+    def profundidade(self, niveis=5):
+        # [(preço, qtd total)] dos melhores níveis de cada lado
+        livro = {}
+        for lado in ("compra", "venda"):
+            totais = {}
+            for preco, fila in self._niveis[lado].items():
+                qtd = sum(o.qtd for o in fila)
+                if qtd: totais[preco] = qtd
+            livro[lado] = sorted(totais.items(), reverse=(lado == "compra"))[:niveis]
+        return livro
+
+class MotorOrdens:
+    # Mesa de ordens do banco: um LivroOfertas por ticker, negócios liquidados em
+    # investimentos/saldo pelo BancoBackend.liquidar_negocio. O livro vive só em
+    # memória (ordens em repouso não sobrevivem a um reinício); o que é negociado vai
+    # para o log como qualquer compra/venda.
+    def __init__(self, backend):
+        self.backend = backend
+        self._livros = {}
+        self._travas = {}
+        self._trava = threading.Lock()
+        self._proximo_id = 0
+
+    def _livro(self, ticker):
+        with self._trava:
+            if ticker not in self._livros:
+                self._livros[ticker] = LivroOfertas(ticker)
+                self._travas[ticker] = threading.Lock()
+            return self._livros[ticker], self._travas[ticker]
+
+    def enviar(self, cpf, ticker, lado, qtd, preco=None):
+        # Devolve (True, ordem, negócios) ou (False, mensagem, [])
+        if lado not in ("compra", "venda"): return False, "Tipo de ordem inválido.", []
+        if not isinstance(qtd, int) or qtd <= 0: return False, "Qtd inválida.", []
+        if preco is not None and preco <= 0: return False, "Preço inválido.", []
+        user = self.backend._buscar(cpf)
+        if not user: return False, "Conta não encontrada.", []
+        # Checagem antecipada; a definitiva acontece na liquidação de cada negócio
+        if lado == "compra" and preco is not None and user.saldo < Dinheiro.centavos(qtd * preco): return False, "Saldo insuficiente.", []
+        if lado == "venda" and (user.posicao(ticker) or Posicao()).qtd < qtd: return False, "Qtd insuficiente.", []
+        with self._trava:
+            self._proximo_id += 1
+            ordem = Ordem(self._proximo_id, cpf, ticker, lado, qtd, preco)
+        livro, trava = self._livro(ticker)
+        with trava: negocios = livro.submeter(ordem, self._liquidar)
+        return True, ordem, negocios
+
+    def cancelar(self, ticker, ordem_id):
+        livro, trava = self._livro(ticker)
+        with trava: return livro.cancelar(ordem_id)
+
+    def profundidade(self, ticker, niveis=5):
+        livro, trava = self._livro(ticker)
+        with trava: return livro.profundidade(niveis)
+
+    def _liquidar(self, compra, venda, qtd, preco):
+        ok, cpf = self.backend.liquidar_negocio(compra.cpf, venda.cpf, compra.ticker, qtd, preco)
+        if ok: return None
+        return compra if cpf == compra.cpf else venda
+
+# --- Valorização de Carteiras ---
+class MotorValorizacao:
+    # Valor de mercado e P&L de todas as carteiras, mantidos incrementalmente.
+    # Posições ficam em colunas NumPy (conta, ticker, qtd, preço médio); as contas
+    # guardam valor de mercado, custo e P&L realizado. Um tick só mexe nas posições
+    # dos tickers cujo preço mudou (delta x qtd somado por conta com bincount);
+    # compras e vendas chegam pelo BancoBackend.observar e ajustam só a sua linha.
+    # O P&L realizado conta a partir de quando o motor foi criado.
+    def __init__(self, backend=None, precos=None):
+        self._trava = threading.Lock()
+        self._precos_iniciais = precos or {}
+        self._backend = backend
+        self._zerar()
+        if backend: backend.observar(self.notificar)
+        else: self.atualizar_precos(self._precos_iniciais)
+
+    def _zerar(self):
+        self._ids_conta, self._cpfs = {}, []
+        self._ids_ticker, self._tickers = {}, []
+        self._preco = np.zeros(0)
+        self._qtd_ticker = np.zeros(0)
+        self._valor = np.zeros(0)  # por conta
+        self._custo = np.zeros(0)
+        self._realizado = np.zeros(0)
+        self._pos_conta = np.zeros(0, dtype=np.int64)
+        self._pos_ticker = np.zeros(0, dtype=np.int64)
+        self._pos_qtd = np.zeros(0)
+        self._pos_medio = np.zeros(0)
+        self._linhas = {}  # (conta, ticker) -> linha
+        self._livres = []
+        self._n = 0
+        self._top = {}  # ticker -> maiores detentores (invalidado quando o ticker negocia)
+
+    @staticmethod
+    def _crescer(vetor, tamanho):
+        if tamanho <= len(vetor): return vetor
+        novo = np.zeros(max(tamanho, 2 * len(vetor), 16), dtype=vetor.dtype)
+        novo[:len(vetor)] = vetor
+        return novo
+
+    def _conta(self, cpf):
+        c = self._ids_conta.get(cpf)
+        if c is None:
+            c = self._ids_conta[cpf] = len(self._cpfs)
+            self._cpfs.append(cpf)
+            self._valor = self._crescer(self._valor, c + 1)
+            self._custo = self._crescer(self._custo, c + 1)
+            self._realizado = self._crescer(self._realizado, c + 1)
+        return c
+
+    def _ticker(self, ticker):
+        t = self._ids_ticker.get(ticker)
+        if t is None:
+            t = self._ids_ticker[ticker] = len(self._tickers)
+            self._tickers.append(ticker)
+            self._preco = self._crescer(self._preco, t + 1)
+            self._qtd_ticker = self._crescer(self._qtd_ticker, t + 1)
+        return t
+
+    def _linha(self, c, t):
+        linha = self._linhas.get((c, t))
+        if linha is None:
+            if self._livres: linha = self._livres.pop()
+            else:
+                linha = self._n
+                self._n += 1
+                for nome in ("_pos_conta", "_pos_ticker", "_pos_qtd", "_pos_medio"):
+                    setattr(self, nome, self._crescer(getattr(self, nome), self._n))
+            self._linhas[(c, t)] = linha
+            self._pos_conta[linha], self._pos_ticker[linha] = c, t
+            self._pos_qtd[linha] = self._pos_medio[linha] = 0
+        return linha
+
+    def _mover(self, cpf, ticker, qtd, preco):
+        # qtd > 0 compra pelo preço; qtd < 0 vende (realiza contra o preço médio)
+        c, t = self._conta(cpf), self._ticker(ticker)
+        linha = self._linha(c, t)
+        atual, medio = self._pos_qtd[linha], self._pos_medio[linha]
+        if qtd > 0:
+            self._pos_medio[linha] = (atual * medio + qtd * preco) / (atual + qtd)
+            self._custo[c] += qtd * preco
+        else:
+            self._realizado[c] += -qtd * (preco - medio)
+            self._custo[c] += qtd * medio
+        self._pos_qtd[linha] = atual + qtd
+        self._valor[c] += qtd * self._preco[t]
+        self._qtd_ticker[t] += qtd
+        self._top.pop(t, None)
+        if not self._pos_qtd[linha]:
+            del self._linhas[(c, t)]
+            self._livres.append(linha)
+
+    def notificar(self, ev):
+        with self._trava:
+            if ev["op"] == "investimento":
+                self._mover(ev["cpf"], ev["ticker"], ev["qtd"] if ev["tipo"] == "compra" else -ev["qtd"], ev["preco"])
+            elif ev["op"] == "cadastro":
+                self._conta(ev["cpf"])
+            elif ev["op"] == "recarga":
+                self._recarregar()
+
+    def _recarregar(self):
+        # Remonta tudo a partir das contas do backend (mantém os preços conhecidos)
+        precos = dict(zip(self._tickers, self._preco.tolist())) or self._precos_iniciais
+        self._zerar()
+        self._aplicar_precos(precos)
+        for cpf, u in self._backend._contas.items():
+            c = self._conta(cpf)
+            for tid, p in u.investimentos.items():
+                if not p.qtd: continue
+                t = self._ticker(Tickers.nome_de(tid))
+                linha = self._linha(c, t)
+                self._pos_qtd[linha], self._pos_medio[linha] = p.qtd, p.preco_medio
+                self._custo[c] += p.custo / 100
+                self._qtd_ticker[t] += p.qtd
+        self._recalcular_valor()
+
+    def _recalcular_valor(self):
+        n = self._n
+        self._valor = np.bincount(self._pos_conta[:n], weights=self._pos_qtd[:n] * self._preco[self._pos_ticker[:n]],
+                                  minlength=len(self._valor)).astype(np.float64)
+
+    def atualizar_precos(self, cotacoes):
+        # cotacoes: {ticker: preço} ou o formato da MarketAPI ({ticker: {"preco": ...}})
+        with self._trava: return self._aplicar_precos(cotacoes)
+
+    def receber_snapshot(self, snap):
+        # Assinante do PublicadorCotacoes
+        self.atualizar_precos(snap["cotacoes"])
+
+    def _aplicar_precos(self, cotacoes):
+        ids = [self._ticker(ticker) for ticker in cotacoes]
+        novos = self._preco.copy()
+        for t, preco in zip(ids, cotacoes.values()):
+            novos[t] = preco["preco"] if isinstance(preco, dict) else preco
+        delta = novos - self._preco
+        self._preco = novos
+        if not delta.any(): return 0
+        # Só as posições dos tickers que mudaram entram na conta
+        n = self._n
+        delta_pos = delta[self._pos_ticker[:n]]
+        afetadas = np.flatnonzero(delta_pos)
+        self._valor += np.bincount(self._pos_conta[afetadas], weights=self._pos_qtd[afetadas] * delta_pos[afetadas],
+                                   minlength=len(self._valor))
+        return len(afetadas)
+
+    # --- Leituras ---
+    def resumo(self, cpf):
+        with self._trava:
+            c = self._ids_conta.get(cpf)
+            if c is None: return None
+            valor, custo = float(self._valor[c]), float(self._custo[c])
+            return {"valor_mercado": valor, "custo": custo, "pnl_nao_realizado": valor - custo,
+                    "pnl_realizado": float(self._realizado[c])}
+
+    def aum(self, ticker=None):
+        # Patrimônio sob custódia (qtd total x preço) de um ticker ou do banco todo
+        with self._trava:
+            if ticker is None: return float(self._qtd_ticker @ self._preco)
+            t = self._ids_ticker.get(ticker)
+            return 0.0 if t is None else float(self._qtd_ticker[t] * self._preco[t])
+
+    def maiores_detentores(self, ticker, n=10):
+        # [(cpf, qtd)] em ordem decrescente; recalculado só quando o ticker negocia
+        with self._trava:
+            t = self._ids_ticker.get(ticker)
+            if t is None: return []
+            if t not in self._top:
+                linhas = np.flatnonzero((self._pos_ticker[:self._n] == t) & (self._pos_qtd[:self._n] > 0))
+                self._top[t] = linhas[np.argsort(-self._pos_qtd[linhas], kind="stable")]
+            return [(self._cpfs[self._pos_conta[l]], float(self._pos_qtd[l])) for l in self._top[t][:n]]
+
+# --- Modo Servidor (HTTP/JSON) ---
+class ManipuladorHTTP(BaseHTTPRequestHandler):
+    # API JSON sobre o BancoBackend. HTTP/1.1: a conexão fica aberta entre requisições
+    # (keep-alive). Rotas autenticadas pedem "Authorization: Bearer <token>" do /login.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # cabeçalho e corpo saem em writes separados
+    ROTAS = {
+        ("POST", "/login"): ("_login", False),
+        ("POST", "/logout"): ("_logout", True),
+        ("GET", "/conta"): ("_conta", True),
+        ("POST", "/deposito"): ("_deposito", True),
+        ("POST", "/saque"): ("_saque", True),
+        ("POST", "/pix"): ("_pix", True),
+        ("POST", "/ordem"): ("_ordem", True),
+        ("GET", "/extrato"): ("_extrato", True),
+        ("GET", "/cotacoes"): ("_cotacoes", False),
+        ("GET", "/metricas"): ("_metricas", False),
+    }
+
+    def do_GET(self): self._despachar("GET")
+    def do_POST(self): self._despachar("POST")
+
+    def log_message(self, formato, *args):
+        if self.server.verboso: super().log_message(formato, *args)
+
+    def _despachar(self, metodo):
+        url = urlsplit(self.path)
+        self.consulta = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            tamanho = int(self.headers.get("Content-Length") or 0)
+            if tamanho < 0: raise ValueError(tamanho)
+        except ValueError:
+            # Sem saber onde o corpo termina a conexão não pode ser reaproveitada
+            self.close_connection = True
+            return self._responder(400, {"erro": "Content-Length inválido."})
+        corpo = self.rfile.read(tamanho) if tamanho else b""
+        rota = self.ROTAS.get((metodo, url.path))
+        if rota is None: return self._responder(404, {"erro": "Rota não encontrada."})
+        if Metricas.ativo:
+            inicio = time.perf_counter()
+            try:
+                return self._atender(rota, corpo)
+            finally:
+                Metricas.observar("http", time.perf_counter() - inicio, rota=f"{metodo} {url.path}")
+        self._atender(rota, corpo)
+
+    def _atender(self, rota, corpo):
+        nome, autenticada = rota
+        self.cpf = None
+        if autenticada:
+            self.token = self.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+            self.cpf = self.server.backend.sessao(self.token)
+            if self.cpf is None: return self._responder(401, {"erro": "Sessão inválida ou expirada."})
+        try:
+            dados = json.loads(corpo) if corpo else {}
+            status, resposta = getattr(self, nome)(dados)
+        except (ValueError, KeyError, TypeError) as e:
+            status, resposta = 400, {"erro": f"Requisição inválida: {e}"}
+        self._responder(status, resposta)
+
+    def _responder(self, status, dados):
+        # dict vira JSON; str sai como texto (formato Prometheus do /metricas)
+        if isinstance(dados, str):
+            corpo, tipo = dados.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            corpo, tipo = json.dumps(dados, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    # --- Rotas: devolvem (status, dict) ---
+    def _login(self, dados):
+        ok, resposta = self.server.backend.abrir_sessao(str(dados["cpf"]), str(dados["senha"]))
+        if not ok: return 401, {"erro": resposta}
+        return 200, {"token": resposta}
+
+    def _logout(self, dados):
+        self.server.backend.encerrar_sessao(self.token)
+        return 200, {}
+
+    def _conta(self, dados):
+        u = self.server.backend._buscar(self.cpf).para_dict()
+        return 200, {"nome": u["nome"], "cpf": u["cpf"], "saldo": u["saldo"], "investimentos": u["investimentos"]}
+
+    def _valor(self, dados):
+        # Positivo e finito (NaN/inf não passam pelas comparações do backend)
+        valor = float(dados["valor"])
+        if not 0 < valor < float("inf"): raise ValueError("valor deve ser positivo")
+        return valor
+
+    def _deposito(self, dados):
+        return self._movimento(self._valor(dados), "Deposito")
+
+    def _saque(self, dados):
+        return self._movimento(-self._valor(dados), "Saque")
+
+    def _movimento(self, valor, tipo):
+        saldo, erro = self.server.backend.deposito_saque(self.cpf, valor, tipo)
+        if saldo is None: return (409 if erro == "Saldo insuficiente." else 400), {"erro": erro}
+        return 200, {"saldo": saldo}
+
+    def _pix(self, dados):
+        ok, resposta = self.server.backend.realizar_pix(self.cpf, str(dados["para"]), self._valor(dados))
+        if not ok: return 409, {"erro": resposta}
+        return 200, {"saldo": resposta}
+
+    def _ordem(self, dados):
+        # Executa pela cotação atual do CacheCotacoes (a versão fica registrada no evento)
+        ticker = dados["ticker"]
+        if ticker not in MarketAPI.EMPRESAS: return 404, {"erro": "Ticker não encontrado."}
+        preco, versao = (MarketAPI.cache or MarketAPI.configurar_cache()).cotacao(ticker)
+        ok, resposta = self.server.backend.investir(self.cpf, ticker, int(dados["qtd"]), preco, dados.get("tipo", "compra"), versao)
+        if not ok: return 409, {"erro": resposta}
+        return 200, {"preco": preco, "versao_cotacao": versao, "saldo": resposta["saldo"], "investimentos": resposta["investimentos"]}
+
+    def _extrato(self, dados):
+        cursor = int(self.consulta["cursor"]) if "cursor" in self.consulta else None
+        limite = max(1, min(int(self.consulta.get("limite", 50)), 500))
+        itens, proximo = self.server.backend.consultar_extrato(self.cpf, cursor, limite)
+        return 200, {"itens": itens, "proximo": proximo}
+
+    def _cotacoes(self, dados):
+        snap = MarketAPI.get_snapshot()
+        return 200, {"versao": snap["versao"], "data": snap["data"], "cotacoes": snap["cotacoes"]}
+
+    def _metricas(self, dados):
+        # Scrape local (Prometheus); ?formato=json para o mesmo conteúdo em JSON
+        if not Metricas.ativo: return 404, {"erro": "Métricas desligadas (BANKPY_METRICAS=1 ou --metricas)."}
+        return 200, self.server.backend.metricas(self.consulta.get("formato", "prometheus"))
+
+class ServidorBanco(ThreadingHTTPServer):
+    # Processo dono do banco: um BancoBackend em memória atende todos os clientes
+    # (uma thread por conexão); ninguém mais abre os arquivos.
+    daemon_threads = True
+    request_queue_size = 128  # backlog do listen: muitos clientes conectando juntos
+
+    def __init__(self, backend, endereco=("127.0.0.1", 8080), verboso=False):
+        self.backend = backend
+        self.verboso = verboso
+        super().__init__(endereco, ManipuladorHTTP)
+
+def servir(arquivo="bank_data.json", host="127.0.0.1", porta=8080, verboso=False):
+    backend = BancoBackend(arquivo)
+    backend.agendar_dividendos()
+    servidor = ServidorBanco(backend, (host, porta), verboso)
+    print(f"BankPY servindo em http://{host}:{servidor.server_address[1]}", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        backend.fechar()
 
 # --- Interfaces Gráficas ---
 
+class PonteTk:
+    # Assinante do PublicadorCotacoes que entrega na thread do Tk: o loop do
+    # publicador só guarda o último valor; o Tk drena a cada intervalo_ms via
+    # after() e descarta os intermediários (a tela sempre mostra o mais novo).
+    def __init__(self, widget, callback, intervalo_ms=100):
+        self.widget, self.callback, self.intervalo_ms = widget, callback, intervalo_ms
+        self._trava = threading.Lock()
+        self._pendente = None
+        self._agendar()
+
+    def __call__(self, valor):
+        with self._trava: self._pendente = valor
+
+    def _agendar(self):
+        self.widget.after(self.intervalo_ms, self._drenar)
+
+    def _drenar(self):
+        if not self.widget.winfo_exists(): return
+        with self._trava: valor, self._pendente = self._pendente, None
+        if valor is not None: self.callback(valor)
+        self._agendar()
+
+class ExecutorComandos:
+    # Roda chamadas ao backend no pool de trabalhadores e devolve o resultado na thread
+    # do Tk: os Futures concluídos caem numa fila que um after() drena enquanto houver
+    # comando em andamento. Uma chave só tem um comando por vez (clique duplo é
+    # ignorado); os botões passados ficam desabilitados até a resposta chegar.
+    def __init__(self, widget, backend, intervalo_ms=15):
+        self.widget, self.backend, self.intervalo_ms = widget, backend, intervalo_ms
+        self._em_andamento = {}  # chave -> botões desabilitados
+        self._concluidos = deque()
+        self._drenando = False
+
+    def ocupado(self, chave):
+        return chave in self._em_andamento
+
+    def executar(self, chave, funcao, *args, ao_concluir=None, ao_falhar=None, botoes=(), dono=None):
+        # ao_concluir(resultado) / ao_falhar(exceção) rodam no Tk; se o widget dono já
+        # foi destruído (logout no meio do caminho) o retorno é descartado
+        if chave in self._em_andamento: return False
+        for b in botoes: b.configure(state="disabled")
+        self._em_andamento[chave] = botoes
+        futuro = self.backend.em_segundo_plano(funcao, *args)
+        futuro.add_done_callback(lambda f: self._concluidos.append((chave, f, ao_concluir, ao_falhar, dono)))
+        if not self._drenando:
+            self._drenando = True
+            self.widget.after(self.intervalo_ms, self._drenar)
+        return True
+
+    def _drenar(self):
+        while self._concluidos:
+            chave, futuro, ao_concluir, ao_falhar, dono = self._concluidos.popleft()
+            for b in self._em_andamento.pop(chave, ()):
+                if b.winfo_exists(): b.configure(state="normal")
+            if dono is not None and not dono.winfo_exists(): continue
+            erro = futuro.exception()
+            if erro is None:
+                if ao_concluir: ao_concluir(futuro.result())
+            elif ao_falhar: ao_falhar(erro)
+            else: messagebox.showerror("Erro", str(erro))
+        if self._em_andamento: self.widget.after(self.intervalo_ms, self._drenar)
+        else: self._drenando = False
+
+class FonteExtrato:
+    # Sequência preguiçosa sobre o extrato paginado: busca páginas do backend
+    # conforme a lista rola. Fica presa ao total do momento em que foi criada;
+    # cada item ganha um "id" estável (posição cronológica) para o diff da lista.
+    def __init__(self, backend, cpf, pagina=100):
+        self.backend, self.cpf, self.pagina = backend, cpf, pagina
+        self.total = backend.total_extrato(cpf)
+        self._itens = []
+        self._cursor = self.total
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, i):
+        while i >= len(self._itens) and self._cursor:
+            itens, self._cursor = self.backend.consultar_extrato(self.cpf, self._cursor, self.pagina)
+            for item in itens:
+                item["id"] = self.total - 1 - len(self._itens)
+                self._itens.append(item)
+        return self._itens[i]
+
+class ListaVirtual(ctk.CTkFrame):
+    # Lista virtualizada: só existem widgets para as linhas visíveis (pool reciclado).
+    # criar_linha(parent) monta um widget de linha; preencher(widget, item) o atualiza.
+    # Ao trocar a fonte, só as linhas visíveis cujo (chave, item) mudou são preenchidas de novo.
+    def __init__(self, parent, criar_linha, preencher, altura_linha=56, chave=None, texto_vazio="", **kwargs):
+        kwargs.setdefault("fg_color", "transparent")
+        super().__init__(parent, **kwargs)
+        self.criar_linha, self.preencher = criar_linha, preencher
+        self.altura_linha = altura_linha
+        self.chave = chave or (lambda item: item)
+        self._fonte = []
+        self._topo = 0  # deslocamento em pixels
+        self._pool = []
+        self._exibidos = []  # (chave, item) exibido em cada widget do pool
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        self._janela = ctk.CTkFrame(self, fg_color="transparent")
+        self._janela.grid(row=0, column=0, sticky="nsew")
+        self._barra = ctk.CTkScrollbar(self, command=self._rolar)
+        self._barra.grid(row=0, column=1, sticky="ns")
+        self._lbl_vazio = ctk.CTkLabel(self._janela, text=texto_vazio, text_color=Cores.CINZA_TEXTO)
+        self._janela.bind("<Configure>", lambda e: self._renderizar())
+        self._rodas = [(evento, self.bind_all(evento, self._roda, add="+")) for evento in ("<MouseWheel>", "<Button-4>", "<Button-5>")]
+        # CTkFrame.bind liga no canvas interno; o <Destroy> tem que ser do próprio frame
+        tkinter.Frame.bind(self, "<Destroy>", self._desligar_roda, "+")
+
+    def definir_fonte(self, fonte):
+        # Se o usuário rolou para baixo e entraram itens no topo, mantém a mesma janela
+        novos = len(fonte) - len(self._fonte)
+        if self._topo and novos > 0: self._topo += novos * self.altura_linha
+        self._fonte = fonte
+        self._renderizar()
+
+    def _rolar(self, *args):
+        altura_total = len(self._fonte) * self.altura_linha
+        if args[0] == "moveto": self._topo = float(args[1]) * altura_total
+        elif args[0] == "scroll":
+            passo = self._janela.winfo_height() if args[2] == "pages" else self.altura_linha
+            self._topo += int(args[1]) * passo
+        self._renderizar()
+
+    def _desligar_roda(self, evento):
+        # Tira só os handlers desta lista do bind_all (as outras listas continuam ligadas)
+        if evento.widget is not self: return
+        for sequencia, funcid in self._rodas:
+            script = self.tk.call("bind", "all", sequencia)
+            self.tk.call("bind", "all", sequencia, "\n".join(l for l in script.split("\n") if funcid not in l))
+            self.deletecommand(funcid)
+        self._rodas = []
+
+    def _roda(self, evento):
+        # bind_all: só reage se o ponteiro estiver sobre esta lista (ou um filho dela)
+        caminho, proprio = str(evento.widget), str(self)
+        if not self.winfo_exists() or (caminho != proprio and not caminho.startswith(proprio + ".")): return
+        if evento.num == 4 or getattr(evento, "delta", 0) > 0: self._topo -= self.altura_linha * 3
+        else: self._topo += self.altura_linha * 3
+        self._renderizar()
+
+    def _renderizar(self):
+        altura = max(self._janela.winfo_height(), 1)
+        total = len(self._fonte)
+        altura_total = total * self.altura_linha
+        self._topo = int(min(max(self._topo, 0), max(0, altura_total - altura)))
+        primeiro = self._topo // self.altura_linha
+        visiveis = min(total - primeiro, altura // self.altura_linha + 2)
+
+        while len(self._pool) < visiveis:
+            self._pool.append(self.criar_linha(self._janela))
+            self._exibidos.append(None)
+        for j, linha in enumerate(self._pool):
+            if j >= visiveis:
+                if self._exibidos[j] is not None:
+                    linha.place_forget()
+                    self._exibidos[j] = None
+                continue
+            item = self._fonte[primeiro + j]
+            marca = (self.chave(item), item)
+            if self._exibidos[j] != marca:
+                self.preencher(linha, item)
+                self._exibidos[j] = marca
+            linha.place(x=0, y=(primeiro + j) * self.altura_linha - self._topo, relwidth=1)
+
+        if total: self._lbl_vazio.place_forget()
+        else: self._lbl_vazio.place(relx=0.5, y=10, anchor="n")
+        if altura_total > altura: self._barra.set(self._topo / altura_total, (self._topo + altura) / altura_total)
+        else: self._barra.set(0, 1)
+
 class LoginFrame(ctk.CTkFrame):
     def __init__(self, parent, controller):
         super().__init__(parent, fg_color=Cores.CINZA_CLARO, corner_radius=15)
@@ -234,13 +3197,19 @@ class LoginFrame(ctk.CTkFrame):
         self.entry_cpf.pack(pady=10)
         self.entry_senha = ctk.CTkEntry(self, placeholder_text="Senha", show="*", width=250, border_width=0, fg_color=Cores.BRANCO)
         self.entry_senha.pack(pady=10)
-        ctk.CTkButton(self, text="ENTRAR", width=250, fg_color=Cores.ROXO_PRINCIPAL, hover_color=Cores.ROXO_HOVER, command=self._fazer_login).pack(pady=20)
+        self.btn_entrar = ctk.CTkButton(self, text="ENTRAR", width=250, fg_color=Cores.ROXO_PRINCIPAL, hover_color=Cores.ROXO_HOVER, command=self._fazer_login)
+        self.btn_entrar.pack(pady=20)
         ctk.CTkButton(self, text="Criar conta", fg_color="transparent", text_color=Cores.ROXO_PRINCIPAL, hover_color=Cores.BRANCO, command=lambda: controller.trocar_tela("cadastro")).pack(pady=(0, 40))
 
     def _fazer_login(self):
         cpf = self.entry_cpf.get()
         senha = self.entry_senha.get()
-        sucesso, resposta = self.controller.backend.login(cpf, senha)
+        # A verificação da senha (KDF) roda no pool do backend; o Tk só recebe o resultado
+        self.controller.comandos.executar("login", self.controller.backend.login, cpf, senha,
+                                          ao_concluir=self._login_concluido, botoes=(self.btn_entrar,), dono=self)
+
+    def _login_concluido(self, resultado):
+        sucesso, resposta = resultado
         if sucesso:
             self.controller.usuario_atual = resposta
             self.controller.trocar_tela("dashboard")
@@ -258,11 +3227,16 @@ class CadastroFrame(ctk.CTkFrame):
         self.cpf.pack(pady=5)
         self.senha = ctk.CTkEntry(self, placeholder_text="Senha", show="*", width=250, border_width=0, fg_color=Cores.BRANCO)
         self.senha.pack(pady=5)
-        ctk.CTkButton(self, text="CADASTRAR", width=250, fg_color=Cores.ROXO_PRINCIPAL, hover_color=Cores.ROXO_HOVER, command=self._registrar).pack(pady=20)
+        self.btn_cadastrar = ctk.CTkButton(self, text="CADASTRAR", width=250, fg_color=Cores.ROXO_PRINCIPAL, hover_color=Cores.ROXO_HOVER, command=self._registrar)
+        self.btn_cadastrar.pack(pady=20)
         ctk.CTkButton(self, text="Voltar", fg_color="transparent", text_color=Cores.CINZA_TEXTO, hover_color=Cores.BRANCO, command=lambda: controller.trocar_tela("login")).pack(pady=5)
 
     def _registrar(self):
-        sucesso, msg = self.controller.backend.cadastrar(self.nome.get(), self.cpf.get(), self.senha.get())
+        self.controller.comandos.executar("cadastro", self.controller.backend.cadastrar, self.nome.get(), self.cpf.get(), self.senha.get(),
+                                          ao_concluir=self._cadastro_concluido, botoes=(self.btn_cadastrar,), dono=self)
+
+    def _cadastro_concluido(self, resultado):
+        sucesso, msg = resultado
         if sucesso:
             messagebox.showinfo("Sucesso", msg)
             self.controller.trocar_tela("login")
@@ -288,13 +3262,23 @@ class DashboardFrame(ctk.CTkFrame):
         self.area_principal.grid(row=0, column=1, sticky="nsew", padx=20, pady=20)
         
         # Inicia na tela Home
+        self._telas = {}
+        self._tela_visivel = None
         self._trocar_conteudo("inicio")
 
+        # Cotações ao vivo: o publicador empurra cada tick, a ponte entrega no Tk
+        self.assinatura_cotacoes = self.controller.publicador.assinar(PonteTk(self, self._receber_cotacoes))
+
     def _verificar_dividendos(self):
-        pagou, total, lista, user_att = self.controller.backend.processar_pagamentos_dividendos(self.controller.usuario_atual['cpf'])
+        self.controller.comandos.executar("dividendos", self.controller.backend.processar_pagamentos_dividendos,
+                                          self.controller.usuario_atual['cpf'], ao_concluir=self._dividendos_concluido, dono=self)
+
+    def _dividendos_concluido(self, resultado):
+        pagou, total, lista, user_att = resultado
         if pagou:
             self.controller.usuario_atual = user_att
             messagebox.showinfo("Dividendos", f"Recebido: R$ {total:.2f}")
+            self._atualizar_saldo_visual()
 
     def _criar_sidebar(self):
         sidebar = ctk.CTkFrame(self, width=220, corner_radius=0, fg_color=Cores.CINZA_CLARO)
@@ -323,19 +3307,25 @@ class DashboardFrame(ctk.CTkFrame):
                       command=lambda: self._trocar_conteudo(chave)).pack(fill="x", padx=10, pady=5)
 
     def _trocar_conteudo(self, tela):
-        # Limpa a área principal
-        for widget in self.area_principal.winfo_children():
-            widget.destroy()
-
-        if tela == "inicio": self._montar_inicio()
-        elif tela == "pix": self._montar_pix()
-        elif tela == "investimentos": self._montar_investimentos()
-        elif tela == "extrato": self._montar_extrato()
+        # Telas já montadas ficam em cache: trocar de aba só esconde/mostra e atualiza os dados
+        if self._tela_visivel: self._telas[self._tela_visivel].pack_forget()
+        if tela not in self._telas:
+            self._telas[tela] = ctk.CTkFrame(self.area_principal, fg_color="transparent")
+            if tela == "inicio": self._montar_inicio(self._telas[tela])
+            elif tela == "pix": self._montar_pix(self._telas[tela])
+            elif tela == "investimentos": self._montar_investimentos(self._telas[tela])
+            elif tela == "extrato": self._montar_extrato(self._telas[tela])
+        else:
+            if tela == "inicio": self._atualizar_saldo_visual()
+            elif tela == "investimentos": self._atualizar_investimentos()
+            elif tela == "extrato": self._atualizar_extrato_ui()
+        self._telas[tela].pack(fill="both", expand=True)
+        self._tela_visivel = tela
 
     # --- TELA: INÍCIO (Modificada: Mais Larga e Proporcional) ---
-    def _montar_inicio(self):
+    def _montar_inicio(self, parent):
         # Container principal centralizado que ocupa 80% da largura (relwidth=0.8)
-        container = ctk.CTkFrame(self.area_principal, fg_color="transparent")
+        container = ctk.CTkFrame(parent, fg_color="transparent")
         container.place(relx=0.5, rely=0.5, anchor="center", relwidth=0.8)
 
         # Card de Saldo (Esticado)
@@ -343,9 +3333,12 @@ class DashboardFrame(ctk.CTkFrame):
         card.pack(fill="x", pady=(0, 20)) # fill="x" faz esticar horizontalmente
         card.pack_propagate(False)
 
-        ctk.CTkLabel(card, text="Saldo Disponível", text_color="#E0E0E0", font=("Roboto", 16)).pack(pady=(45, 5))
+        ctk.CTkLabel(card, text="Saldo Disponível", text_color="#E0E0E0", font=("Roboto", 16)).pack(pady=(35, 5))
         self.lbl_saldo = ctk.CTkLabel(card, text=f"R$ {self.controller.usuario_atual['saldo']:.2f}", font=("Roboto", 48, "bold"), text_color="white")
         self.lbl_saldo.pack()
+        self.lbl_patrimonio = ctk.CTkLabel(card, text="", text_color="#E0E0E0", font=("Roboto", 14))
+        self.lbl_patrimonio.pack(pady=(5, 0))
+        self._atualizar_patrimonio_visual()
 
         # Botões de Ação (Container que estica)
         frame_acoes = ctk.CTkFrame(container, fg_color="transparent")
@@ -365,9 +3358,9 @@ class DashboardFrame(ctk.CTkFrame):
         btn_sac.pack(side="right", padx=(10, 0), fill="x", expand=True)
 
     # --- TELA: PIX (Modificada: Centralizada e Proporcional) ---
-    def _montar_pix(self):
+    def _montar_pix(self, parent):
         # Container centralizado para alinhar o título
-        main_container = ctk.CTkFrame(self.area_principal, fg_color="transparent")
+        main_container = ctk.CTkFrame(parent, fg_color="transparent")
         main_container.place(relx=0.5, rely=0.5, anchor="center", relwidth=0.6) # Ocupa 60% da tela
 
         ctk.CTkLabel(main_container, text="Área Pix", font=("Roboto Medium", 32), text_color=Cores.PRETO).pack(pady=(0, 30))
@@ -383,91 +3376,152 @@ class DashboardFrame(ctk.CTkFrame):
         self.pix_valor = ctk.CTkEntry(frame, placeholder_text="Valor (R$)", height=50, border_width=0, fg_color=Cores.BRANCO)
         self.pix_valor.pack(pady=(0, 30), padx=40, fill="x")
         
-        ctk.CTkButton(frame, text="ENVIAR PIX", height=55, fg_color=Cores.ROXO_PRINCIPAL, 
-                      hover_color=Cores.ROXO_HOVER, font=("Roboto Medium", 16),
-                      command=self._enviar_pix).pack(pady=(0, 40), padx=40, fill="x")
+        self.btn_pix = ctk.CTkButton(frame, text="ENVIAR PIX", height=55, fg_color=Cores.ROXO_PRINCIPAL, 
+                                     hover_color=Cores.ROXO_HOVER, font=("Roboto Medium", 16),
+                                     command=self._enviar_pix)
+        self.btn_pix.pack(pady=(0, 40), padx=40, fill="x")
 
-    def _montar_investimentos(self):
-        self.area_principal.grid_columnconfigure(0, weight=1)
-        self.area_principal.grid_columnconfigure(1, weight=1)
-        self.area_principal.grid_rowconfigure(0, weight=1)
+    def _montar_investimentos(self, parent):
+        parent.grid_columnconfigure(0, weight=1)
+        parent.grid_columnconfigure(1, weight=1)
+        parent.grid_rowconfigure(0, weight=1)
 
         # Coluna 1: Mercado
-        frame_mercado = ctk.CTkScrollableFrame(self.area_principal, label_text="Mercado", height=500)
+        frame_mercado = ctk.CTkFrame(parent, fg_color="transparent")
         frame_mercado.grid(row=0, column=0, sticky="nsew", padx=(0, 10))
-        
-        cotacoes = MarketAPI.get_prices()
-        for ticker, dados in cotacoes.items():
-            cor = Cores.VERDE_SUCESSO if dados["variacao"] >= 0 else Cores.VERMELHO_ERRO
-            card = ctk.CTkFrame(frame_mercado, fg_color=Cores.CINZA_CLARO)
-            card.pack(fill="x", pady=5)
-            
-            ctk.CTkLabel(card, text=f"{ticker}\nR$ {dados['preco']:.2f}", text_color=Cores.PRETO, 
-                         font=("Roboto", 14, "bold"), justify="left").pack(side="left", padx=10, pady=10)
-            ctk.CTkLabel(card, text=f"{dados['variacao']}%", text_color=cor, font=("Roboto", 12)).pack(side="left", padx=5)
-            ctk.CTkButton(card, text="Comprar", width=60, height=25, fg_color=Cores.ROXO_PRINCIPAL, 
-                          command=lambda t=ticker, p=dados['preco']: self._comprar_acao(t, p)).pack(side="right", padx=10)
+        ctk.CTkLabel(frame_mercado, text="Mercado", font=("Roboto Medium", 18), text_color=Cores.PRETO).pack(anchor="w", pady=(0, 10))
+        self.lista_mercado = ListaVirtual(frame_mercado, self._criar_linha_mercado, self._preencher_linha_mercado,
+                                          altura_linha=60, chave=lambda item: item[0])
+        self.lista_mercado.pack(fill="both", expand=True)
 
         # Coluna 2: Carteira
-        direita_frame = ctk.CTkFrame(self.area_principal, fg_color="transparent")
+        direita_frame = ctk.CTkFrame(parent, fg_color="transparent")
         direita_frame.grid(row=0, column=1, sticky="nsew", padx=(10, 0))
         
         ctk.CTkLabel(direita_frame, text="Minha Carteira", font=("Roboto Medium", 18), text_color=Cores.PRETO).pack(anchor="w", pady=(0, 10))
         
-        self.carteira_container = ctk.CTkScrollableFrame(direita_frame, height=250)
+        self.carteira_container = ListaVirtual(direita_frame, self._criar_linha_carteira, self._preencher_linha_carteira,
+                                               altura_linha=48, chave=lambda item: item[0], texto_vazio="Carteira vazia.", height=250)
         self.carteira_container.pack(fill="x", pady=(0, 20))
-        self._atualizar_carteira_ui()
 
         ctk.CTkLabel(direita_frame, text="Proventos Futuros", font=("Roboto Medium", 18), text_color=Cores.PRETO).pack(anchor="w", pady=(0, 10))
-        self.proventos_container = ctk.CTkScrollableFrame(direita_frame, height=200)
+        self.proventos_container = ListaVirtual(direita_frame, self._criar_linha_provento, self._preencher_linha_provento,
+                                                altura_linha=64, chave=lambda item: item[0], height=200)
         self.proventos_container.pack(fill="both", expand=True)
-        self._atualizar_calendario_ui()
+        self._atualizar_investimentos()
 
-    def _montar_extrato(self):
-        ctk.CTkLabel(self.area_principal, text="Histórico de Transações", font=("Roboto Medium", 22), text_color=Cores.PRETO).pack(anchor="w", pady=(0, 20))
-        self.frame_extrato = ctk.CTkScrollableFrame(self.area_principal, fg_color="transparent")
+    def _montar_extrato(self, parent):
+        ctk.CTkLabel(parent, text="Histórico de Transações", font=("Roboto Medium", 22), text_color=Cores.PRETO).pack(anchor="w", pady=(0, 20))
+        self.frame_extrato = ListaVirtual(parent, self._criar_linha_extrato, self._preencher_linha_extrato,
+                                          altura_linha=56, chave=lambda item: item["id"], texto_vazio="Nenhuma transação.")
         self.frame_extrato.pack(fill="both", expand=True)
         self._atualizar_extrato_ui()
 
     # --- Atualizações de UI ---
+    # Cada lista só recria dados; os widgets das linhas visíveis são reaproveitados
+    # e só as linhas cujo conteúdo mudou são reconfiguradas.
+    def _atualizar_investimentos(self):
+        # Mesmo snapshot para o painel, a carteira e a execução das ordens desta tela
+        self.snapshot_cotacoes = MarketAPI.get_snapshot()
+        self.lista_mercado.definir_fonte(list(self.snapshot_cotacoes["cotacoes"].items()))
+        self._atualizar_carteira_ui()
+        self._atualizar_calendario_ui()
+
+    def _receber_cotacoes(self, snap):
+        # Aba escondida não redesenha; ao voltar, _atualizar_investimentos pega o snapshot atual
+        if self._tela_visivel == "inicio": self._atualizar_patrimonio_visual()
+        if self._tela_visivel != "investimentos": return
+        self.snapshot_cotacoes = snap
+        self.lista_mercado.definir_fonte(list(snap["cotacoes"].items()))
+        self._atualizar_carteira_ui()
+
     def _atualizar_carteira_ui(self):
-        for widget in self.carteira_container.winfo_children(): widget.destroy()
         investimentos = self.controller.usuario_atual.get("investimentos", {})
-        if not investimentos: ctk.CTkLabel(self.carteira_container, text="Carteira vazia.").pack(pady=10)
-        for ticker, dados in investimentos.items():
-            if dados['qtd'] > 0:
-                card = ctk.CTkFrame(self.carteira_container, fg_color=Cores.BRANCO)
-                card.pack(fill="x", pady=2)
-                ctk.CTkLabel(card, text=f"{ticker} (x{dados['qtd']})", text_color=Cores.PRETO).pack(side="left", padx=10, pady=10)
-                ctk.CTkButton(card, text="Vender", width=60, fg_color=Cores.VERMELHO_ERRO, height=25,
-                              command=lambda t=ticker: self._vender_acao(t)).pack(side="right", padx=10)
+        cotacoes = self.snapshot_cotacoes["cotacoes"]
+        # Ativo sem cotação no snapshot (importado de dados antigos) vale pelo custo médio
+        itens = [(ticker, dados['qtd'], dados['qtd'] * cotacoes.get(ticker, {}).get('preco', dados['preco_medio']))
+                 for ticker, dados in investimentos.items() if dados['qtd'] > 0]
+        self.carteira_container.definir_fonte(itens)
 
     def _atualizar_calendario_ui(self):
-        for widget in self.proventos_container.winfo_children(): widget.destroy()
         info = MarketAPI.get_info_dividendos()
         user_invest = self.controller.usuario_atual.get("investimentos", {})
-        for ticker, dados in info.items():
-            if ticker in user_invest and user_invest[ticker]["qtd"] > 0:
-                qtd = user_invest[ticker]["qtd"]
-                card = ctk.CTkFrame(self.proventos_container, fg_color=Cores.BRANCO)
-                card.pack(fill="x", pady=5)
-                ctk.CTkLabel(card, text=f"{ticker} - {dados['data']}", font=("Roboto", 12, "bold"), text_color=Cores.ROXO_PRINCIPAL).pack(anchor="w", padx=10, pady=5)
-                ctk.CTkLabel(card, text=f"Previsto: R$ {(dados['valor']*qtd):.2f}", font=("Roboto", 12), text_color=Cores.VERDE_SUCESSO).pack(anchor="e", padx=10, pady=5)
+        itens = [(ticker, dados['data'], dados['valor'] * user_invest[ticker]["qtd"])
+                 for ticker, dados in info.items() if ticker in user_invest and user_invest[ticker]["qtd"] > 0]
+        self.proventos_container.definir_fonte(itens)
 
     def _atualizar_extrato_ui(self):
-        for widget in self.frame_extrato.winfo_children(): widget.destroy()
-        extrato = self.controller.usuario_atual.get("extrato", [])
-        for item in extrato:
-            cor = Cores.VERDE_SUCESSO if item["valor"] > 0 else Cores.VERMELHO_ERRO
-            card = ctk.CTkFrame(self.frame_extrato, fg_color=Cores.BRANCO, height=50)
-            card.pack(fill="x", pady=3)
-            ctk.CTkLabel(card, text=f"{item['data']} - {item['tipo']}", text_color=Cores.CINZA_TEXTO).pack(side="left", padx=15, pady=10)
-            ctk.CTkLabel(card, text=f"R$ {abs(item['valor']):.2f}", text_color=cor, font=("Roboto", 12, "bold")).pack(side="right", padx=15)
+        self.frame_extrato.definir_fonte(FonteExtrato(self.controller.backend, self.controller.usuario_atual['cpf']))
+
+    # --- Linhas das listas virtuais (criadas uma vez, preenchidas a cada reuso) ---
+    def _criar_linha_mercado(self, parent):
+        card = ctk.CTkFrame(parent, fg_color=Cores.CINZA_CLARO, height=54)
+        card.lbl_ticker = ctk.CTkLabel(card, text="", text_color=Cores.PRETO, font=("Roboto", 14, "bold"), justify="left")
+        card.lbl_ticker.pack(side="left", padx=10, pady=5)
+        card.lbl_variacao = ctk.CTkLabel(card, text="", font=("Roboto", 12))
+        card.lbl_variacao.pack(side="left", padx=5)
+        card.btn = ctk.CTkButton(card, text="Comprar", width=60, height=25, fg_color=Cores.ROXO_PRINCIPAL)
+        card.btn.pack(side="right", padx=10)
+        return card
+
+    def _preencher_linha_mercado(self, card, item):
+        ticker, dados = item
+        cor = Cores.VERDE_SUCESSO if dados["variacao"] >= 0 else Cores.VERMELHO_ERRO
+        card.lbl_ticker.configure(text=f"{ticker}\nR$ {dados['preco']:.2f}")
+        card.lbl_variacao.configure(text=f"{dados['variacao']}%", text_color=cor)
+        card.btn.configure(command=lambda t=ticker: self._comprar_acao(t))
+
+    def _criar_linha_carteira(self, parent):
+        card = ctk.CTkFrame(parent, fg_color=Cores.BRANCO, height=44)
+        card.lbl = ctk.CTkLabel(card, text="", text_color=Cores.PRETO)
+        card.lbl.pack(side="left", padx=10, pady=5)
+        card.btn = ctk.CTkButton(card, text="Vender", width=60, fg_color=Cores.VERMELHO_ERRO, height=25)
+        card.btn.pack(side="right", padx=10)
+        return card
+
+    def _preencher_linha_carteira(self, card, item):
+        ticker, qtd, valor = item
+        card.lbl.configure(text=f"{ticker} (x{qtd})  R$ {valor:.2f}")
+        card.btn.configure(command=lambda t=ticker: self._vender_acao(t))
+
+    def _criar_linha_provento(self, parent):
+        card = ctk.CTkFrame(parent, fg_color=Cores.BRANCO, height=58)
+        card.lbl_data = ctk.CTkLabel(card, text="", font=("Roboto", 12, "bold"), text_color=Cores.ROXO_PRINCIPAL)
+        card.lbl_data.pack(anchor="w", padx=10)
+        card.lbl_valor = ctk.CTkLabel(card, text="", font=("Roboto", 12), text_color=Cores.VERDE_SUCESSO)
+        card.lbl_valor.pack(anchor="e", padx=10)
+        return card
+
+    def _preencher_linha_provento(self, card, item):
+        ticker, data, previsto = item
+        card.lbl_data.configure(text=f"{ticker} - {data}")
+        card.lbl_valor.configure(text=f"Previsto: R$ {previsto:.2f}")
+
+    def _criar_linha_extrato(self, parent):
+        card = ctk.CTkFrame(parent, fg_color=Cores.BRANCO, height=50)
+        card.lbl_desc = ctk.CTkLabel(card, text="", text_color=Cores.CINZA_TEXTO)
+        card.lbl_desc.pack(side="left", padx=15, pady=10)
+        card.lbl_valor = ctk.CTkLabel(card, text="", font=("Roboto", 12, "bold"))
+        card.lbl_valor.pack(side="right", padx=15)
+        return card
+
+    def _preencher_linha_extrato(self, card, item):
+        cor = Cores.VERDE_SUCESSO if item["valor"] > 0 else Cores.VERMELHO_ERRO
+        card.lbl_desc.configure(text=f"{item['data']} - {item['tipo']}")
+        card.lbl_valor.configure(text=f"R$ {abs(item['valor']):.2f}", text_color=cor)
 
     def _atualizar_saldo_visual(self):
         # Atualiza apenas se o label existir (estiver na tela Home)
         if hasattr(self, 'lbl_saldo') and self.lbl_saldo.winfo_exists():
             self.lbl_saldo.configure(text=f"R$ {self.controller.usuario_atual['saldo']:.2f}")
+            self._atualizar_patrimonio_visual()
+
+    def _atualizar_patrimonio_visual(self):
+        resumo = self.controller.valorizacao.resumo(self.controller.usuario_atual['cpf'])
+        if not resumo or not resumo["custo"]:
+            self.lbl_patrimonio.configure(text="")
+            return
+        self.lbl_patrimonio.configure(text=f"Investido: R$ {resumo['valor_mercado']:.2f}  |  P&L: R$ {resumo['pnl_nao_realizado']:+.2f}")
 
     # --- Lógica de Negócio (Calls) ---
     def _transacao_simples(self, tipo):
@@ -484,69 +3538,107 @@ class DashboardFrame(ctk.CTkFrame):
                         return
                     val = -val # Torna negativo para o backend
                 
-                # Envia o valor (já negativo se for saque) para o backend
-                ns, _ = self.controller.backend.deposito_saque(self.controller.usuario_atual['cpf'], val, tipo.capitalize())
-                
-                self.controller.usuario_atual['saldo'] = ns
-                self._atualizar_saldo_visual()
-                
-                if tipo == "saque": 
-                    self._trocar_conteudo("inicio") # Refresh
-                else: 
-                    self._atualizar_saldo_visual()
+                # Envia o valor (já negativo se for saque) para o backend, fora da thread do Tk
+                self.controller.comandos.executar("movimento", self.controller.backend.deposito_saque,
+                                                  self.controller.usuario_atual['cpf'], val, tipo.capitalize(),
+                                                  ao_concluir=lambda r: self._movimento_concluido(tipo, r), dono=self)
             except ValueError:
                 messagebox.showerror("Erro", "Valor inválido")
 
+    def _movimento_concluido(self, tipo, resultado):
+        ns, erro = resultado
+        if ns is None:
+            messagebox.showwarning("Ops", erro)
+            return
+        self.controller.usuario_atual['saldo'] = ns
+        if tipo == "saque": 
+            self._trocar_conteudo("inicio") # Refresh
+        else: 
+            self._atualizar_saldo_visual()
+
     def _enviar_pix(self):
         try:
             val = float(self.pix_valor.get())
-            ok, res = self.controller.backend.realizar_pix(self.controller.usuario_atual['cpf'], self.pix_cpf.get(), val)
-            if ok: 
-                self.controller.usuario_atual['saldo'] = res
-                messagebox.showinfo("Sucesso", "Pix enviado!")
-                self._trocar_conteudo("inicio")
-            else: messagebox.showerror("Erro", res)
-        except: pass
-
-    def _comprar_acao(self, ticker, preco):
+        except ValueError:
+            return
+        self.controller.comandos.executar("pix", self.controller.backend.realizar_pix, self.controller.usuario_atual['cpf'], self.pix_cpf.get(), val,
+                                          ao_concluir=self._pix_concluido, botoes=(self.btn_pix,), dono=self)
+
+    def _pix_concluido(self, resultado):
+        ok, res = resultado
+        if ok: 
+            self.controller.usuario_atual['saldo'] = res
+            messagebox.showinfo("Sucesso", "Pix enviado!")
+            self._trocar_conteudo("inicio")
+        else: messagebox.showerror("Erro", res)
+
+    def _cotacao_tela(self, ticker):
+        # Preço e versão do snapshot exibido na tela de investimentos
+        snap = self.snapshot_cotacoes
+        return snap["cotacoes"][ticker]["preco"], snap["versao"]
+
+    def _comprar_acao(self, ticker):
         d = ctk.CTkInputDialog(text="Qtd:", title="Comprar")
         q = d.get_input()
         if q:
-            ok, res = self.controller.backend.investir(self.controller.usuario_atual['cpf'], ticker, int(q), preco, "compra")
-            if ok:
-                self.controller.usuario_atual = res
-                messagebox.showinfo("Sucesso", "Ação comprada!")
-                self._trocar_conteudo("investimentos") # Refresh
-            else: messagebox.showerror("Erro", res)
+            preco, versao = self._cotacao_tela(ticker)
+            self.controller.comandos.executar("investimento", self.controller.backend.investir,
+                                              self.controller.usuario_atual['cpf'], ticker, int(q), preco, "compra", versao,
+                                              ao_concluir=lambda r: self._ordem_concluida("Ação comprada!", r), dono=self)
 
     def _vender_acao(self, ticker):
         d = ctk.CTkInputDialog(text="Qtd:", title="Vender")
         q = d.get_input()
         if q:
-            # Preço aproximado de venda (pega da API)
-            preco = MarketAPI.EMPRESAS[ticker]["preco_base"] 
-            ok, res = self.controller.backend.investir(self.controller.usuario_atual['cpf'], ticker, int(q), preco, "venda")
-            if ok:
-                self.controller.usuario_atual = res
-                messagebox.showinfo("Sucesso", "Venda realizada!")
-                self._trocar_conteudo("investimentos") # Refresh
-            else: messagebox.showerror("Erro", res)
+            if ticker not in self.snapshot_cotacoes["cotacoes"]:
+                messagebox.showwarning("Ops", f"{ticker} sem cotação no momento.")
+                return
+            # Vende pela mesma cotação exibida (snapshot em cache)
+            preco, versao = self._cotacao_tela(ticker)
+            self.controller.comandos.executar("investimento", self.controller.backend.investir,
+                                              self.controller.usuario_atual['cpf'], ticker, int(q), preco, "venda", versao,
+                                              ao_concluir=lambda r: self._ordem_concluida("Venda realizada!", r), dono=self)
+
+    def _ordem_concluida(self, mensagem, resultado):
+        ok, res = resultado
+        if ok:
+            self.controller.usuario_atual = res
+            messagebox.showinfo("Sucesso", mensagem)
+            self._atualizar_carteira_ui() # Refresh
+            self._atualizar_calendario_ui()
+        else: messagebox.showerror("Erro", res)
 
     def _logout(self):
+        self.controller.publicador.cancelar(self.assinatura_cotacoes)
         self.controller.usuario_atual = None
         self.controller.trocar_tela("login")
 
 class App(ctk.CTk):
-    def __init__(self):
+    def __init__(self, backend=None):
         super().__init__()
-        self.backend = BancoBackend()
+        self.backend = backend or BancoBackend()
+        self.backend.agendar_dividendos()
+        MarketAPI.configurar_historico()
+        self.publicador = PublicadorCotacoes(frequencia=1).iniciar()
+        # Valor de mercado e P&L das carteiras acompanham cada tick e cada ordem
+        self.valorizacao = MotorValorizacao(self.backend, {t: c["preco"] for t, c in MarketAPI.get_snapshot()["cotacoes"].items()})
+        self.publicador.assinar(self.valorizacao.receber_snapshot)
+        self.comandos = ExecutorComandos(self, self.backend)
         self.usuario_atual = None
         self.title("BankPY - Sistema Financeiro")
         self.geometry("1100x700")
         self.configure(fg_color=Cores.BRANCO)
         self.tela_atual = None
+        self.protocol("WM_DELETE_WINDOW", self._fechar)
         self.trocar_tela("login")
 
+    def _fechar(self):
+        # Garante o log fechado e o snapshot em dia antes de sair
+        self.publicador.parar()
+        self.backend.fechar()
+        MarketAPI.historico.descarregar()
+        self.destroy()
+
     def trocar_tela(self, nome_tela):
         if self.tela_atual: self.tela_atual.destroy()
         if nome_tela == "login": self.tela_atual = LoginFrame(self, self)
@@ -554,5 +3646,21 @@ class App(ctk.CTk):
         elif nome_tela == "dashboard": self.tela_atual = DashboardFrame(self, self)
 
 if __name__ == "__main__":
-    app = App()
-    app.mainloop()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="BankPY")
+    parser.add_argument("--servidor", action="store_true", help="modo sem interface: API HTTP/JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("--arquivo", default="bank_data.json")
+    parser.add_argument("--verboso", action="store_true")
+    parser.add_argument("--metricas", action="store_true", help="liga a instrumentação (GET /metricas no modo servidor)")
+    args = parser.parse_args()
+    if args.metricas: Metricas.ligar()
+    perfil = Perfilador.do_ambiente()  # BANKPY_PERFIL=cprofile|amostragem
+    try:
+        if args.servidor:
+            servir(args.arquivo, args.host, args.porta, args.verboso)
+        else:
+            app = App(BancoBackend(args.arquivo))
+            app.mainloop()
+    finally:
+        if perfil: print(f"Perfil gravado em {perfil.parar()}")
\ No newline at end of file
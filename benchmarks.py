@@ -0,0 +1,945 @@
+import os
+import sys
+import json
+import argparse
+import platform
+import time
+import random
+import signal
+import subprocess
+import http.client
+import shutil
+import tempfile
+import threading
+import tracemalloc
+import statistics
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from banco import (BancoBackend, MotorPrecos, HistoricoPrecos, CacheCotacoes, PublicadorCotacoes,
+                   Ordem, LivroOfertas, MotorOrdens, MotorValorizacao, Conta, CodecContas, Dinheiro,
+                   Metricas, MarketAPI, Senhas, FonteExtrato, BancoFragmentado,
+                   ServidorBanco)
+
+# --- Geração de dados sintéticos ---
+def gerar_cpf(rng):
+    # Gera um CPF válido (nove dígitos aleatórios + os dois verificadores)
+    digitos = [rng.randint(0, 9) for _ in range(9)]
+    if len(set(digitos)) == 1: digitos[0] = (digitos[0] + 1) % 10
+    for peso_inicial in (10, 11):
+        soma = sum(d * (peso_inicial - i) for i, d in enumerate(digitos))
+        resto = soma % 11
+        digitos.append(0 if resto < 2 else 11 - resto)
+    return ''.join(map(str, digitos))
+
+def gerar_usuarios(n, seed=42, saldo=1000.0):
+    rng = random.Random(seed)
+    cpfs = set()
+    while len(cpfs) < n: cpfs.add(gerar_cpf(rng))
+    return [{"nome": f"Cliente {i}", "cpf": cpf, "senha": "senha", "saldo": saldo,
+             "extrato": [], "investimentos": {}, "dividendos_recebidos": {}}
+            for i, cpf in enumerate(sorted(cpfs))]
+
+def gerar_banco_sintetico(contas, transacoes=10, seed=42):
+    # Banco reprodutível no formato do bank_data.json: CPFs válidos, M lançamentos de
+    # extrato por conta e carteira aleatória sobre MarketAPI.EMPRESAS (mesma seed =
+    # mesmo banco, exceto o sal da senha). A senha de todos é "senha", já com hash
+    # (um KDF só na geração).
+    rng = random.Random(seed)
+    usuarios = gerar_usuarios(contas, seed)
+    senha = Senhas.gerar("senha")
+    tickers = sorted(MarketAPI.EMPRESAS)
+    inicio = datetime(2025, 1, 1)
+    for u in usuarios:
+        u["senha"] = senha
+        u["saldo"] = round(rng.uniform(1_000, 50_000), 2)
+        u["investimentos"] = {t: {"qtd": rng.randint(1, 50) * 10, "preco_medio": round(MarketAPI.EMPRESAS[t]["preco_base"] * rng.uniform(0.8, 1.2), 2)}
+                              for t in rng.sample(tickers, rng.randint(0, 3))}
+        datas = sorted(inicio + timedelta(minutes=rng.randrange(525_600)) for _ in range(transacoes))
+        extrato = []
+        for data in datas:
+            valor = round(rng.uniform(1, 2_000), 2)
+            tipo = rng.choice(("Deposito", "Saque", "Pix Enviado", "Pix Recebido"))
+            if tipo in ("Saque", "Pix Enviado"): valor = -valor
+            extrato.append({"data": data.strftime("%d/%m/%Y %H:%M"), "tipo": tipo, "valor": valor, "detalhe": ""})
+        u["extrato"] = extrato[::-1]  # mais recente primeiro, como no formato antigo
+    return usuarios
+
+_PASTAS_TEMPORARIAS = []
+
+def pasta_temporaria(prefixo="bankpy_bench_"):
+    # Removida por limpar_pastas() ao fim de cada cenário
+    pasta = tempfile.mkdtemp(prefix=prefixo)
+    _PASTAS_TEMPORARIAS.append(pasta)
+    return pasta
+
+def limpar_pastas():
+    while _PASTAS_TEMPORARIAS: shutil.rmtree(_PASTAS_TEMPORARIAS.pop(), ignore_errors=True)
+
+def criar_banco(usuarios, pasta=None, **kwargs):
+    # Monta um bank_data.json no formato antigo e deixa o backend importar
+    pasta = pasta or pasta_temporaria()
+    arquivo = os.path.join(pasta, "bank_data.json")
+    with open(arquivo, "w", encoding='utf-8') as f: json.dump(usuarios, f)
+    kwargs.setdefault("fsync", False)
+    return BancoBackend(arquivo, **kwargs)
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1e6  # microssegundos
+
+# --- Cenários ---
+def bench_indice_cpf(escalas=(10, 1_000, 100_000), repeticoes=2_000):
+    # Latência de login e Pix conforme o número de contas cresce. O login mede o
+    # caminho com o KDF já em cache (índice + trava + cópia), numa amostra aquecida.
+    print(f"{'contas':>10} {'login (us)':>12} {'pix (us)':>12}")
+    for n in escalas:
+        usuarios = gerar_usuarios(n)
+        banco = criar_banco(usuarios)
+        rng = random.Random(7)
+        cpfs = [u["cpf"] for u in usuarios]
+        amostra = cpfs[::max(1, n // 100)]
+        for cpf in amostra: banco.login(cpf, "senha")
+        login = medir(lambda: banco.login(rng.choice(amostra), "senha"), repeticoes)
+        pix = medir(lambda: banco.realizar_pix(*rng.sample(cpfs, 2), 0.01) if n > 1 else None, repeticoes)
+        print(f"{n:>10} {login:>12.1f} {pix:>12.1f}")
+        banco.fechar()
+
+def stress_pix_concorrente(contas=200, transferencias=20_000, threads=16, fsync=False):
+    # Milhares de Pix em paralelo: o saldo total do banco tem que se conservar,
+    # em memória e depois de reabrir (replay do log)
+    usuarios = gerar_usuarios(contas, saldo=100.0)
+    pasta = pasta_temporaria("bankpy_stress_")
+    banco = criar_banco(usuarios, pasta, fsync=fsync, limite_compactacao=2_000)
+    cpfs = [u["cpf"] for u in usuarios]
+    total_inicial = sum(Dinheiro.centavos(u["saldo"]) for u in usuarios)  # centavos
+
+    def transferir(i):
+        rng = random.Random(i)
+        de, para = rng.sample(cpfs, 2)
+        return banco.realizar_pix(de, para, rng.randint(1, 50))[0]
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool: ok = sum(pool.map(transferir, range(transferencias)))
+    duracao = time.perf_counter() - inicio
+
+    total_memoria = sum(banco._buscar(c).saldo for c in cpfs)
+    banco.fechar()
+    reaberto = BancoBackend(os.path.join(pasta, "bank_data.json"), fsync=False)
+    total_disco = sum(reaberto._buscar(c).saldo for c in cpfs)
+    negativos = sum(1 for c in cpfs if reaberto._buscar(c).saldo < 0)
+    conciliado = reaberto.conciliar()["ok"]  # razão x saldos depois do replay
+    reaberto.fechar()
+
+    print(f"{transferencias} Pix ({ok} aceitos) em {threads} threads: {duracao:.2f}s ({transferencias / duracao:,.0f}/s)")
+    print(f"total inicial {total_inicial / 100:.2f} | memória {total_memoria / 100:.2f} | após replay {total_disco / 100:.2f} | saldos negativos {negativos}")
+    print(f"razão conciliado: {conciliado}")
+    assert total_memoria == total_inicial and total_disco == total_inicial and not negativos, "Saldo total não conservado!"
+    assert conciliado, "Razão diverge dos saldos!"
+
+def bench_lote(contas=10_000, operacoes=10_000, fsync=True):
+    # Folha de pagamento: N depósitos um a um (um commit cada) x um único lote
+    usuarios = gerar_usuarios(contas)
+    cpfs = [u["cpf"] for u in usuarios]
+    folha = [{"op": "deposito", "cpf": cpfs[i % contas], "valor": 1500.0} for i in range(operacoes)]
+
+    banco = criar_banco(usuarios, fsync=fsync)
+    inicio = time.perf_counter()
+    for op in folha: banco.deposito_saque(op["cpf"], op["valor"], "Deposito")
+    individual = time.perf_counter() - inicio
+    banco.fechar()
+
+    banco = criar_banco(usuarios, fsync=fsync)
+    inicio = time.perf_counter()
+    ok, _ = banco.executar_lote(folha)
+    lote = time.perf_counter() - inicio
+    banco.fechar()
+
+    print(f"{operacoes} depósitos (fsync={fsync}): individual {individual:.2f}s | lote {lote:.2f}s ({individual / lote:.0f}x)")
+    assert ok
+
+    # Valor não finito é rejeitado sem deixar o que já foi aplicado fora do log
+    banco = criar_banco(usuarios[:10], fsync=fsync)
+    ok, resultados = banco.executar_lote([{"op": "deposito", "cpf": cpfs[0], "valor": 100.0}, {"op": "deposito", "cpf": cpfs[0], "valor": "inf"},
+                                          {"op": "pix", "de": cpfs[0], "para": cpfs[1], "valor": "nan"}], modo="melhor_esforco")
+    assert not ok and resultados[0][0] and resultados[1] == resultados[2] == (False, "Valor inválido.")
+    assert banco.conciliar()["ok"]
+
+    # Preço negativo ou ticker fora do mercado não movem o saldo (lote e ordem avulsa)
+    saldo = banco.login(cpfs[1], "senha")[1]["saldo"]
+    ok, resultados = banco.executar_lote([{"op": "compra", "cpf": cpfs[1], "ticker": "PETR4", "qtd": 1, "preco": -1000.0},
+                                          {"op": "compra", "cpf": cpfs[1], "ticker": "XXXX3", "qtd": 1, "preco": 10.0}], modo="melhor_esforco")
+    assert not ok and resultados == [(False, "Preço inválido."), (False, "Ticker não encontrado.")]
+    assert banco.investir(cpfs[1], "PETR4", 1, -1000.0) == (False, "Preço inválido.")
+    assert banco.login(cpfs[1], "senha")[1]["saldo"] == saldo
+    banco.fechar()
+
+def bench_motor_precos(tamanhos=(5, 100, 1_000, 10_000, 100_000), duracao=1.0):
+    # Ticks por segundo do motor vetorizado x laço antigo com random.uniform por ticker
+    print(f"{'tickers':>10} {'ticks/s motor':>15} {'ticks/s laço':>15}")
+    for n in tamanhos:
+        precos = {f"T{i:06d}": 10.0 + i % 90 for i in range(n)}
+        motor = MotorPrecos(precos, correlacao=0.3, seed=1)
+        ticks, inicio = 0, time.perf_counter()
+        while time.perf_counter() - inicio < duracao:
+            motor.avancar()
+            ticks += 1
+        por_segundo = ticks / (time.perf_counter() - inicio)
+
+        rng = random.Random(1)
+        ticks_laco, inicio = 0, time.perf_counter()
+        while time.perf_counter() - inicio < duracao:
+            {t: round(p * (1 + rng.uniform(-0.02, 0.02)), 2) for t, p in precos.items()}
+            ticks_laco += 1
+        laco = ticks_laco / (time.perf_counter() - inicio)
+        print(f"{n:>10} {por_segundo:>15,.0f} {laco:>15,.0f}")
+
+def bench_historico(pontos=1_000_000, tickers=5):
+    # Gravação de ticks + consulta de intervalo e candles de 1 minuto,
+    # comparando com carregar a mesma série de um JSON
+    pasta = pasta_temporaria("bankpy_hist_")
+    historico = HistoricoPrecos(pasta, ticks_por_descarga=10_000)
+    motor = MotorPrecos({f"T{i}": 10.0 + i for i in range(tickers)}, seed=1)
+    inicio_serie = 1_700_000_000.0
+
+    inicio = time.perf_counter()
+    for i in range(pontos): historico.registrar(motor.tickers, motor.avancar(), inicio_serie + i)
+    historico.descarregar()
+    gravacao = time.perf_counter() - inicio
+
+    fim_serie = inicio_serie + pontos
+    janela = (fim_serie - 30 * 86400 if pontos > 30 * 86400 else inicio_serie + pontos / 2, fim_serie)
+    consulta = medir(lambda: historico.serie("T0", *janela), 50)
+    candles = medir(lambda: historico.ohlc("T0", 60, *janela), 5)
+
+    ts, precos = historico.serie("T0")
+    arquivo_json = os.path.join(pasta, "T0.json")
+    with open(arquivo_json, "w") as f: json.dump({"ts": ts.tolist(), "preco": precos.tolist()}, f)
+    def ler_json():
+        with open(arquivo_json) as f: json.load(f)
+    leitura_json = medir(ler_json, 3)
+
+    print(f"gravação: {pontos:,} ticks x {tickers} tickers em {gravacao:.2f}s ({pontos / gravacao:,.0f} ticks/s)")
+    print(f"intervalo (memmap): {consulta:,.0f} us | OHLC 1min: {candles / 1000:,.1f} ms | JSON.load da série: {leitura_json / 1000:,.1f} ms")
+
+def bench_dividendos(escalas=(10_000, 100_000, 200_000)):
+    # Job de dividendos do banco inteiro x pagamento conta a conta (fluxo antigo do login)
+    print(f"{'detentores':>10} {'job (s)':>9} {'contas/s':>12} {'repetição (s)':>14} {'conta a conta (s)':>18}")
+    for n in escalas:
+        usuarios = gerar_usuarios(n)
+        for u in usuarios: u["investimentos"] = {"PETR4": {"qtd": 100, "preco_medio": 30.0}}
+
+        banco = criar_banco(usuarios, fsync=True)
+        inicio = time.perf_counter()
+        pagas, _ = banco.pagar_dividendos()
+        job = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        repetidas, _ = banco.pagar_dividendos()  # idempotente: não paga de novo
+        repeticao = time.perf_counter() - inicio
+        banco.fechar()
+        assert pagas == n and repetidas == 0
+
+        banco = criar_banco(usuarios, fsync=True)
+        inicio = time.perf_counter()
+        for u in usuarios: banco.processar_pagamentos_dividendos(u["cpf"])
+        individual = time.perf_counter() - inicio
+        banco.fechar()
+        print(f"{n:>10} {job:>9.2f} {n / job:>12,.0f} {repeticao:>14.2f} {individual:>18.2f}")
+
+def bench_dashboard_ui(tamanhos=(100, 1_000, 10_000, 50_000)):
+    # Abrir a aba de extrato e atualizá-la conforme o histórico cresce (precisa de display)
+    import tkinter
+    from banco import App
+    print(f"{'transações':>11} {'1ª abertura (ms)':>17} {'troca de aba (ms)':>18} {'refresh (ms)':>13}")
+    for n in tamanhos:
+        usuarios = gerar_usuarios(1)
+        cpf = usuarios[0]["cpf"]
+        banco = criar_banco(usuarios)
+        banco.executar_lote([{"op": "deposito", "cpf": cpf, "valor": 1.0}] * n)
+        try:
+            app = App(banco)
+        except tkinter.TclError:
+            print("sem display disponível: cenário ignorado")
+            banco.fechar()
+            return
+        app.usuario_atual = banco.login(cpf, "senha")[1]
+        app.trocar_tela("dashboard")
+        app.update()
+        dash = app.tela_atual
+
+        inicio = time.perf_counter()
+        dash._trocar_conteudo("extrato")
+        app.update()
+        primeira = (time.perf_counter() - inicio) * 1000
+
+        def trocar():
+            dash._trocar_conteudo("inicio")
+            dash._trocar_conteudo("extrato")
+            app.update()
+        def atualizar():
+            dash._atualizar_extrato_ui()
+            app.update()
+        troca = medir(trocar, 10) / 1000
+        refresh = medir(atualizar, 10) / 1000
+        print(f"{n:>11} {primeira:>17.1f} {troca:>18.1f} {refresh:>13.1f}")
+        app._fechar()
+
+def bench_publicador(assinantes=(1, 10, 100, 1_000), frequencias=(10, 100, 1_000), duracao=2.0):
+    # Cotações ao vivo: CPU do processo e latência tick -> callback conforme
+    # cresce o número de assinantes e a frequência de ticks
+    motor = MotorPrecos({f"T{i}": 10.0 + i for i in range(50)}, seed=1)
+    fonte = lambda: dict(zip(motor.tickers, motor.avancar().tolist()))
+    print(f"{'assinantes':>10} {'Hz':>6} {'ticks/s':>9} {'CPU %':>7} {'p50 (ms)':>9} {'p99 (ms)':>9} {'coalescidos':>12}")
+    for n in assinantes:
+        for hz in frequencias:
+            latencias = []
+            def receber(snap): latencias.append(time.monotonic() - snap["criado_em"])
+            publicador = PublicadorCotacoes(hz, cache=CacheCotacoes(), fonte=fonte)
+            assinaturas = [publicador.assinar(receber) for _ in range(n)]
+            cpu, inicio = time.process_time(), time.perf_counter()
+            publicador.iniciar()
+            time.sleep(duracao)
+            publicador.parar()
+            wall = time.perf_counter() - inicio
+            cpu = (time.process_time() - cpu) / wall * 100
+            latencias.sort()
+            p50 = latencias[len(latencias) // 2] * 1000 if latencias else 0
+            p99 = latencias[int(len(latencias) * 0.99)] * 1000 if latencias else 0
+            coalescidos = sum(a.coalescidos for a in assinaturas)
+            print(f"{n:>10} {hz:>6} {publicador.ticks / wall:>9,.0f} {cpu:>7.1f} {p50:>9.2f} {p99:>9.2f} {coalescidos:>12,}")
+
+    # Fonte e assinante que falham uma vez não derrubam as cotações seguintes
+    falhas = {"fonte": 1, "assinante": 1}
+    def fonte_instavel():
+        if falhas["fonte"]:
+            falhas["fonte"] -= 1
+            raise RuntimeError("fonte indisponível")
+        return fonte()
+    recebidos = []
+    def instavel(snap):
+        if falhas["assinante"]:
+            falhas["assinante"] -= 1
+            raise RuntimeError("callback com erro")
+        recebidos.append(snap)
+    publicador = PublicadorCotacoes(100, cache=CacheCotacoes(), fonte=fonte_instavel)
+    assinatura = publicador.assinar(instavel)
+    publicador.iniciar()
+    time.sleep(0.5)
+    publicador.parar()
+    assert assinatura.falhas == 1 and len(recebidos) > 1
+
+def gerar_ordens(n, seed=42, participantes=1_000, meio=30.0):
+    # Fluxo sintético: 80% limitadas em torno do meio, 10% a mercado, 10% cancelamentos
+    rng = random.Random(seed)
+    ordens = []
+    for i in range(n):
+        sorte = rng.random()
+        if sorte < 0.1 and i: ordens.append(("cancelar", rng.randrange(1, i + 1)))
+        else:
+            preco = None if sorte < 0.2 else round(meio + rng.gauss(0, 0.5), 2)
+            ordens.append(Ordem(i + 1, rng.randrange(participantes), "PETR4",
+                                rng.choice(("compra", "venda")), rng.randint(1, 10) * 100, preco))
+    return ordens
+
+def bench_livro_ofertas(ordens=500_000, liquidacoes=20_000):
+    # Casamento puro (sem liquidação): ordens/s e latência por ordem.
+    # Depois, o mesmo fluxo liquidando cada negócio no BancoBackend.
+    fluxo = gerar_ordens(ordens)
+    livro, negocios, latencias = LivroOfertas("PETR4"), 0, []
+    inicio = time.perf_counter()
+    for o in fluxo:
+        t = time.perf_counter()
+        if type(o) is tuple: livro.cancelar(o[1])
+        else: negocios += len(livro.submeter(o))
+        latencias.append(time.perf_counter() - t)
+    duracao = time.perf_counter() - inicio
+    latencias.sort()
+    print(f"casamento: {ordens:,} ordens em {duracao:.2f}s ({ordens / duracao:,.0f} ordens/s), {negocios:,} negócios")
+    print(f"latência por ordem: p50 {latencias[len(latencias) // 2] * 1e6:.1f} us | p99 {latencias[int(len(latencias) * 0.99)] * 1e6:.1f} us")
+
+    for fsync in (False, True):
+        usuarios = gerar_usuarios(1_000, saldo=1e9)
+        for u in usuarios: u["investimentos"] = {"PETR4": {"qtd": 1_000_000, "preco_medio": 30.0}}
+        banco = criar_banco(usuarios, fsync=fsync)
+        mesa = MotorOrdens(banco)
+        cpfs = [u["cpf"] for u in usuarios]
+        ids, negocios, inicio = {}, 0, time.perf_counter()
+        for o in gerar_ordens(liquidacoes):
+            if type(o) is tuple:
+                if o[1] in ids: mesa.cancelar("PETR4", ids[o[1]])
+                continue
+            ok, ordem, feitos = mesa.enviar(cpfs[o.cpf], o.ticker, o.lado, o.qtd, o.preco)
+            ids[o.id] = ordem.id
+            negocios += len(feitos)
+        duracao = time.perf_counter() - inicio
+        banco.fechar()
+        print(f"com liquidação (fsync={fsync}): {liquidacoes:,} ordens em {duracao:.2f}s "
+              f"({liquidacoes / duracao:,.0f} ordens/s, {negocios / duracao:,.0f} negócios/s)")
+
+def bench_valorizacao(posicoes=1_000_000, contas=200_000, tickers=500):
+    # Tick sobre 1M posições: motor incremental (todos os tickers mudam / 1% muda)
+    # x reavaliar a carteira de todo mundo a cada tick
+    rng = np.random.default_rng(42)
+    nomes = [f"T{i:04d}" for i in range(tickers)]
+    precos = dict(zip(nomes, rng.uniform(5, 100, tickers).tolist()))
+    motor = MotorValorizacao(precos=precos)
+    carteiras = {}
+    inicio = time.perf_counter()
+    for c, t, q in zip(rng.integers(0, contas, posicoes).tolist(), rng.integers(0, tickers, posicoes).tolist(),
+                       rng.integers(1, 1000, posicoes).tolist()):
+        cpf, ticker = f"{c:011d}", nomes[t]
+        motor.notificar({"op": "investimento", "cpf": cpf, "ticker": ticker, "qtd": q, "preco": precos[ticker], "tipo": "compra"})
+        carteiras.setdefault(cpf, {}).setdefault(ticker, 0)
+        carteiras[cpf][ticker] += q
+    carga = time.perf_counter() - inicio
+
+    def tick(fracao):
+        escolhidos = rng.choice(tickers, max(1, int(tickers * fracao)), replace=False)
+        return {nomes[i]: precos[nomes[i]] * (1 + rng.normal(0, 0.01)) for i in escolhidos}
+    todos = medir(lambda: motor.atualizar_precos(tick(1.0)), 20) / 1000
+    um_porcento = medir(lambda: motor.atualizar_precos(tick(0.01)), 20) / 1000
+    leituras = medir(lambda: (motor.aum("T0001"), motor.resumo("00000000042"), motor.maiores_detentores("T0001")), 1_000)
+
+    def reavaliar():
+        {cpf: sum(q * precos[t] for t, q in pos.items()) for cpf, pos in carteiras.items()}
+    varredura = medir(reavaliar, 3) / 1000
+    print(f"{posicoes:,} posições em {len(carteiras):,} contas (carga {carga:.1f}s)")
+    print(f"tick todos os tickers: {todos:.1f} ms | tick 1% dos tickers: {um_porcento:.1f} ms | varredura completa: {varredura:.0f} ms")
+    print(f"leitura AUM + resumo + top detentores: {leituras:.1f} us")
+
+def bench_modelos(contas=1_000_000, tickers=50, posicoes_por_conta=2, repeticoes=3):
+    # Contas em memória e carga do disco: lista de dicts do json.load(bank_data.json)
+    # x objetos com __slots__ (centavos, tickers internados) vindos do snapshot binário
+    rng = random.Random(42)
+    nomes = [f"T{i:03d}" for i in range(tickers)]
+    usuarios = [{"nome": f"Cliente {i}", "cpf": f"{i:011d}", "senha": "scrypt$16384$8$1$" + "a" * 22 + "$" + "b" * 43,
+                 "saldo": round(rng.uniform(0, 10_000), 2),
+                 "investimentos": {t: {"qtd": rng.randint(1, 500), "preco_medio": round(rng.uniform(5, 100), 2)}
+                                   for t in rng.sample(nomes, posicoes_por_conta)},
+                 "dividendos_recebidos": {f"{nomes[i % tickers]}_15/01/2026": True}}
+                for i in range(contas)]
+    pasta = pasta_temporaria("bankpy_modelos_")
+    arquivo_json, arquivo_bin = os.path.join(pasta, "bank_data.json"), os.path.join(pasta, "bank_data.snapshot.bin")
+    with open(arquivo_json, "w", encoding='utf-8') as f: json.dump(usuarios, f)
+    del usuarios
+    contas_obj = [Conta.de_dict(u) for u in json.load(open(arquivo_json, encoding='utf-8'))]
+    inicio = time.perf_counter()
+    dados = CodecContas.serializar(0, contas_obj)
+    serializar_bin = time.perf_counter() - inicio
+    with open(arquivo_bin, "wb") as f: f.write(dados)
+    inicio = time.perf_counter()
+    json.dumps([c.para_dict() for c in contas_obj])
+    serializar_json = time.perf_counter() - inicio
+    del contas_obj, dados
+
+    def carregar_json():
+        with open(arquivo_json, encoding='utf-8') as f: return json.load(f)
+
+    def carregar_bin():
+        with open(arquivo_bin, "rb") as f: return CodecContas.desserializar(f.read())[1]
+
+    def memoria(carregar):
+        tracemalloc.start()
+        resultado = carregar()
+        atual, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del resultado
+        return atual / 2**20, pico / 2**20
+
+    print(f"{'formato':>10} {'arquivo (MB)':>13} {'carga (s)':>10} {'memória (MB)':>13} {'pico (MB)':>10}")
+    for nome, caminho, carregar in (("json", arquivo_json, carregar_json), ("binário", arquivo_bin, carregar_bin)):
+        carga = medir(carregar, repeticoes) / 1e6
+        atual, pico = memoria(carregar)
+        print(f"{nome:>10} {os.path.getsize(caminho) / 2**20:>13.1f} {carga:>10.2f} {atual:>13.0f} {pico:>10.0f}")
+    print(f"serialização de {contas:,} contas: json {serializar_json:.2f}s | binário {serializar_bin:.2f}s")
+
+def bench_metricas(contas=1_000, repeticoes=20_000):
+    # Custo da instrumentação: chamada vazia decorada e Pix/depósito com as métricas
+    # desligadas x ligadas; no fim, um trecho do dump em formato Prometheus
+    def vazia(): pass
+    medida = Metricas.instrumentar("operacao", op="vazia")(vazia)
+    usuarios = gerar_usuarios(contas)
+    cpfs = [u["cpf"] for u in usuarios]
+    banco = criar_banco(usuarios)
+    rng = random.Random(7)
+    ligadas = Metricas.ativo
+    print(f"{'métricas':>10} {'vazia (ns)':>11} {'pix (us)':>9} {'depósito (us)':>14}")
+    try:
+        for ativo in (False, True):
+            Metricas.ativo = ativo
+            chamada = medir(lambda: [medida() for _ in range(100)], repeticoes // 100) * 10  # ns por chamada
+            pix = medir(lambda: banco.realizar_pix(*rng.sample(cpfs, 2), 0.01), repeticoes)
+            deposito = medir(lambda: banco.deposito_saque(rng.choice(cpfs), 1.0, "Deposito"), repeticoes)
+            print(f"{'ligadas' if ativo else 'desligadas':>10} {chamada:>11.0f} {pix:>9.1f} {deposito:>14.1f}")
+        crua = medir(lambda: [vazia() for _ in range(100)], repeticoes // 100) * 10
+        print(f"{'sem decorador':>10} {crua:>11.0f}")
+        Metricas.ativo = True
+        linhas = banco.metricas().splitlines()
+        print("\n".join(l for l in linhas if 'op="pix"' in l and ("_sum" in l or "_count" in l) or l.startswith(("bankpy_bytes", "bankpy_contas"))))
+
+        # Uma observação acima do maior balde não pode virar Infinity no JSON do /metricas
+        Metricas.observar("operacao", 30.0, op="compactar")
+        servidor = ServidorBanco(banco, ("127.0.0.1", 0))
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        try:
+            conexao = http.client.HTTPConnection(*servidor.server_address)
+            conexao.request("GET", "/metricas?formato=json")
+            resposta = conexao.getresponse()
+            def invalido(c): raise ValueError(f"JSON inválido: {c}")
+            dump = json.loads(resposta.read(), parse_constant=invalido)
+        finally:
+            servidor.shutdown()
+            servidor.server_close()
+        assert resposta.status == 200
+        assert any(h["rotulos"] == {"op": "compactar"} and h["p99_s"] is None for h in dump["histogramas"])
+    finally:
+        Metricas.ativo = ligadas
+        Metricas.zerar()
+        banco.fechar()
+
+def bench_razao(contas=10_000, lancamentos=2_000_000, por_lote=10_000, intervalo_checkpoint=100_000, consultas=200):
+    # Razão em partidas dobradas: custo por Pix, conciliação do banco inteiro (uma
+    # passada) e "saldo em uma data" partindo do checkpoint x refazendo desde o início
+    usuarios = gerar_usuarios(contas)
+    cpfs = [u["cpf"] for u in usuarios]
+    banco = criar_banco(usuarios, intervalo_checkpoint=intervalo_checkpoint)
+    rng = random.Random(7)
+    pix = medir(lambda: banco.realizar_pix(*rng.sample(cpfs, 2), 0.01), 5_000)
+
+    # Um minuto de relógio por lote: datas distintas ao longo do razão
+    relogio = [datetime.now()]
+    banco._get_timestamp = lambda: relogio[0].strftime("%d/%m/%Y %H:%M")
+    datas = []
+    inicio = time.perf_counter()
+    for _ in range(lancamentos // por_lote):
+        relogio[0] += timedelta(minutes=1)
+        datas.append(relogio[0])
+        banco.executar_lote([{"op": "deposito", "cpf": rng.choice(cpfs), "valor": 1.0} for _ in range(por_lote)])
+        banco.compactar()  # checkpoint sai na compactação
+    carga = time.perf_counter() - inicio
+
+    relatorio = banco.conciliar()
+    amostra = [(rng.choice(cpfs), rng.choice(datas)) for _ in range(consultas)]
+    com = medir(lambda: [banco.saldo_em(c, d) for c, d in amostra], 1) / consultas / 1000
+    checkpoints, banco._razao._checkpoints = banco._razao._checkpoints, []
+    sem = medir(lambda: [banco.saldo_em(c, d) for c, d in amostra[:20]], 1) / 20 / 1000
+    banco._razao._checkpoints = checkpoints
+    banco.fechar()
+    total = relatorio["lancamentos"]
+    print(f"pix com razão: {pix:.1f} us | {total:,} lançamentos gravados em {carga:.1f}s ({len(checkpoints)} checkpoints)")
+    print(f"conciliação: {relatorio['segundos']:.2f}s ({total / relatorio['segundos']:,.0f} lançamentos/s) ok={relatorio['ok']}")
+    print(f"saldo em uma data: {com:.2f} ms a partir do checkpoint | {sem:.1f} ms refazendo desde o início")
+    assert relatorio["ok"]
+
+def bench_fragmentos(contas=20_000, operacoes=20_000, fragmentos=(1, 2, 4, 8), fsync=True, repeticoes=2_000):
+    # Vazão do lote executado com um processo por fragmento (depósitos + Pix dentro
+    # do fragmento, um commit durável cada) e latência do Pix no mesmo fragmento x
+    # entre fragmentos (commit em duas fases)
+    usuarios = gerar_usuarios(contas)
+    pasta = pasta_temporaria("bankpy_bench_")
+    arquivo = os.path.join(pasta, "usuarios.json")
+    with open(arquivo, "w", encoding='utf-8') as f: json.dump(usuarios, f)
+    base = None
+    print(f"{os.cpu_count()} CPUs | {operacoes} operações, fsync={fsync}")
+    for n in fragmentos:
+        destino = os.path.join(pasta, f"fragmentos_{n}")
+        banco = BancoFragmentado(destino, n, fsync=False)
+        banco.importar_json(arquivo)
+        grupos = [list(b._contas) for b in banco.fragmentos]
+        banco.fechar()
+        rng = random.Random(n)
+        lote = []
+        for _ in range(operacoes):
+            grupo = rng.choice([g for g in grupos if len(g) > 1])
+            if rng.random() < 0.5: lote.append({"op": "deposito", "cpf": rng.choice(grupo), "valor": 10.0})
+            else:
+                de, para = rng.sample(grupo, 2)
+                lote.append({"op": "pix", "de": de, "para": para, "valor": 1.0})
+        resultado = BancoFragmentado.executar_em_processos(destino, lote, fsync=fsync)
+        vazao = resultado["operacoes_por_segundo"]
+        base = base or vazao
+        print(f"{n} fragmento(s): {vazao:,.0f} ops/s ({vazao / base:.2f}x) em {resultado['segundos']:.2f}s")
+        assert not resultado["entre_fragmentos"] and resultado["aplicadas"] == operacoes
+
+    # Latência no banco com mais fragmentos entre os medidos
+    n = max(fragmentos)
+    banco = BancoFragmentado(os.path.join(pasta, f"fragmentos_{n}"), n, fsync=fsync)
+    grupos = [g for g in (list(b._contas) for b in banco.fragmentos) if len(g) > 1]
+    rng = random.Random(n)
+    mesmo = medir(lambda: banco.realizar_pix(*rng.sample(rng.choice(grupos), 2), 0.01), repeticoes)
+    linha = f"pix no mesmo fragmento: {mesmo:.1f} us"
+    if len(grupos) > 1:
+        entre = medir(lambda: banco.realizar_pix(*(rng.choice(g) for g in rng.sample(grupos, 2)), 0.01), repeticoes)
+        linha += f" | entre fragmentos (2 fases): {entre:.1f} us"
+    relatorio = banco.conciliar()
+    banco.fechar()
+    print(linha)
+    assert relatorio["ok"]
+
+def gerar_csv_cadastros(caminho, n, seed=42, invalidos=0.05, duplicados=0.02):
+    # Base migrada: CPFs formatados, uma fração com dígito errado e outra repetida
+    rng = random.Random(seed)
+    anteriores = []
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write("nome,cpf,senha\n")
+        for i in range(n):
+            sorte = rng.random()
+            if sorte < duplicados and anteriores: cpf = rng.choice(anteriores)
+            else:
+                cpf = gerar_cpf(rng)
+                if sorte > 1 - invalidos: cpf = cpf[:10] + str((int(cpf[10]) + 1) % 10)
+                anteriores.append(cpf)
+            f.write(f"Cliente {i},{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]},senha{i}\n")
+
+def bench_importacao(linhas=1_000_000, individuais=20_000):
+    # Importação em massa do CSV x cadastrar() conta a conta; e a validação
+    # vetorizada de CPF x a escalar
+    pasta = pasta_temporaria("bankpy_import_")
+    arquivo = os.path.join(pasta, "clientes.csv")
+    gerar_csv_cadastros(arquivo, linhas)
+
+    banco = criar_banco(gerar_usuarios(1_000), fsync=True)
+    # Sem o KDF: aqui interessa a vazão da carga (o custo do scrypt está no cenário login)
+    relatorio = banco.importar_csv(arquivo, hash_senhas=False)
+    banco.fechar()
+    print(f"importar_csv: {relatorio['lidas']:,} linhas em {relatorio['segundos']:.1f}s ({relatorio['contas_por_segundo']:,.0f} linhas/s) | "
+          f"importadas {relatorio['importadas']:,} | inválidas {len(relatorio['invalidas']):,} | duplicadas {len(relatorio['duplicadas']):,}")
+
+    with open(arquivo, encoding="utf-8") as f:
+        next(f)
+        amostra = [linha.rstrip("\n").split(",") for _, linha in zip(range(individuais), f)]
+    banco = criar_banco(gerar_usuarios(1_000), fsync=True)
+    inicio = time.perf_counter()
+    for nome, cpf, senha in amostra: banco.cadastrar(nome, cpf, senha)
+    individual = time.perf_counter() - inicio
+    banco.fechar()
+    print(f"cadastrar() um a um: {individuais / individual:,.0f} linhas/s")
+
+    cpfs = [banco._limpar_cpf(cpf) for _, cpf, _ in amostra]
+    escalar = medir(lambda: [banco._validar_cpf_real(c) for c in cpfs], 5)
+    vetorizada = medir(lambda: banco._validar_cpfs(cpfs), 5)
+    print(f"validação de {individuais:,} CPFs: escalar {escalar / 1000:.1f} ms | vetorizada {vetorizada / 1000:.1f} ms")
+
+def bench_login(concorrencias=(1, 8, 32, 128), tentativas=256):
+    # N logins simultâneos: primeiro acesso (scrypt + migração do texto puro),
+    # repetido (cache de verificação) e operação autenticada por token de sessão
+    print(f"{'simultâneos':>11} {'frio/s':>8} {'p99 frio (ms)':>14} {'cache/s':>10} {'p99 cache (ms)':>15} {'sessão/s':>10}")
+    for n in concorrencias:
+        usuarios = gerar_usuarios(tentativas)
+        banco = criar_banco(usuarios)
+        cpfs = [u["cpf"] for u in usuarios]
+        linhas = []
+        for rodada in range(2):
+            latencias = []
+            def entrar(cpf):
+                inicio = time.perf_counter()
+                ok = banco.login(cpf, "senha")[0]
+                latencias.append(time.perf_counter() - inicio)
+                return ok
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(n) as pool: assert all(pool.map(entrar, cpfs))
+            duracao = time.perf_counter() - inicio
+            latencias.sort()
+            linhas.append((tentativas / duracao, latencias[int(len(latencias) * 0.99)] * 1000))
+        token = banco.abrir_sessao(cpfs[0], "senha")[1]
+        sessao = 1e6 / medir(lambda: banco.sessao(token), 10_000)
+        banco.fechar()
+        (frio, p99_frio), (cache, p99_cache) = linhas
+        print(f"{n:>11} {frio:>8,.0f} {p99_frio:>14.1f} {cache:>10,.0f} {p99_cache:>15.2f} {sessao:>10,.0f}")
+
+def bench_latencia_ui(operacoes=100_000, quadro_ms=16, limite_p99_ms=100):
+    # Responsividade do loop do Tk durante trabalho pesado no backend (lote grande +
+    # compactação): intervalo entre quadros com a chamada síncrona no handler x pelo
+    # ExecutorComandos. Pelo executor o p99 tem que ficar abaixo de limite_p99_ms e
+    # abaixo do síncrono. Precisa de display.
+    import tkinter
+    from banco import ExecutorComandos
+    try:
+        raiz = tkinter.Tk()
+    except tkinter.TclError:
+        print("sem display disponível: cenário ignorado")
+        return
+    usuarios = gerar_usuarios(1_000)
+    banco = criar_banco(usuarios, fsync=True)
+    folha = [{"op": "deposito", "cpf": usuarios[i % 1_000]["cpf"], "valor": 1.0} for i in range(operacoes)]
+    def trabalho():
+        banco.executar_lote(folha)
+        banco.compactar()
+    comandos = ExecutorComandos(raiz, banco)
+
+    print(f"{'modo':>10} {'quadros':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'máx (ms)':>9}")
+    p99 = {}
+    for modo in ("sincrono", "executor"):
+        intervalos, estado = [], {"fim": False, "ultimo": time.perf_counter()}
+        def quadro():
+            agora = time.perf_counter()
+            intervalos.append((agora - estado["ultimo"]) * 1000)
+            estado["ultimo"] = agora
+            if not estado["fim"]: raiz.after(quadro_ms, quadro)
+        def encerrar():
+            estado["fim"] = True
+            raiz.quit()
+        def concluir(_=None): raiz.after(200, encerrar)
+        def iniciar():
+            if modo == "sincrono":
+                trabalho()
+                concluir()
+            else: comandos.executar("trabalho", trabalho, ao_concluir=concluir)
+        raiz.after(quadro_ms, quadro)
+        raiz.after(100, iniciar)
+        raiz.mainloop()
+        intervalos.sort()
+        p99[modo] = intervalos[int(len(intervalos) * 0.99)]
+        print(f"{modo:>10} {len(intervalos):>8} {intervalos[len(intervalos) // 2]:>9.1f} "
+              f"{p99[modo]:>9.1f} {intervalos[-1]:>9.1f}")
+    raiz.destroy()
+    banco.fechar()
+    assert p99["executor"] < limite_p99_ms, f"p99 pelo executor {p99['executor']:.1f} ms (limite {limite_p99_ms} ms)"
+    assert p99["executor"] < p99["sincrono"]
+
+def gerar_carga(host, porta, cpfs, clientes=16, duracao=5.0, senha="senha", seed=42):
+    # Cada cliente abre uma conexão keep-alive, faz login com a sua conta e dispara
+    # uma mistura de rotas até o fim do tempo. Devolve {rota: [latências em s]}.
+    mistura = [("GET /conta", 30), ("GET /extrato", 20), ("POST /deposito", 20),
+               ("POST /pix", 15), ("POST /ordem", 10), ("GET /cotacoes", 5)]
+    rotas, pesos = zip(*mistura)
+    latencias = {rota: [] for rota in ("POST /login",) + rotas}
+
+    def cliente(i):
+        rng = random.Random(seed + i)
+        conexao = http.client.HTTPConnection(host, porta)
+        cabecalhos = {"Content-Type": "application/json"}
+        def pedir(rota, corpo=None):
+            metodo, caminho = rota.split(" ")
+            if rota == "GET /extrato": caminho += "?limite=20"
+            inicio = time.perf_counter()
+            conexao.request(metodo, caminho, body=json.dumps(corpo) if corpo is not None else None, headers=cabecalhos)
+            resposta = conexao.getresponse()
+            dados = json.loads(resposta.read())
+            latencias[rota].append(time.perf_counter() - inicio)
+            return resposta.status, dados
+        status, dados = pedir("POST /login", {"cpf": cpfs[i], "senha": senha})
+        assert status == 200, dados
+        cabecalhos["Authorization"] = "Bearer " + dados["token"]
+        fim = time.perf_counter() + duracao
+        while time.perf_counter() < fim:
+            rota = rng.choices(rotas, pesos)[0]
+            corpo = None
+            if rota == "POST /deposito": corpo = {"valor": 10}
+            elif rota == "POST /pix": corpo = {"para": rng.choice(cpfs), "valor": 1}
+            elif rota == "POST /ordem": corpo = {"ticker": "PETR4", "qtd": 1, "tipo": "compra"}
+            pedir(rota, corpo)
+        conexao.close()
+
+    with ThreadPoolExecutor(clientes) as pool: list(pool.map(cliente, range(clientes)))
+    return latencias
+
+def bench_servidor(clientes=(1, 16, 64), duracao=5.0, contas=1_000):
+    # Sobe "banco.py --servidor" num processo próprio (dono do estado) e mede
+    # requisições/s e p50/p99 por rota com o gerador de carga
+    usuarios = gerar_usuarios(contas, saldo=1e6)
+    pasta = pasta_temporaria("bankpy_servidor_")
+    arquivo = os.path.join(pasta, "bank_data.json")
+    with open(arquivo, "w", encoding='utf-8') as f: json.dump(usuarios, f)
+    processo = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "banco.py"),
+                                 "--servidor", "--porta", "0", "--arquivo", arquivo], stdout=subprocess.PIPE, text=True)
+    try:
+        porta = int(processo.stdout.readline().rsplit(":", 1)[1])
+        cpfs = [u["cpf"] for u in usuarios]
+        for n in clientes:
+            latencias = gerar_carga("127.0.0.1", porta, cpfs, n, duracao)
+            total = sum(len(v) for rota, v in latencias.items() if rota != "POST /login")
+            print(f"\n{n} clientes: {total / duracao:,.0f} req/s")
+            print(f"{'rota':>16} {'req':>8} {'req/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+            for rota, v in latencias.items():
+                if not v: continue
+                v.sort()
+                print(f"{rota:>16} {len(v):>8,} {len(v) / duracao:>8,.0f} {v[len(v) // 2] * 1000:>9.2f} {v[int(len(v) * 0.99)] * 1000:>9.2f}")
+    finally:
+        processo.send_signal(signal.SIGINT)
+        processo.wait()
+
+# --- Suíte reprodutível (resultados em JSON para comparar versões) ---
+# Cada cenário recebe (banco, cpfs, rng, repeticoes) e devolve as latências (s) de
+# cada chamada. Tudo deriva da seed: banco sintético, sorteios e motor de preços.
+def suite_login(banco, cpfs, rng, repeticoes):
+    # Login repetido (KDF em cache) numa amostra já aquecida
+    amostra = rng.sample(cpfs, min(20, len(cpfs)))
+    for cpf in amostra: banco.login(cpf, "senha")
+    return amostrar(lambda: banco.login(rng.choice(amostra), "senha"), repeticoes)
+
+def suite_login_frio(banco, cpfs, rng, repeticoes):
+    # Primeiro login da conta: o custo é o scrypt (poucas repetições)
+    frios = iter(rng.sample(cpfs[20:] or cpfs, min(10, len(cpfs))))
+    return amostrar(lambda: banco.login(next(frios), "senha"), min(10, len(cpfs)))
+
+def suite_deposito(banco, cpfs, rng, repeticoes):
+    return amostrar(lambda: banco.deposito_saque(rng.choice(cpfs), 10.0, "Deposito"), repeticoes)
+
+def suite_pix(banco, cpfs, rng, repeticoes):
+    return amostrar(lambda: banco.realizar_pix(*rng.sample(cpfs, 2), 1.0), repeticoes)
+
+def suite_compra_venda(banco, cpfs, rng, repeticoes):
+    # Compra e vende o mesmo lote (carteiras e saldos voltam ao ponto de partida)
+    tickers = sorted(MarketAPI.EMPRESAS)
+    estado = {}
+    def operar():
+        if estado:
+            banco.investir(estado["cpf"], estado["ticker"], 10, estado["preco"], "venda")
+            estado.clear()
+        else:
+            ticker = rng.choice(tickers)
+            estado.update(cpf=rng.choice(cpfs), ticker=ticker, preco=MarketAPI.EMPRESAS[ticker]["preco_base"])
+            banco.investir(estado["cpf"], ticker, 10, estado["preco"], "compra")
+    return amostrar(operar, repeticoes)
+
+def suite_dividendos(banco, cpfs, rng, repeticoes):
+    # Job do banco inteiro; idempotente, então só a primeira execução paga alguém
+    return amostrar(banco.pagar_dividendos, 1)
+
+def suite_extrato(banco, cpfs, rng, repeticoes):
+    # Abrir o extrato: primeira tela (30 linhas) buscada e formatada como na UI
+    def abrir():
+        fonte = FonteExtrato(banco, rng.choice(cpfs))
+        [f"{item['tipo']} {item['data']} R$ {abs(item['valor']):.2f}" for item in (fonte[i] for i in range(min(30, len(fonte))))]
+    return amostrar(abrir, repeticoes)
+
+def suite_cotacoes(banco, cpfs, rng, repeticoes):
+    # Tick do MarketAPI (motor de preços + montagem das cotações)
+    return amostrar(MarketAPI.get_prices, repeticoes)
+
+SUITE = {
+    "login": suite_login,
+    "login_frio": suite_login_frio,
+    "deposito": suite_deposito,
+    "pix": suite_pix,
+    "compra_venda": suite_compra_venda,
+    "dividendos": suite_dividendos,
+    "extrato": suite_extrato,
+    "cotacoes": suite_cotacoes,
+}
+
+def amostrar(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+def versao_codigo():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def rodar_suite(escalas=(1_000, 10_000, 100_000), transacoes=10, seed=42, repeticoes=1_000, cenarios=None, saida=None):
+    # Roda os cenários da SUITE em cada escala (nº de contas) e grava o JSON de resultados
+    cenarios = cenarios or list(SUITE)
+    resultados = []
+    print(f"{'escala':>8} {'cenário':>13} {'n':>6} {'p50 (us)':>10} {'p99 (us)':>10} {'ops/s':>10}")
+    for escala in escalas:
+        random.seed(seed)
+        MarketAPI.configurar_motor(seed=seed)
+        usuarios = gerar_banco_sintetico(escala, transacoes, seed)
+        cpfs = [u["cpf"] for u in usuarios]
+        inicio = time.perf_counter()
+        banco = criar_banco(usuarios)
+        carga = time.perf_counter() - inicio
+        del usuarios
+        resultados.append({"cenario": "carga", "escala": escala, "n": 1, "p50_us": carga * 1e6, "p99_us": carga * 1e6,
+                           "media_us": carga * 1e6, "ops_s": escala / carga})
+        try:
+            for i, nome in enumerate(cenarios):
+                tempos = sorted(SUITE[nome](banco, cpfs, random.Random(seed + i), repeticoes))
+                media = statistics.fmean(tempos)
+                linha = {"cenario": nome, "escala": escala, "n": len(tempos), "p50_us": tempos[len(tempos) // 2] * 1e6,
+                         "p99_us": tempos[min(len(tempos) - 1, int(len(tempos) * 0.99))] * 1e6, "media_us": media * 1e6,
+                         "ops_s": 1 / media if media else 0.0}
+                resultados.append(linha)
+                print(f"{escala:>8} {nome:>13} {linha['n']:>6} {linha['p50_us']:>10.1f} {linha['p99_us']:>10.1f} {linha['ops_s']:>10,.0f}")
+        finally:
+            banco.fechar()
+            limpar_pastas()
+    relatorio = {
+        "meta": {"versao": versao_codigo(), "data": datetime.now().isoformat(timespec="seconds"), "seed": seed,
+                 "escalas": list(escalas), "transacoes_por_conta": transacoes, "repeticoes": repeticoes,
+                 "python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count()},
+        "resultados": resultados
+    }
+    if saida:
+        with open(saida, "w", encoding='utf-8') as f: json.dump(relatorio, f, indent=2, ensure_ascii=False)
+        print(f"resultados gravados em {saida}")
+    return relatorio
+
+def comparar_resultados(base, novo, tolerancia=0.10):
+    # Compara dois JSON da suíte pelo p50; devolve as regressões acima da tolerância
+    def carregar(caminho):
+        with open(caminho, encoding='utf-8') as f: dados = json.load(f)
+        return dados["meta"], {(r["cenario"], r["escala"]): r for r in dados["resultados"]}
+    meta_base, antes = carregar(base)
+    meta_novo, depois = carregar(novo)
+    print(f"base: {meta_base['versao']} ({meta_base['data']}) | novo: {meta_novo['versao']} ({meta_novo['data']})")
+    print(f"{'escala':>8} {'cenário':>13} {'p50 base':>10} {'p50 novo':>10} {'variação':>9}")
+    regressoes = []
+    for chave in sorted(antes.keys() & depois.keys(), key=lambda c: (c[1], c[0])):
+        a, d = antes[chave]["p50_us"], depois[chave]["p50_us"]
+        variacao = (d - a) / a if a else 0.0
+        marca = ""
+        if variacao > tolerancia:
+            regressoes.append((chave, variacao))
+            marca = "  <- regressão"
+        print(f"{chave[1]:>8} {chave[0]:>13} {a:>10.1f} {d:>10.1f} {variacao:>+9.1%}{marca}")
+    return regressoes
+
+CENARIOS = {
+    "indice_cpf": bench_indice_cpf,
+    "stress_pix": stress_pix_concorrente,
+    "lote": bench_lote,
+    "motor_precos": bench_motor_precos,
+    "historico": bench_historico,
+    "dividendos": bench_dividendos,
+    "dashboard_ui": bench_dashboard_ui,
+    "publicador": bench_publicador,
+    "livro_ofertas": bench_livro_ofertas,
+    "valorizacao": bench_valorizacao,
+    "modelos": bench_modelos,
+    "importacao": bench_importacao,
+    "login": bench_login,
+    "latencia_ui": bench_latencia_ui,
+    "servidor": bench_servidor,
+    "metricas": bench_metricas,
+    "razao": bench_razao,
+    "fragmentos": bench_fragmentos,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks do BankPY")
+    parser.add_argument("cenarios", nargs="*", help=f"cenários avulsos: {', '.join(CENARIOS)}")
+    parser.add_argument("--suite", action="store_true", help="roda a suíte reprodutível em várias escalas")
+    parser.add_argument("--escalas", default="1000,10000,100000", help="nº de contas, separados por vírgula")
+    parser.add_argument("--transacoes", type=int, default=10, help="lançamentos de extrato por conta")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeticoes", type=int, default=1_000)
+    parser.add_argument("--saida", help="arquivo JSON com os resultados da suíte")
+    parser.add_argument("--comparar", nargs=2, metavar=("BASE", "NOVO"), help="compara dois JSON da suíte")
+    parser.add_argument("--tolerancia", type=float, default=0.10, help="piora de p50 aceita no --comparar")
+    args = parser.parse_args()
+    if args.comparar:
+        sys.exit(1 if comparar_resultados(*args.comparar, args.tolerancia) else 0)
+    if args.suite:
+        rodar_suite([int(e) for e in args.escalas.split(",")], args.transacoes, args.seed, args.repeticoes,
+                    args.cenarios or None, args.saida)
+    else:
+        for nome in args.cenarios or list(CENARIOS):
+            print(f"\n== {nome} ==")
+            try:
+                CENARIOS[nome]()
+            finally:
+                limpar_pastas()